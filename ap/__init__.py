@@ -1,3 +1,4 @@
 from .utilz import *
 from .deposit_approval import *
-from .dynamic_text_conversation import dynamic_text_handler
\ No newline at end of file
+from .dynamic_text_conversation import dynamic_text_handler
+from .db_stats import db_stats_handler
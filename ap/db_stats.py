@@ -0,0 +1,37 @@
+from telegram import Update
+from telegram.ext import CommandHandler, ContextTypes
+
+from common.database import DataBase
+
+# سقف طول پیام تلگرام
+MAX_MESSAGE_LENGTH = 4096
+
+
+async def db_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    نمایش آمار تاخیر پرس‌وجوها (p50/p95/p99)، انتظار برای Pool و کندترین دستورها برای ادمین/مالک.
+    """
+    db: DataBase = context.bot_data["db"]
+    if await db.get_role(update.effective_user.id) not in ("admin", "owner"):
+        return
+
+    text = db.metrics.render_text()
+    pool = db.pool_status()
+    if pool is not None:
+        text = (
+            f"pool: {pool['size']}/{pool['max']} open, {pool['idle']} idle, {pool['waiting']} waiting "
+            f"(opened {pool['opened']}, closed {pool['discarded']})\n" + text
+        )
+    if db.replicas:
+        lines = [
+            f"{r['name']}: lag {r['lag_s']}s" + (f" ({r['error']})" if r["error"] else "")
+            for r in db.replicas.status()
+        ]
+        text = "replicas:\n" + "\n".join(lines) + "\n\n" + text
+    if len(text) > MAX_MESSAGE_LENGTH:
+        text = text[:MAX_MESSAGE_LENGTH - 3] + "..."
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+
+def db_stats_handler():
+    return CommandHandler("dbstats", db_stats)
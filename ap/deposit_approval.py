@@ -27,14 +27,14 @@ async def deposit_approval(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # چک می‌کنیم که کاربر ادمین یا مالک باشد
     user_id = update.effective_user.id
-    if not (await db.is_admin(user_id) or await db.is_owner(user_id)):
+    if await db.get_role(user_id) not in ("admin", "owner"):
         return ConversationHandler.END
 
     context.user_data.clear()
     context.user_data["deposit_approval"] = True
 
     # خواندن اولین واریز با وضعیت 'pending'
-    pending_list = await db.fetch_data("payment", conditions={"status": "pending"})
+    pending_list = await db.fetch_data("payment", conditions={"status": "pending"}, order_by="id", limit=1)
     if not pending_list:
         text = "هیچ واریزی یافت نشد."
         reply_markup = create_admin_panel()
@@ -33,11 +33,9 @@ async def dynamic_text_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
     نمایش گزینه‌های تغییر متن برای ادمین/مالک.
     """
     db = context.bot_data["db"]
-    from common.database import User
-    user_model = User(db)
 
     user_id = update.effective_user.id
-    if not (await user_model.is_admin(user_id) or await user_model.is_owner(user_id)):
+    if await db.get_role(user_id) not in ("admin", "owner"):
         return ConversationHandler.END
 
     context.user_data.clear()
@@ -0,0 +1,109 @@
+from common.database import DataBase, User, Order, AdvanceOrder, Position, AdvancePosition
+
+
+class LegacyMatcher:
+    """
+    The original nested-loop matcher (full table rescan after every accepted
+    order, one round trip per step), kept only as a baseline for benchmarks.
+    """
+
+    def __init__(self, db: DataBase):
+        self.db = db
+
+    async def make_position(self) -> int:
+        return await self._match_simple_orders() + await self._match_advance_orders()
+
+    async def _match_simple_orders(self) -> int:
+        all_orders = await self.db.fetch_data("orders")
+        created = 0
+        for i, base_order in enumerate(all_orders):
+            for compared_order in all_orders[i + 1:]:
+                if all([
+                    base_order["trader_id"] != compared_order["trader_id"],
+                    base_order["trade_type"] != compared_order["trade_type"],
+                    base_order["order_price"] == compared_order["order_price"],
+                    base_order["expiration_date"] == compared_order["expiration_date"],
+                    base_order["order_amount"] - base_order["volume_filled"] > 0,
+                    compared_order["order_amount"] - compared_order["volume_filled"] > 0,
+                    base_order["expiration_order_time"] > compared_order["date"],
+                ]):
+                    if base_order["trade_type"] == 1:
+                        buyer, seller = base_order, compared_order
+                    else:
+                        buyer, seller = compared_order, base_order
+                    position = Position(
+                        self.db,
+                        seller_id=seller["trader_id"],
+                        buyer_id=buyer["trader_id"],
+                        open_price=buyer["order_price"],
+                        position_amount=min(
+                            buyer["order_amount"] - buyer["volume_filled"],
+                            seller["order_amount"] - seller["volume_filled"],
+                        ),
+                        expiration_date=buyer["expiration_date"],
+                    )
+                    created_position = await position.add_record()
+                    await self._fill(Order, buyer, seller, created_position["position_amount"])
+                    await self._after_fill(seller["trader_id"], buyer["trader_id"])
+                    created += 1
+        return created
+
+    async def _match_advance_orders(self) -> int:
+        all_orders = await self.db.fetch_data("advance_orders")
+        created = 0
+        for i, base_order in enumerate(all_orders):
+            for compared_order in all_orders[i + 1:]:
+                if all([
+                    (base_order["seller_id"] is not None and compared_order["buyer_id"] is not None)
+                    or (base_order["buyer_id"] is not None and compared_order["seller_id"] is not None),
+                    base_order["seller_id"] != compared_order["buyer_id"]
+                    or base_order["buyer_id"] != compared_order["seller_id"],
+                    base_order["open_price"] == compared_order["open_price"],
+                    base_order["close_price"] == compared_order["close_price"],
+                    base_order["expiration_date"] == compared_order["expiration_date"],
+                    base_order["order_amount"] - base_order["volume_filled"] > 0,
+                    compared_order["order_amount"] - compared_order["volume_filled"] > 0,
+                    base_order["expiration_order_time"] > compared_order["date"],
+                ]):
+                    if base_order["buyer_id"] is not None:
+                        buyer, seller = base_order, compared_order
+                    else:
+                        buyer, seller = compared_order, base_order
+                    position = AdvancePosition(
+                        self.db,
+                        seller_id=seller["seller_id"],
+                        buyer_id=buyer["buyer_id"],
+                        open_price=buyer["open_price"],
+                        close_price=seller["close_price"],
+                        position_amount=min(
+                            buyer["order_amount"] - buyer["volume_filled"],
+                            seller["order_amount"] - seller["volume_filled"],
+                        ),
+                        expiration_date=buyer["expiration_date"],
+                    )
+                    created_position = await position.add_record()
+                    await self._fill(AdvanceOrder, buyer, seller, created_position["position_amount"])
+                    await self._after_fill(seller["seller_id"], buyer["buyer_id"])
+                    created += 1
+        return created
+
+    async def _fill(self, model, buyer, seller, position_amount: int):
+        for order in (buyer, seller):
+            await model(self.db, volume_filled=order["volume_filled"] + position_amount).update_record(
+                {"id": order["id"]}
+            )
+
+    async def _after_fill(self, seller_id: int, buyer_id: int):
+        for trader_id in (seller_id, buyer_id):
+            sell_positions = await Position(self.db).fetch_data({"seller_id": trader_id})
+            buy_positions = await Position(self.db).fetch_data({"buyer_id": trader_id})
+            reduction_pack = min(
+                sum(p["position_amount"] for p in sell_positions),
+                sum(p["position_amount"] for p in buy_positions),
+            )
+            trader = User(self.db)
+            trader_info = (await trader.fetch_data({"trader_id": trader_id}))[0]
+            trader.frozen_pack = max(0, trader_info["frozen_pack"] - reduction_pack)
+            await trader.update_record({"trader_id": trader_id})
+        for trader_id in (seller_id, buyer_id):
+            await User(self.db).get_name(trader_id)
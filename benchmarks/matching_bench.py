@@ -0,0 +1,181 @@
+"""
+Matching engine benchmark.
+
+Runs a synthetic order stream through SetOrder plus a matching engine on top
+of the in-memory DataBase (common.memory_backend) and reports throughput,
+latency, and the positions and filled volume each engine produced.
+
+On the default mixed flow the legacy engine opens more positions than the book:
+its rescan keeps each order's volume_filled from the start of the scan, so an
+order that crosses several counterparts is filled past its amount. --check
+instead runs a flow of crossing pairs, where every order crosses exactly one
+counterpart, and fails unless all engines produce the same fills.
+
+    python -m benchmarks.matching_bench --size 2000 --engines legacy,book --json bench.json
+    python -m benchmarks.matching_bench --size 2000 --check
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+
+from prettytable import PrettyTable
+
+import common.config as config
+from program import Program, SetOrder
+from common.database import User
+from common.memory_backend import InMemoryDataBase
+from .legacy import LegacyMatcher
+from .order_flow import generate_crossing_pairs, generate_order_flow, make_update
+
+
+def set_market(open_day_price: int):
+    config.OPEN_DAY_PRICE = open_day_price
+    config.CURRENT_PRICE = open_day_price
+    config.BASE_PRICE = str(open_day_price)[0:2]
+    config.PRICE_UPPER_BOUND = open_day_price + config.PRICE_BOUND_RATE
+    config.PRICE_LOWER_BOUND = open_day_price - config.PRICE_BOUND_RATE
+    # no journal/snapshot files for benchmark runs
+    config.BOOK_JOURNAL_DIR = ""
+
+
+async def seed_traders(db, trader_ids, trade_pack: int = 10 ** 6):
+    for trader_id in trader_ids:
+        await User(
+            db,
+            trader_id=trader_id,
+            access_level=1,
+            username=f"trader{trader_id}",
+            margin=0,
+            referral_code=f"ref{trader_id}",
+            children=0,
+            frozen_pack=0,
+            trade_pack=trade_pack,
+        ).add_record()
+
+
+async def legacy_engine(db):
+    set_order = SetOrder(db)
+    matcher = LegacyMatcher(db)
+
+    async def handle(update):
+        commands = await set_order.set_order(update)
+        if commands[0]["status"]:
+            await matcher.make_position()
+
+    return handle, None
+
+
+async def book_engine(db):
+    program = Program(db)
+    await program.start()
+
+    async def handle(update):
+        await program.handle_message(update, None)
+
+    return handle, program.close
+
+
+# engine name -> factory returning (handle(update), close)
+ENGINES = {
+    "legacy": legacy_engine,
+    "book": book_engine,
+}
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_engine(name: str, messages: list[dict], db=None) -> dict:
+    db = db or InMemoryDataBase()
+    await seed_traders(db, sorted({m["trader_id"] for m in messages}))
+    handle, close = await ENGINES[name](db)
+    messages_by_id = {m["message_id"]: m for m in messages}
+
+    latencies = []
+    started = time.perf_counter()
+    for message in messages:
+        update = make_update(message, messages_by_id)
+        t0 = time.perf_counter()
+        await handle(update)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    if close is not None:
+        await close()
+    positions = await db.fetch_data("positions") + await db.fetch_data("advance_positions")
+    await db.close_pool()
+
+    latencies.sort()
+    fills = sorted(
+        (p["buyer_id"], p["seller_id"], p["open_price"], p.get("close_price"), p["position_amount"]) for p in positions
+    )
+    return {
+        "engine": name,
+        "messages": len(messages),
+        "seconds": round(elapsed, 4),
+        "orders_per_second": round(len(messages) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "positions": len(positions),
+        "filled": sum(p["position_amount"] for p in positions),
+        "fills_digest": hashlib.sha256(json.dumps(fills).encode("utf-8")).hexdigest()[:16],
+    }
+
+
+def print_results(results: list[dict]):
+    table = PrettyTable()
+    table.field_names = ["engine", "messages", "orders/s", "p50 ms", "p95 ms", "p99 ms", "positions", "filled", "fills"]
+    for r in results:
+        table.add_row([
+            r["engine"], r["messages"], r["orders_per_second"],
+            r["p50_ms"], r["p95_ms"], r["p99_ms"], r["positions"], r["filled"], r["fills_digest"],
+        ])
+    print(table)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Matching engine benchmark")
+    parser.add_argument("--size", type=int, default=1000, help="number of group messages")
+    parser.add_argument("--traders", type=int, default=50)
+    parser.add_argument("--spread", type=int, default=20, help="price spread around the open price")
+    parser.add_argument("--open-price", type=int, default=60000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--engines", default="legacy,book", help=f"comma separated: {', '.join(ENGINES)}")
+    parser.add_argument("--check", action="store_true", help="run crossing pairs and require identical fills")
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    set_market(args.open_price)
+    if args.check:
+        messages = generate_crossing_pairs(
+            args.size // 2, traders=args.traders, open_day_price=args.open_price, spread=args.spread, seed=args.seed
+        )
+    else:
+        messages = generate_order_flow(
+            args.size, traders=args.traders, open_day_price=args.open_price, spread=args.spread, seed=args.seed
+        )
+
+    results = []
+    for name in args.engines.split(","):
+        results.append(await run_engine(name.strip(), messages))
+    print_results(results)
+
+    equivalent = len({(r["positions"], r["filled"], r["fills_digest"]) for r in results}) == 1
+    if args.check and not equivalent:
+        print("engines disagree on a flow every engine should fill identically")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "equivalent": equivalent, "results": results}, f, indent=2)
+    if args.check and not equivalent:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+import random
+from types import SimpleNamespace
+
+SIMPLE_TYPES = ("خ", "ف")
+TOMORROW_TYPES = ("خف", "فف")
+ADVANCE_TYPES = ("خپ", "خب", "فپ", "فب", "فمع", "خمع", "خش", "فش")
+
+
+def generate_order_flow(
+    size: int,
+    traders: int = 50,
+    open_day_price: int = 60000,
+    spread: int = 20,
+    mix: dict | None = None,
+    seed: int = 1,
+) -> list[dict]:
+    """
+    Build a synthetic stream of group messages using the grammars accepted by
+    SetOrder.set_order: simple orders, tomorrow-contract orders (`خف`/`فف`,
+    accepted only between 11:30 and 12:30), advance (range) orders, `ب`
+    replies and `ن` cancels. Each message is a plain dict:
+    {"message_id", "trader_id", "text", "reply_to"} where reply_to is the
+    message_id of the replied message or None.
+    """
+    mix = mix or {"simple": 0.5, "tomorrow": 0.05, "advance": 0.2, "reply": 0.15, "cancel": 0.1}
+    rng = random.Random(seed)
+    trader_ids = [1000 + i for i in range(traders)]
+    base_price = str(open_day_price)[0:2]
+
+    messages = []
+    order_messages = []
+    kinds, weights = zip(*mix.items())
+    for message_id in range(1, size + 1):
+        trader_id = rng.choice(trader_ids)
+        kind = rng.choices(kinds, weights)[0]
+        if kind in ("reply", "cancel") and not order_messages:
+            kind = "simple"
+        reply_to = None
+
+        if kind == "simple":
+            price = open_day_price + rng.randint(-spread, spread)
+            price_text = str(price)
+            if price_text.startswith(base_price) and rng.random() < 0.5:
+                # three-digit shorthand price
+                price_text = price_text[len(base_price):]
+            text = f"{price_text}{rng.choice(SIMPLE_TYPES)}{rng.randint(1, 5)}"
+        elif kind == "tomorrow":
+            price = open_day_price + rng.randint(-spread, spread)
+            text = f"{price}{rng.choice(TOMORROW_TYPES)}{rng.randint(1, 5)}"
+        elif kind == "advance":
+            open_price = open_day_price + rng.randint(-spread, spread)
+            close_price = open_price + rng.randint(0, spread // 2)
+            text = f"{open_price}ب{close_price}{rng.choice(ADVANCE_TYPES)}{rng.randint(1, 3)}"
+        elif kind == "reply":
+            original = rng.choice(order_messages[-200:])
+            while original["trader_id"] == trader_id and len(trader_ids) > 1:
+                trader_id = rng.choice(trader_ids)
+            reply_to = original["message_id"]
+            text = "ب" if rng.random() < 0.6 else f"ب {rng.randint(1, 2)}"
+        else:
+            own = [m for m in order_messages[-200:] if m["trader_id"] == trader_id]
+            if own and rng.random() < 0.5:
+                reply_to = rng.choice(own)["message_id"]
+            text = "ن"
+
+        message = {"message_id": message_id, "trader_id": trader_id, "text": text, "reply_to": reply_to}
+        messages.append(message)
+        if kind in ("simple", "tomorrow", "advance", "reply"):
+            order_messages.append(message)
+
+    return messages
+
+
+def generate_crossing_pairs(
+    pairs: int,
+    traders: int = 50,
+    open_day_price: int = 60000,
+    spread: int = 20,
+    seed: int = 1,
+) -> list[dict]:
+    """
+    Simple orders that come in buy/sell pairs of equal price and amount from
+    two different traders, with at most one pair open per price at a time.
+    Every order crosses exactly one counterpart, so any correct matcher
+    (including the legacy rescan, which fills from stale volumes when an order
+    crosses several) produces the same positions.
+    """
+    rng = random.Random(seed)
+    trader_ids = [1000 + i for i in range(traders)]
+    free_prices = list(range(open_day_price - spread, open_day_price + spread + 1))
+    pending = []  # (price, second trader, second side, amount)
+
+    messages = []
+    message_id = 0
+    opened = 0
+    while opened < pairs or pending:
+        if opened < pairs and free_prices and (not pending or rng.random() < 0.5):
+            price = free_prices.pop(rng.randrange(len(free_prices)))
+            first, second = rng.sample(trader_ids, 2)
+            side = rng.choice(SIMPLE_TYPES)
+            other = SIMPLE_TYPES[1] if side == SIMPLE_TYPES[0] else SIMPLE_TYPES[0]
+            amount = rng.randint(1, 5)
+            trader_id = first
+            pending.append((price, second, other, amount))
+            opened += 1
+        else:
+            price, trader_id, side, amount = pending.pop(rng.randrange(len(pending)))
+            free_prices.append(price)
+        message_id += 1
+        messages.append({"message_id": message_id, "trader_id": trader_id, "text": f"{price}{side}{amount}", "reply_to": None})
+
+    return messages
+
+
+def make_update(message: dict, messages_by_id: dict[int, dict]):
+    """
+    Minimal stand-in for telegram.Update exposing the attributes that
+    SetOrder and Program read.
+    """
+    reply_to_message = None
+    if message.get("reply_to") is not None:
+        replied = messages_by_id[message["reply_to"]]
+        reply_to_message = SimpleNamespace(
+            message_id=replied["message_id"],
+            text=replied["text"],
+            from_user=SimpleNamespace(id=replied["trader_id"]),
+        )
+    user = SimpleNamespace(id=message["trader_id"])
+    tg_message = SimpleNamespace(
+        message_id=message["message_id"],
+        text=message["text"],
+        from_user=user,
+        reply_to_message=reply_to_message,
+    )
+    return SimpleNamespace(
+        message=tg_message,
+        effective_message=tg_message,
+        effective_user=user,
+        effective_chat=SimpleNamespace(id=0),
+    )
@@ -0,0 +1,120 @@
+"""
+Price page parse benchmark.
+
+Times the fast extractor against the BeautifulSoup selectors per page, on
+recorded pages (PRICE_RECORD_DIR, or any saved tgju page) or on a synthetic
+page with the same structure, and checks that both give the same prices.
+
+    python -m benchmarks.price_parse_bench data/price_pages --repeat 50
+    python -m benchmarks.price_parse_bench --synthetic --json parse.json
+"""
+import argparse
+import json
+import os
+import time
+
+from prettytable import PrettyTable
+
+from common.price_sources import extract_prices_fast, parse_price_page_bs
+from .matching_bench import percentile
+
+
+def synthetic_price_page(current_price: int = 60123, open_day_price: int = 60012, filler_rows: int = 400) -> str:
+    """
+    A page shaped like the tgju profile page along both selector paths,
+    padded with unrelated markup to a realistic size.
+    """
+    filler = "".join(
+        f'<div class="news-item"><a href="/news/{i}">item {i}</a><span class="value">{i},{i % 1000:03d}</span></div>'
+        for i in range(filler_rows)
+    )
+    table_rows = "".join(
+        f'<tr><td class="text-right">row {i}</td><td class="text-left">{open_day_price if i == 6 else 50000 + i:,}</td></tr>'
+        for i in range(1, 10)
+    )
+    return (
+        '<html><head><title>tgju</title></head><body><div id="main">'
+        f'<div class="menu">{filler}</div>'
+        '<div class="stocks-profile">'
+        '<div class="stocks-header"><div class="stocks-header-main"><div>'
+        '<div class="fs-cell fs-xl-3 fs-lg-3 fs-md-6 fs-sm-12 fs-xs-12 top-header-item-block-1"><div>'
+        '<h3 class="line clearfix mobile-hide-block"><span class="value"><span>1</span></span></h3></div></div>'
+        '<div class="fs-cell fs-xl-3 fs-lg-3 fs-md-6 fs-sm-12 fs-xs-12 top-header-item-block-2 mobile-top-item-hide"><div>'
+        '<h3 class="line clearfix mobile-show-block"><span class="value"><span>2</span></span></h3>'
+        f'<h3 class="line clearfix mobile-hide-block"><span class="value"><span>{current_price:,}</span>'
+        '<span class="change">+0.1%</span></span></h3>'
+        '</div></div></div></div></div>'
+        '<div class="fs-row bootstrap-fix widgets full-w-set profile-social-share-box">'
+        '<div class="row tgju-widgets-row">'
+        '<div class="tgju-widgets-block col-md-12 col-lg-4 tgju-widgets-block-bottom-unset overview-first-block">'
+        '<div><div>summary</div><div><div><div class="tables-default normal"><table>'
+        f'<thead><tr><th>name</th><th>value</th></tr></thead><tbody>{table_rows}</tbody>'
+        '</table></div></div></div></div></div></div></div>'
+        f'<div class="footer">{filler}</div>'
+        '</div></div></body></html>'
+    )
+
+
+def time_parser(parse, html_doc: str, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse(html_doc)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def load_pages(path: str) -> dict[str, str]:
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if name.endswith(".html"))
+        paths = [os.path.join(path, name) for name in names]
+    else:
+        paths = [path]
+    pages = {}
+    for page_path in paths:
+        with open(page_path, encoding="utf-8") as f:
+            pages[os.path.basename(page_path)] = f.read()
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price page parse benchmark")
+    parser.add_argument("path", nargs="?", help="a saved page or a directory of *.html pages")
+    parser.add_argument("--synthetic", action="store_true", help="also benchmark a generated page")
+    parser.add_argument("--repeat", type=int, default=20, help="parses per page and parser")
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    pages = load_pages(args.path) if args.path else {}
+    if args.synthetic or not pages:
+        pages["synthetic"] = synthetic_price_page()
+
+    results = []
+    for name, html_doc in pages.items():
+        fast, slow = extract_prices_fast(html_doc), parse_price_page_bs(html_doc)
+        row = {"page": name, "kb": round(len(html_doc.encode("utf-8")) / 1024, 1), "prices": slow, "match": fast == slow}
+        for label, parse in (("fast", extract_prices_fast), ("bs4", parse_price_page_bs)):
+            timings = sorted(time_parser(parse, html_doc, args.repeat))
+            row[f"{label}_p50_us"] = round(percentile(timings, 50) * 1e6, 1)
+            row[f"{label}_p99_us"] = round(percentile(timings, 99) * 1e6, 1)
+        row["speedup"] = round(row["bs4_p50_us"] / row["fast_p50_us"], 1) if row["fast_p50_us"] else None
+        results.append(row)
+
+    table = PrettyTable()
+    table.field_names = ["page", "KB", "prices", "match", "fast p50 us", "fast p99 us", "bs4 p50 us", "bs4 p99 us", "speedup"]
+    for r in results:
+        table.add_row([
+            r["page"], r["kb"], r["prices"], r["match"], r["fast_p50_us"], r["fast_p99_us"],
+            r["bs4_p50_us"], r["bs4_p99_us"], r["speedup"],
+        ])
+    print(table)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if not all(r["match"] for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Order-flow replay.
+
+Drives Program.handle_message with a recorded group order flow (see
+program.order_flow.OrderFlowRecorder / ORDER_FLOW_LOG) on a virtual clock, as
+fast as possible, on top of the in-memory DataBase or a fresh migrated SQLite
+file. Each run reports throughput and a digest of the resulting positions;
+repeated runs, and runs on either backend, must produce the same digest.
+
+    python -m benchmarks.replay orders.jsonl --open-price 60000 --runs 3
+    python -m benchmarks.replay orders.jsonl --backend sqlite
+    python -m benchmarks.replay synthetic.jsonl --generate 2000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import clock, migrations
+from common.database import DataBase
+from common.memory_backend import InMemoryDataBase
+from program import Program, read_order_flow
+from .matching_bench import percentile, seed_traders, set_market
+from .order_flow import generate_order_flow, make_update
+
+
+def write_synthetic_flow(path: str, size: int, open_day_price: int, start: datetime, seed: int = 1):
+    """
+    Write a synthetic order flow in the recorder format, one message per second.
+    """
+    messages = generate_order_flow(size, open_day_price=open_day_price, seed=seed)
+    by_id = {m["message_id"]: m for m in messages}
+    with open(path, "w", encoding="utf-8") as f:
+        for i, m in enumerate(messages):
+            replied = by_id.get(m["reply_to"])
+            entry = {
+                "t": (start + timedelta(seconds=i)).isoformat(),
+                "id": m["message_id"],
+                "u": m["trader_id"],
+                "x": m["text"],
+                "r": None if replied is None else {
+                    "id": replied["message_id"], "u": replied["trader_id"], "x": replied["text"],
+                },
+            }
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def make_recorded_update(entry: dict):
+    """
+    Update stand-in for a recorded entry; the replied message is the one
+    recorded with it, as the bot saw it at the time.
+    """
+    message = {"message_id": entry["id"], "trader_id": entry["u"], "text": entry["x"], "reply_to": None}
+    messages_by_id = {}
+    if entry["r"] is not None:
+        replied = entry["r"]
+        message["reply_to"] = replied["id"]
+        messages_by_id[replied["id"]] = {"message_id": replied["id"], "trader_id": replied["u"], "text": replied["x"]}
+    return make_update(message, messages_by_id)
+
+
+def positions_digest(positions: list[dict]) -> str:
+    canonical = json.dumps(positions, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+BACKENDS = ("memory", "sqlite")
+
+
+async def open_backend(backend: str, directory: str) -> DataBase:
+    """
+    An empty, migrated database of the given backend; SQLite files go in `directory`.
+    """
+    if backend == "memory":
+        return InMemoryDataBase()
+    if backend == "sqlite":
+        db = await DataBase.create_sqlite(os.path.join(directory, "replay.sqlite3"))
+        await migrations.migrate(db)
+        return db
+    raise ValueError(f"unknown backend {backend!r}")
+
+
+async def replay(entries: list[dict], backend: str = "memory") -> dict:
+    if not entries:
+        raise ValueError("empty order flow")
+
+    virtual_now = [entries[0]["t"]]
+    clock.set_source(lambda: virtual_now[0])
+    try:
+        with tempfile.TemporaryDirectory(prefix="replay-") as directory:
+            return await _replay(entries, backend, directory, virtual_now)
+    finally:
+        clock.set_source(None)
+
+
+async def _replay(entries: list[dict], backend: str, directory: str, virtual_now: list) -> dict:
+    db = await open_backend(backend, directory)
+    try:
+        await seed_traders(db, sorted({e["u"] for e in entries}))
+        program = Program(db)
+        await program.start()
+
+        latencies = []
+        started = time.perf_counter()
+        for entry in entries:
+            virtual_now[0] = entry["t"]
+            t0 = time.perf_counter()
+            program.logic.expire(entry["t"])
+            await program.handle_message(make_recorded_update(entry), None)
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+        await program.close()
+        positions = await db.fetch_data("positions") + await db.fetch_data("advance_positions")
+    finally:
+        await db.close_pool()
+
+    latencies.sort()
+    return {
+        "backend": backend,
+        "messages": len(entries),
+        "seconds": round(elapsed, 4),
+        "orders_per_second": round(len(entries) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "positions": len(positions),
+        "digest": positions_digest(positions),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded group order flow")
+    parser.add_argument("path", help="order flow file written by ORDER_FLOW_LOG")
+    parser.add_argument("--open-price", type=int, default=60000, help="open day price of the recorded day")
+    parser.add_argument("--runs", type=int, default=1, help="replay several times and compare digests")
+    parser.add_argument("--backend", choices=BACKENDS, default="memory", help="storage the replay runs on")
+    parser.add_argument("--generate", type=int, metavar="SIZE", help="first write a synthetic flow of SIZE messages")
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    set_market(args.open_price)
+    if args.generate:
+        start = datetime.combine(datetime.now().date(), datetime.min.time()).replace(hour=13)
+        write_synthetic_flow(args.path, args.generate, args.open_price, start)
+
+    entries = read_order_flow(args.path)
+    results = []
+    for run in range(args.runs):
+        result = await replay(entries, args.backend)
+        results.append(result)
+        print(
+            f"run {run + 1} [{result['backend']}]: {result['messages']} messages in {result['seconds']}s "
+            f"({result['orders_per_second']}/s, p50 {result['p50_ms']}ms, p99 {result['p99_ms']}ms), "
+            f"{result['positions']} positions, digest {result['digest'][:16]}"
+        )
+
+    deterministic = len({r["digest"] for r in results}) == 1
+    if not deterministic:
+        print("digest mismatch between runs")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "deterministic": deterministic, "results": results}, f, indent=2)
+    if not deterministic:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
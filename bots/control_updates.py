@@ -1,42 +1,61 @@
-from bs4 import BeautifulSoup
-import requests
 import common.config as config
+from common.price_sources import PriceParser, PriceSource, price_source_from_config
 import datetime as dt
 import asyncio
+import logging
+import time
 
+logger = logging.getLogger(__name__)
 
 
-def set_price_info():
+def apply_price_info(current_price: int, open_day_price: int | None):
     # Update Price Info
-    response = requests.get("https://www.tgju.org/profile/afghan_usd")
-    html_doc = response.text
-
-
-    soup = BeautifulSoup(html_doc, 'html.parser')
-    current_price = soup.select(selector="#main > div.stocks-profile > div.stocks-header > div.stocks-header-main > div > div.fs-cell.fs-xl-3.fs-lg-3.fs-md-6.fs-sm-12.fs-xs-12.top-header-item-block-2.mobile-top-item-hide > div > h3.line.clearfix.mobile-hide-block > span.value > span:nth-child(1)")[0].get_text()
-    current_price = current_price.replace(',', '')[0:5]
-    config.BASE_PRICE = current_price[0:2]
-    current_price = int(current_price)
-    print(current_price)
-
-
-    try:
-        open_day_price = soup.select(selector="#main > div.stocks-profile > div.fs-row.bootstrap-fix.widgets.full-w-set.profile-social-share-box > div.row.tgju-widgets-row > div.tgju-widgets-block.col-md-12.col-lg-4.tgju-widgets-block-bottom-unset.overview-first-block > div > div:nth-child(2) > div > div.tables-default.normal > table > tbody > tr:nth-child(6) > td.text-left")[0].get_text()
-        open_day_price = int(open_day_price.replace(',', '')[0:5])
-        print(open_day_price)
-        config.OPEN_DAY_PRICE = open_day_price
-    except ValueError:
-        config.OPEN_DAY_PRICE = current_price
+    config.BASE_PRICE = str(current_price)[0:2]
+    if open_day_price is None:
         open_day_price = current_price
-
+    config.OPEN_DAY_PRICE = open_day_price
     config.CURRENT_PRICE = current_price
 
     config.PRICE_UPPER_BOUND = open_day_price + config.PRICE_BOUND_RATE
     config.PRICE_LOWER_BOUND = open_day_price - config.PRICE_BOUND_RATE
 
 
-    print(config.PRICE_UPPER_BOUND)
-    print(config.PRICE_LOWER_BOUND)
+class PriceFeed:
+    """
+    دریافت قیمت از یک PriceSource (صفحه‌ی زنده، فایل یا صفحه‌های ضبط‌شده) و استخراج آن با PriceParser بیرون از event loop.
+    در صورت خطا مقدارهای قبلی config (آخرین قیمت سالم) دست نمی‌خورند؛
+    مسیر سفارش فقط config را می‌خواند و هیچ‌وقت منتظر منبع قیمت نمی‌ماند.
+    """
+
+    def __init__(self, source: PriceSource, parser: PriceParser | None = None):
+        self.source = source
+        self.parser = parser or PriceParser()
+        self.last_good: tuple[int, int | None] | None = None
+        self.last_good_at: float | None = None
+
+    async def update(self) -> bool:
+        """
+        یک بار قیمت را می‌گیرد و در config می‌نویسد؛ در صورت خطا False و آخرین قیمت سالم می‌ماند.
+        """
+        try:
+            html_doc = await self.source.fetch()
+            current_price, open_day_price = await asyncio.to_thread(self.parser.parse, html_doc)
+        except Exception as exc:
+            age = f"{time.monotonic() - self.last_good_at:.0f}s" if self.last_good_at else "never"
+            logger.warning("price update failed (%s), last good price: %s ago", exc, age)
+            return False
+        apply_price_info(current_price, open_day_price)
+        if (current_price, open_day_price) != self.last_good:
+            logger.info(
+                "price %s, open day %s, bounds %s-%s",
+                current_price, config.OPEN_DAY_PRICE, config.PRICE_LOWER_BOUND, config.PRICE_UPPER_BOUND,
+            )
+        self.last_good = (current_price, open_day_price)
+        self.last_good_at = time.monotonic()
+        return True
+
+    async def close(self):
+        await self.source.close()
 
 
 def set_datetime():
@@ -50,13 +69,15 @@ def set_datetime():
     config.CURRENT_DATE = current_date
 
 
-async def control_updates():
-    while True:
-        set_price_info()
-        set_datetime()
-        # config.IS_GAME_ON = True if 22 > int(config.CURRENT_TIME.split(":")[0]) >= 8 else False
-        await asyncio.sleep(10)
-
-
-
-
+async def control_updates(interval: float = 10):
+    # منبع قیمت: صفحه‌ی زنده‌ی tgju، یا برای تست آفلاین یک فایل/پوشه‌ی صفحه‌های ضبط‌شده (PRICE_SOURCE)
+    feed = PriceFeed(price_source_from_config(config.PRICE_SOURCE, config.PRICE_RECORD_DIR))
+    try:
+        while True:
+            ok = await feed.update()
+            set_datetime()
+            # config.IS_GAME_ON = True if 22 > int(config.CURRENT_TIME.split(":")[0]) >= 8 else False
+            # تا اولین قیمت سالم زودتر دوباره تلاش می‌کنیم
+            await asyncio.sleep(interval if ok or feed.last_good else min(interval, 2))
+    finally:
+        await feed.close()
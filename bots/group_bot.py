@@ -1,4 +1,5 @@
 import logging
+import time
 from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
@@ -9,7 +10,7 @@ from telegram.ext import (
 )
 
 from common.utilz import get_dynamic_text
-from program import Program
+from program import Program, OrderFlowRecorder
 
 import common.config as config
 from common.database import DataBase, User  # Import async DataBase and User
@@ -37,7 +38,14 @@ async def mirror_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if config.IS_GAME_ON and await db.is_user(update.effective_user.id):
         # اکنون که db را در bot_data داریم، Program را هم از bot_data می‌خوانیم
         program: Program = context.bot_data["program"]
+        # ثبت پیام برای بازپخش آفلاین (در صورت فعال بودن ORDER_FLOW_LOG)
+        recorder = context.bot_data.get("recorder")
+        if recorder is not None:
+            recorder.record(update)
+        started = time.perf_counter()
         commands = await program.handle_message(update, context)
+        db.metrics.observe("group.handle_message", time.perf_counter() - started)
+        started = time.perf_counter()
         for com in commands:
             print(com)
             key = com["key"]
@@ -63,6 +71,8 @@ async def mirror_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     chat_id=update.effective_chat.id,
                     message_id=update.effective_message.message_id,
                 )
+        # زمان ارسال پاسخ‌ها به تلگرام، جدا از زمان دیتابیس
+        db.metrics.observe("group.telegram_replies", time.perf_counter() - started)
 
     else:
         # اگر بازی فعال نیست یا کاربر در جدول users نیست، پیام را حذف می‌کنیم
@@ -84,6 +94,8 @@ async def main(db: DataBase):
 
     # ساخت Program و ذخیره در bot_data
     app.bot_data["program"] = Program(db)
+    if config.ORDER_FLOW_LOG:
+        app.bot_data["recorder"] = OrderFlowRecorder(config.ORDER_FLOW_LOG)
 
     # هندلرها را ثبت می‌کنیم
     app.add_handler(CommandHandler("start", start))
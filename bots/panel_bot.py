@@ -31,12 +31,15 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_model = User(db)
     user_id = update.message.from_user.id
 
+    # نقش کاربر با یک پرس‌وجوی (کش‌شده) مشخص می‌شود
+    role = await db.get_role(user_id)
+
     # اگر مالک است
-    if await db.is_owner(user_id):
+    if role == "owner":
         return ConversationHandler.END
 
     # اگر ادمین است
-    if await db.is_admin(user_id):
+    if role == "admin":
         reply_markup = ap.create_admin_panel()
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
@@ -50,7 +53,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
     # اگر کاربر عادی است
-    if await db.is_user(user_id):
+    if role == "user":
         reply_markup = up.create_user_panel()
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
@@ -116,6 +119,8 @@ async def main(db: DataBase):
     app.add_handler(ap.get_deposit_approval_handler())
     # 2- dynamic text handler
     app.add_handler(ap.dynamic_text_handler())
+    # 3- database metrics (/dbstats)
+    app.add_handler(ap.db_stats_handler())
 
     print("پنل بات در حال اجراست...")
     return app
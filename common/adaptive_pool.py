@@ -0,0 +1,279 @@
+"""
+Adaptive aiomysql connection pool.
+
+Used by DataBase.create_pool in place of aiomysql.create_pool, with the same
+acquire()/close()/wait_closed() interface:
+
+- grows toward `maxsize` only when an acquire has waited `grow_after`
+  seconds without a connection being released (short bursts reuse the
+  connections that are already open);
+- closes connections that sat idle for `idle_timeout` seconds, down to
+  `minsize`;
+- pings a connection that has been idle for `ping_after` seconds before
+  handing it out, and replaces it if the server dropped it (wait_timeout,
+  restarts);
+- applies `query_timeout` to every execute/fetch; a connection whose
+  statement timed out is closed instead of being reused.
+"""
+import asyncio
+import collections
+import functools
+import logging
+import time
+
+import aiomysql
+
+logger = logging.getLogger(__name__)
+
+
+class _TimeoutCursor:
+    def __init__(self, cursor, connection: "_PooledConnection"):
+        self._cursor = cursor
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def _call(self, method, *args):
+        timeout = self._connection.pool.query_timeout
+        if not timeout:
+            return await method(*args)
+        try:
+            return await asyncio.wait_for(method(*args), timeout)
+        except asyncio.TimeoutError:
+            # the protocol state is unknown after a cancelled read: never reuse it
+            self._connection.broken = True
+            raise
+
+    async def execute(self, query, args=None):
+        return await self._call(self._cursor.execute, query, args)
+
+    async def executemany(self, query, args):
+        return await self._call(self._cursor.executemany, query, args)
+
+    async def fetchone(self):
+        return await self._call(self._cursor.fetchone)
+
+    async def fetchmany(self, size=None):
+        return await self._call(self._cursor.fetchmany, size)
+
+    async def fetchall(self):
+        return await self._call(self._cursor.fetchall)
+
+
+class _CursorContext:
+    def __init__(self, connection: "_PooledConnection", args):
+        self._connection = connection
+        self._args = args
+        self._cursor = None
+
+    async def __aenter__(self):
+        self._cursor = await self._connection.raw.cursor(*self._args)
+        return _TimeoutCursor(self._cursor, self._connection)
+
+    async def __aexit__(self, *exc):
+        if not self._connection.broken:
+            await self._cursor.close()
+
+
+class _PooledConnection:
+    def __init__(self, raw, pool: "AdaptivePool"):
+        self.raw = raw
+        self.pool = pool
+        self.broken = False
+        self.last_used = time.monotonic()
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def cursor(self, *args):
+        return _CursorContext(self, args)
+
+
+class _AcquireContext:
+    def __init__(self, pool: "AdaptivePool"):
+        self._pool = pool
+        self._connection = None
+
+    async def __aenter__(self):
+        self._connection = await self._pool._get()
+        return self._connection
+
+    async def __aexit__(self, *exc):
+        connection, self._connection = self._connection, None
+        self._pool._put(connection)
+
+
+class AdaptivePool:
+    def __init__(
+        self,
+        connect,
+        minsize: int = 1,
+        maxsize: int = 30,
+        grow_after: float = 0.02,
+        idle_timeout: float = 300.0,
+        ping_after: float = 30.0,
+        query_timeout: float | None = None,
+    ):
+        self._connect = connect
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.grow_after = grow_after
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self.query_timeout = query_timeout
+        # idle connections, most recently used last (LIFO keeps the hot set small)
+        self._idle: collections.deque[_PooledConnection] = collections.deque()
+        self._waiters: collections.deque[asyncio.Future] = collections.deque()
+        self.size = 0  # open plus opening connections
+        self.opened = 0
+        self.discarded = 0
+        self._closing = False
+        self._closed = asyncio.Event()
+        self._reaper: asyncio.Task | None = None
+
+    @classmethod
+    async def create(
+        cls,
+        minsize: int = 1,
+        maxsize: int = 30,
+        grow_after: float = 0.02,
+        idle_timeout: float = 300.0,
+        ping_after: float = 30.0,
+        query_timeout: float | None = None,
+        **connect_kwargs,
+    ) -> "AdaptivePool":
+        """
+        `connect_kwargs` go to aiomysql.connect (host, user, password, db, ...).
+        """
+        pool = cls(
+            functools.partial(aiomysql.connect, **connect_kwargs),
+            minsize, maxsize, grow_after, idle_timeout, ping_after, query_timeout,
+        )
+        for _ in range(minsize):
+            pool._idle.append(await pool._open())
+        pool._reaper = asyncio.create_task(pool._reap())
+        return pool
+
+    def acquire(self):
+        return _AcquireContext(self)
+
+    # ------------------------------------------------------------
+    async def _open(self) -> _PooledConnection:
+        self.size += 1
+        try:
+            raw = await self._connect()
+        except BaseException:
+            self.size -= 1
+            self._wake()
+            raise
+        self.opened += 1
+        return _PooledConnection(raw, self)
+
+    def _discard(self, connection: _PooledConnection) -> None:
+        self.size -= 1
+        self.discarded += 1
+        connection.raw.close()
+        if self._closing and self.size == 0:
+            self._closed.set()
+        # a waiter may now open a connection in its place
+        self._wake()
+
+    def _wake(self, connection: _PooledConnection | None = None) -> bool:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(connection)
+                return True
+        return False
+
+    async def _take_idle(self) -> _PooledConnection | None:
+        while self._idle:
+            connection = self._idle.pop()
+            if time.monotonic() - connection.last_used > self.ping_after:
+                try:
+                    await asyncio.wait_for(connection.raw.ping(reconnect=False), 5)
+                except Exception:
+                    logger.info("dropping stale database connection")
+                    self._discard(connection)
+                    continue
+            return connection
+        return None
+
+    async def _get(self) -> _PooledConnection:
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._closing:
+                raise RuntimeError("pool is closed")
+            connection = await self._take_idle()
+            if connection is not None:
+                return connection
+            if self.size < self.minsize:
+                return await self._open()
+
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                if self.size < self.maxsize:
+                    # give a busy connection `grow_after` to come back before growing
+                    await asyncio.wait({waiter}, timeout=self.grow_after)
+                    if not waiter.done():
+                        waiter.cancel()
+                        if self.size < self.maxsize:
+                            return await self._open()
+                        continue
+                connection = await waiter
+            except BaseException:
+                if not waiter.done():
+                    waiter.cancel()
+                elif not waiter.cancelled() and waiter.result() is not None:
+                    # handed a connection just as we were cancelled
+                    self._put(waiter.result())
+                raise
+            if connection is not None:
+                return connection
+            # woken without a connection (one was discarded): try again
+
+    def _put(self, connection: _PooledConnection) -> None:
+        raw = connection.raw
+        if connection.broken or raw.closed or self._closing or raw.get_transaction_status():
+            # aiomysql does the same with a connection left inside a transaction
+            self._discard(connection)
+            return
+        connection.last_used = time.monotonic()
+        if not self._wake(connection):
+            self._idle.append(connection)
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 30.0))
+            now = time.monotonic()
+            # oldest idle connections are at the left
+            while self._idle and self.size > self.minsize and now - self._idle[0].last_used > self.idle_timeout:
+                self._discard(self._idle.popleft())
+
+    def status(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "waiting": sum(1 for waiter in self._waiters if not waiter.done()),
+            "max": self.maxsize,
+            "opened": self.opened,
+            "discarded": self.discarded,
+        }
+
+    # ------------------------------------------------------------
+    def close(self) -> None:
+        self._closing = True
+        if self._reaper is not None:
+            self._reaper.cancel()
+        while self._idle:
+            self._discard(self._idle.popleft())
+        if self.size == 0:
+            self._closed.set()
+
+    async def wait_closed(self) -> None:
+        """
+        Wait until connections still in use have been returned and closed.
+        """
+        await self._closed.wait()
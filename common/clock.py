@@ -0,0 +1,15 @@
+from datetime import datetime
+from typing import Callable
+
+# Time source for the order path. None means the wall clock; the order-flow
+# replayer installs a virtual clock here so replays are deterministic.
+_source: Callable[[], datetime] | None = None
+
+
+def now() -> datetime:
+    return _source() if _source is not None else datetime.now()
+
+
+def set_source(source: Callable[[], datetime] | None) -> None:
+    global _source
+    _source = source
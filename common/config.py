@@ -11,6 +11,23 @@ DB_NAME = os.getenv("DB_NAME")          # string
 
 DB_PORT = int(os.getenv("DB_PORT", 3306))  # int
 
+# connection pool: grows from DB_POOL_MIN toward DB_POOL_MAX under load, idle
+# connections are closed after DB_POOL_IDLE_TIMEOUT seconds
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 30))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv("DB_POOL_IDLE_TIMEOUT", 300))
+DB_QUERY_TIMEOUT = float(os.getenv("DB_QUERY_TIMEOUT", 10))  # seconds, 0 disables it
+
+# read replicas, comma separated "host[:port]" (same user/password/database)
+DB_REPLICA_HOSTS = [h.strip() for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 2))  # seconds
+
+# storage backend: "mysql" (DB_* above), "sqlite" (embedded file at SQLITE_PATH)
+# or "memory" (nothing persisted; for load tests of the bots)
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/exchange.sqlite3")
+MEMORY_DB_LATENCY_MS = float(os.getenv("MEMORY_DB_LATENCY_MS", 0))  # simulated per-call latency
+
 
 
 PANEL_BOT_TOKEN = os.getenv("PANEL_BOT_TOKEN")
@@ -35,6 +52,26 @@ CURRENT_PRICE = 0
 OPEN_DAY_PRICE = 0
 PRICE_UPPER_BOUND = 0
 PRICE_LOWER_BOUND = 0
+# empty: live tgju page; a file or a directory of recorded pages for offline runs
+PRICE_SOURCE = os.getenv("PRICE_SOURCE", "")
+# save every fetched live page here (empty disables it)
+PRICE_RECORD_DIR = os.getenv("PRICE_RECORD_DIR", "")
+
+
+
+# matching engine journal/snapshot (empty BOOK_JOURNAL_DIR disables it)
+BOOK_JOURNAL_DIR = os.getenv("BOOK_JOURNAL_DIR", "data/book")
+BOOK_SNAPSHOT_INTERVAL = int(os.getenv("BOOK_SNAPSHOT_INTERVAL", 5000))
+EXPIRY_TICK_SECONDS = 1
+
+# group order flow recording for offline replay (empty disables it)
+ORDER_FLOW_LOG = os.getenv("ORDER_FLOW_LOG", "")
+
+# local HTTP endpoint for database metrics on 127.0.0.1 (0 disables it)
+METRICS_HTTP_PORT = int(os.getenv("METRICS_HTTP_PORT", 0))
+
+# recompute trader_exposure from positions/orders at startup even when it is not empty (repairs drift)
+EXPOSURE_REBUILD_ON_START = os.getenv("EXPOSURE_REBUILD_ON_START", "0") == "1"
 
 
 
@@ -1,15 +1,132 @@
+import asyncio
+import time
+from collections import OrderedDict
 from typing import Dict, Any
 
 import aiomysql
 from datetime import datetime, timedelta
 
+from common import clock
+from common.adaptive_pool import AdaptivePool
+from common.exposure import ExposureCache
+from common.metrics import InstrumentedPool, QueryMetrics
+from common.pack_ledger import PackLedger
+from common.replicas import Replica, ReplicaSet
+from common.sqlite_backend import SQLitePool
+
+_MISSING = object()
+
+# access_level -> role name
+ROLES = {1: "user", 2: "admin", 3: "owner"}
+
+
+class StaleFillError(ValueError):
+    """
+    commit_fill was asked to fill an order that no longer exists or no longer
+    has the amount left (e.g. cancelled while it was still in a resident book).
+    Nothing was written.
+    """
+
+
+def _now() -> datetime:
+    return clock.now().replace(microsecond=0)
+
+
+# Columns MySQL fills in when an INSERT leaves them out (NULL or a server
+# default). Used to build inserted rows locally instead of reading them back.
+COLUMN_DEFAULTS = {
+    "orders": {"take_profit": None, "stop_loss": None, "date": _now, "volume_filled": 0},
+    "advance_orders": {"seller_id": None, "buyer_id": None, "date": _now, "volume_filled": 0},
+    "positions": {"stop_loss": None, "take_profit": None, "stop_price": None, "date": _now},
+    "advance_positions": {"date": _now},
+    "order_history": {"date": _now},
+    "reply_chain": {"order_amount": None},
+    "app_users": {
+        "username": None, "card_number": None, "wallet_address": None, "margin": None,
+        "parent_id": None, "children": None, "register_date": _now,
+        "access_level": 1, "frozen_pack": 0, "trade_pack": 0,
+    },
+    "payment": {
+        "owner_name": None, "address": None, "file_id": None, "deposit_text": None, "deposit_amount": None,
+        "transaction_id": None, "currency": None, "confirmed_by": None, "confirmation_date": None,
+        "date": _now,
+    },
+}
+
+# DATETIME columns; the models insert them as ISO strings
+DATETIME_COLUMNS = {"date", "expiration_date", "expiration_order_time", "register_date", "confirmation_date"}
+
+
+class TTLCache:
+    """
+    Bounded LRU cache keyed by trader_id with a TTL per entry.
+    Used for display names and access levels; unknown traders are cached too
+    (as None / 0). User.add_record/update_record/delete_record invalidate the
+    affected entries.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple[float, str | None]] = OrderedDict()
+
+    def get(self, trader_id: int, default=_MISSING):
+        entry = self._entries.get(trader_id)
+        if entry is None:
+            return default
+        expires_at, name = entry
+        if expires_at < time.monotonic():
+            del self._entries[trader_id]
+            return default
+        self._entries.move_to_end(trader_id)
+        return name
+
+    def put(self, trader_id: int, name: str | None) -> None:
+        self._entries[trader_id] = (time.monotonic() + self.ttl, name)
+        self._entries.move_to_end(trader_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, trader_id: int | None = None) -> None:
+        if trader_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(trader_id, None)
+
+
 class DataBase:
     """
-    Async base class for MySQL operations using aiomysql pool.
+    Async base class for database operations over a connection pool.
+
+    The pool is the storage backend: an aiomysql pool (create_pool) or the
+    embedded SQLite pool from common.sqlite_backend (create_sqlite), which
+    speaks the same acquire/cursor interface and translates the MySQL SQL
+    used here. `dialect` tells the few dialect-specific callers (migrations)
+    which one is in use.
+
+    Optional replica pools take reads that tolerate replication lag
+    (fetch_data, iter_data, role/name/referral lookups, get_order_by_message_id);
+    see common.replicas for when a read still goes to the primary. Writes and
+    reads the order path depends on (packs, exposure) always use the primary.
     """
 
-    def __init__(self, pool: aiomysql.Pool):
-        self._pool = pool
+    def __init__(self, pool: aiomysql.Pool, replicas: list | None = None, max_replica_lag: float = 2.0):
+        self.dialect = getattr(pool, "dialect", "mysql")
+        # every acquire/execute through the pool is recorded in self.metrics
+        self.metrics = QueryMetrics()
+        self._pool = InstrumentedPool(pool, self.metrics) if pool is not None else None
+        # single flight (see _read): in-flight reads and per-table write counters
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._generations: dict[str, int] = {}
+        self.replicas = ReplicaSet(
+            [Replica(name, InstrumentedPool(replica, self.metrics)) for name, replica in (replicas or [])],
+            max_lag=max_replica_lag,
+        )
+        self.exposure = ExposureCache()
+        self.names = TTLCache(maxsize=4096, ttl=300.0)
+        # short TTL: role changes made outside User (e.g. directly in MySQL) show up quickly
+        self.roles = TTLCache(maxsize=4096, ttl=30.0)
+        self.packs = PackLedger(self)
 
     @classmethod
     async def create_pool(
@@ -23,44 +140,190 @@ class DataBase:
         maxsize: int = 10,
         charset: str = "utf8mb4",
         autocommit: bool = True,
+        replica_hosts: list[str] = (),
+        max_replica_lag: float = 2.0,
+        idle_timeout: float = 300.0,
+        query_timeout: float | None = None,
     ) -> "DataBase":
         """
-        Initialize and return a DataBase instance with an aiomysql pool.
-        """
-        pool = await aiomysql.create_pool(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            db=db,
-            minsize=minsize,
-            maxsize=maxsize,
-            charset=charset,
-            autocommit=autocommit,
-        )
+        Initialize and return a DataBase instance with an adaptive pool
+        (common.adaptive_pool: grows from minsize toward maxsize under load,
+        closes idle connections, pings stale ones, optional per-query
+        timeout), plus one such pool per "host[:port]" in replica_hosts
+        (same credentials/schema).
+        """
+        def adaptive_pool(pool_host: str, pool_port: int):
+            return AdaptivePool.create(
+                minsize=minsize,
+                maxsize=maxsize,
+                idle_timeout=idle_timeout,
+                query_timeout=query_timeout,
+                host=pool_host,
+                port=pool_port,
+                user=user,
+                password=password,
+                db=db,
+                charset=charset,
+                autocommit=autocommit,
+            )
+
+        pool = await adaptive_pool(host, port)
+        replicas = []
+        for replica_host in replica_hosts:
+            replica_name, _, replica_port = replica_host.partition(":")
+            replicas.append((replica_host, await adaptive_pool(replica_name, int(replica_port or port))))
+        instance = cls(pool, replicas, max_replica_lag)
+        instance.replicas.start()
+        return instance
+
+    @classmethod
+    async def create_sqlite(cls, path: str, size: int = 4) -> "DataBase":
+        """
+        Initialize and return a DataBase instance on an embedded SQLite file
+        (WAL mode; queries run in worker threads, off the event loop).
+        """
+        pool = await SQLitePool.create(path, size=size)
         return cls(pool)
 
     async def close_pool(self):
         """
         Gracefully close the connection pool.
         """
+        await self.packs.close()
+        await self.replicas.close()
         self._pool.close()
         await self._pool.wait_closed()
 
-    async def add_record(self, table: str, record_obj) -> int:
+    def pool_status(self) -> dict | None:
         """
-        Insert a new record into `table`. The object's __dict__ is filtered
-        to ignore None values and internal attributes.
-        Returns the last inserted ID.
+        Size/idle/waiting counters of the primary pool, if it reports them.
+        """
+        raw = getattr(self._pool, "raw", None)
+        return raw.status() if hasattr(raw, "status") else None
+
+    def _primary(self, *tables: str):
+        """
+        The primary pool, for a statement that writes `tables`.
+        """
+        self.replicas.mark_write(*tables)
+        for table in tables:
+            self._generations[table] = self._generations.get(table, 0) + 1
+        return self._pool
+
+    def _reader(self, table: str):
+        """
+        A replica pool that is up to date enough to read `table`, else the primary.
+        """
+        return self.replicas.choose(table) or self._pool
+
+    async def _read(self, table: str, sql: str, params: tuple = (), one: bool = False):
+        """
+        Run a read-only statement (on a replica when possible) and return its
+        rows as dicts, or with one=True the first row or None.
+
+        Single flight: identical reads (same SQL and parameters) that run
+        concurrently share one query and one pool connection. A read only
+        joins a query that started after the last write to `table` began,
+        and a read that must go to the primary (see common.replicas) only
+        joins a query on the primary, so it never gets an older result than
+        it would have on its own.
+        """
+        pool = self._reader(table)
+        on_primary = pool is self._pool
+        try:
+            generation = self._generations.get(table, 0)
+            key = (generation, on_primary, sql, params, one)
+            future = self._inflight.get(key)
+            if future is None and not on_primary:
+                # the same read on the primary is never older than a replica's
+                future = self._inflight.get((generation, True, sql, params, one))
+        except TypeError:  # unhashable parameter
+            key, future = None, None
+
+        if future is not None:
+            try:
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # the query we joined was cancelled with its caller; run our own
+                return await self._read(table, sql, params, one)
+            self.metrics.coalesced += 1
+            # every caller gets its own rows, as with separate queries
+            return self._copy_rows(result, one)
+
+        if key is not None:
+            future = self._inflight[key] = asyncio.get_running_loop().create_future()
+            # avoid "exception was never retrieved" when nobody joined
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            async with pool.acquire() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cur:
+                    await cur.execute(sql, params)
+                    result = await cur.fetchone() if one else list(await cur.fetchall())
+        except asyncio.CancelledError:
+            if future is not None:
+                future.cancel()
+            raise
+        except Exception as exc:
+            if future is not None:
+                future.set_exception(exc)
+            raise
+        else:
+            if future is not None:
+                # joiners copy from a snapshot taken now, not from the rows the leader's caller may modify
+                future.set_result(self._copy_rows(result, one))
+            return result
+        finally:
+            if key is not None:
+                del self._inflight[key]
+
+    @staticmethod
+    def _copy_rows(result, one: bool):
+        if one:
+            return dict(result) if result else result
+        return [dict(row) for row in result]
+
+    @staticmethod
+    def _record_fields(record_obj) -> dict:
+        """
+        The object's __dict__ without None values and internal attributes.
         """
-        # Filter out None values and internal attrs
         exclude_fields = {"_pool","db"}
-        data = {
+        return {
             k: v
             for k, v in record_obj.__dict__.items()
             if v is not None and k not in exclude_fields
         }
 
+    @staticmethod
+    def _build_record(table: str, data: dict, row_id: int) -> dict:
+        """
+        The row MySQL would return for an INSERT of `data`: the given id,
+        known column defaults, DATETIME columns as datetime and booleans as
+        TINYINT values.
+        """
+        row = {"id": row_id}
+        for column, default in COLUMN_DEFAULTS.get(table, {}).items():
+            row[column] = default() if callable(default) else default
+        for column, value in data.items():
+            if column in DATETIME_COLUMNS and isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            elif isinstance(value, bool):
+                value = int(value)
+            row[column] = value
+        return row
+
+    async def add_record(self, table: str, record_obj, return_record: bool = False) -> int | dict:
+        """
+        Insert a new record into `table`. The object's __dict__ is filtered
+        to ignore None values and internal attributes.
+        Returns the last inserted ID, or with return_record=True the inserted
+        row built locally (see _build_record) without reading it back.
+        """
+        # Filter out None values and internal attrs
+        data = self._record_fields(record_obj)
+
         if not data:
             raise ValueError("No data fields provided for insertion.")
 
@@ -70,31 +333,89 @@ class DataBase:
 
         query = f"INSERT INTO `{table}` ({columns}) VALUES ({placeholders});"
 
-        async with self._pool.acquire() as conn:
+        async with self._primary(table).acquire() as conn:
             async with conn.cursor() as cur:
                 await cur.execute(query, values)
                 last_id = cur.lastrowid
-                return last_id
 
-    async def fetch_data(self, table: str, conditions: dict = None) -> list[dict]:
+        if return_record:
+            return self._build_record(table, data, last_id)
+        return last_id
+
+    @staticmethod
+    def _select_sql(
+        table: str,
+        conditions: dict = None,
+        columns: list[str] = None,
+        order_by=None,
+        limit: int = None,
+    ) -> tuple[str, tuple]:
         """
-        Fetch rows from `table` matching all key=value in conditions.
-        If conditions is None or empty, fetches all rows.
-        Returns a list of dicts.
+        Build SELECT for fetch_data/iter_data. order_by is a column name or a
+        list of them; a leading "-" sorts that column descending.
         """
+        column_list = ", ".join(f"`{col}`" for col in columns) if columns else "*"
+        sql = f"SELECT {column_list} FROM `{table}`"
+        params = ()
         if conditions:
-            where_clauses = " AND ".join(f"`{k}`=%s" for k in conditions.keys())
-            sql = f"SELECT * FROM `{table}` WHERE {where_clauses};"
+            sql += " WHERE " + " AND ".join(f"`{k}`=%s" for k in conditions.keys())
             params = tuple(conditions.values())
-        else:
-            sql = f"SELECT * FROM `{table}`;"
-            params = ()
+        if order_by:
+            if isinstance(order_by, str):
+                order_by = [order_by]
+            sql += " ORDER BY " + ", ".join(
+                f"`{col[1:]}` DESC" if col.startswith("-") else f"`{col}`" for col in order_by
+            )
+        if limit is not None:
+            sql += " LIMIT %s"
+            params += (int(limit),)
+        return sql + ";", params
+
+    async def fetch_data(
+        self,
+        table: str,
+        conditions: dict = None,
+        columns: list[str] = None,
+        order_by=None,
+        limit: int = None,
+    ) -> list[dict]:
+        """
+        Fetch rows from `table` matching all key=value in conditions.
+        If conditions is None or empty, fetches all rows.
+        `columns` limits the selected columns (default *), `order_by` and
+        `limit` are passed to SQL. Returns a list of dicts.
+        """
+        sql, params = self._select_sql(table, conditions, columns, order_by, limit)
+        return await self._read(table, sql, params)
 
-        async with self._pool.acquire() as conn:
-            async with conn.cursor(aiomysql.DictCursor) as cur:
+    async def iter_data(
+        self,
+        table: str,
+        conditions: dict = None,
+        columns: list[str] = None,
+        order_by=None,
+        batch_size: int = 500,
+    ):
+        """
+        Like fetch_data, but streams the rows with an unbuffered server-side
+        cursor (SSDictCursor), `batch_size` rows at a time, so large tables
+        are read in constant memory:
+
+            async for row in db.iter_data("positions", columns=["buyer_id", "position_amount"]):
+                ...
+
+        The connection stays checked out until the iteration ends.
+        """
+        sql, params = self._select_sql(table, conditions, columns, order_by)
+        async with self._reader(table).acquire() as conn:
+            async with conn.cursor(aiomysql.SSDictCursor) as cur:
                 await cur.execute(sql, params)
-                rows = await cur.fetchall()
-                return [dict(row) for row in rows]
+                while True:
+                    rows = await cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row
 
     async def update_record(
         self, table: str, conditions: dict, new_values: dict
@@ -112,7 +433,7 @@ class DataBase:
         sql = f"UPDATE `{table}` SET {set_clause} WHERE {where_clause};"
         params = tuple(filtered.values()) + tuple(conditions.values())
 
-        async with self._pool.acquire() as conn:
+        async with self._primary(table).acquire() as conn:
             async with conn.cursor() as cur:
                 await cur.execute(sql, params)
 
@@ -124,10 +445,454 @@ class DataBase:
         sql = f"DELETE FROM `{table}` WHERE {where_clause};"
         params = tuple(conditions.values())
 
-        async with self._pool.acquire() as conn:
+        async with self._primary(table).acquire() as conn:
             async with conn.cursor() as cur:
                 await cur.execute(sql, params)
 
+    # ---------------------------------------------------------------------------
+    # Bulk operations: many rows, one connection, one transaction
+    # ---------------------------------------------------------------------------
+
+    # keeps IN (...) lists and parameter counts well below server limits
+    BULK_CHUNK_SIZE = 1000
+
+    @staticmethod
+    def _chunks(values: list, size: int):
+        for start in range(0, len(values), size):
+            yield values[start:start + size]
+
+    async def _run_in_transaction(self, statements: list[tuple[str, list[tuple]]], *tables: str) -> int:
+        """
+        Run (sql, [params, ...]) pairs with executemany in one transaction on
+        the primary; `tables` are the tables written. Returns the total number
+        of affected rows.
+        """
+        affected = 0
+        async with self._primary(*tables).acquire() as conn:
+            async with conn.cursor() as cur:
+                await conn.begin()
+                try:
+                    for sql, rows in statements:
+                        if rows:
+                            affected += await cur.executemany(sql, rows) or 0
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+        return affected
+
+    async def add_records(self, table: str, record_objs: list) -> int:
+        """
+        Insert many records into `table` in one transaction. Each object is
+        filtered like add_record; objects with the same set of fields are
+        sent together with executemany (a single multi-row INSERT).
+        Returns the number of inserted rows.
+        """
+        groups: dict[tuple, list[tuple]] = {}
+        for record_obj in record_objs:
+            data = self._record_fields(record_obj)
+            if not data:
+                raise ValueError("No data fields provided for insertion.")
+            groups.setdefault(tuple(data.keys()), []).append(tuple(data.values()))
+
+        statements = []
+        for columns, rows in groups.items():
+            column_list = ", ".join(f"`{col}`" for col in columns)
+            placeholders = ", ".join("%s" for _ in columns)
+            statements.append((f"INSERT INTO `{table}` ({column_list}) VALUES ({placeholders});", rows))
+        return await self._run_in_transaction(statements, table)
+
+    async def update_records_by_ids(self, table: str, updates: dict[int, dict]) -> int:
+        """
+        {id: new_values} -> UPDATE each row by primary key, in one transaction.
+        Only non-None values are applied; rows setting the same columns are
+        sent together with executemany.
+        """
+        groups: dict[tuple, list[tuple]] = {}
+        for row_id, new_values in updates.items():
+            filtered = {k: v for k, v in new_values.items() if v is not None}
+            if filtered:
+                groups.setdefault(tuple(filtered.keys()), []).append((*filtered.values(), row_id))
+
+        statements = []
+        for columns, rows in groups.items():
+            set_clause = ", ".join(f"`{k}`=%s" for k in columns)
+            statements.append((f"UPDATE `{table}` SET {set_clause} WHERE `id`=%s;", rows))
+        return await self._run_in_transaction(statements, table)
+
+    async def delete_where_in(self, table: str, column: str, values, conditions: dict = None) -> int:
+        """
+        DELETE FROM `table` WHERE `column` IN (values) [AND conditions],
+        chunked, in one transaction. Returns the number of deleted rows.
+        """
+        values = list(dict.fromkeys(values))
+        if not values:
+            return 0
+        extra = "".join(f" AND `{k}`=%s" for k in (conditions or {}))
+        extra_params = tuple((conditions or {}).values())
+
+        statements = []
+        for chunk in self._chunks(values, self.BULK_CHUNK_SIZE):
+            placeholders = ", ".join("%s" for _ in chunk)
+            sql = f"DELETE FROM `{table}` WHERE `{column}` IN ({placeholders}){extra};"
+            statements.append((sql, [(*chunk, *extra_params)]))
+        return await self._run_in_transaction(statements, table)
+
+    async def upsert_records(self, table: str, rows: list[dict], update_columns: list[str]) -> int:
+        """
+        Multi-row INSERT ... ON DUPLICATE KEY UPDATE: rows whose unique key
+        already exists get `update_columns` overwritten with the new values.
+        All rows must have the same keys.
+        """
+        if not rows:
+            return 0
+        if not update_columns:
+            raise ValueError("No columns provided for the update part of the upsert.")
+        columns = list(rows[0].keys())
+        column_list = ", ".join(f"`{col}`" for col in columns)
+        placeholders = ", ".join("%s" for _ in columns)
+        update_clause = ", ".join(f"`{col}`=VALUES(`{col}`)" for col in update_columns)
+        sql = (
+            f"INSERT INTO `{table}` ({column_list}) VALUES ({placeholders}) "
+            f"ON DUPLICATE KEY UPDATE {update_clause};"
+        )
+        return await self._run_in_transaction([(sql, [tuple(row[col] for col in columns) for row in rows])], table)
+
+    # ---------------------------------------------------------------------------
+    # Matching engine: commit one fill atomically
+    # ---------------------------------------------------------------------------
+
+    async def commit_fill(
+        self,
+        position_table: str,
+        position_obj,
+        order_table: str,
+        buyer_order_id: int,
+        seller_order_id: int,
+    ) -> tuple[dict, dict]:
+        """
+        Write a matched fill in one transaction on one connection:
+        insert the position, add its amount to `volume_filled` of both orders,
+        update both traders' `trader_exposure` totals and release their
+        frozen_pack by their hedged amount (min of short and long over
+        `positions`). Nothing is applied if any step fails; StaleFillError
+        if either order is gone or has less than the amount left.
+        Returns the created position row and a {trader_id: username} dict.
+        """
+        data = self._record_fields(position_obj)
+        amount = data["position_amount"]
+        trader_ids = (data["seller_id"], data["buyer_id"])
+        deltas = self._fill_deltas(position_table, data)
+
+        columns = ", ".join(f"`{col}`" for col in data.keys())
+        placeholders = ", ".join("%s" for _ in data)
+        insert_sql = f"INSERT INTO `{position_table}` ({columns}) VALUES ({placeholders});"
+        fill_sql = (
+            f"UPDATE `{order_table}` SET `volume_filled`=`volume_filled`+%s "
+            f"WHERE `id` IN (%s, %s) AND `order_amount`-`volume_filled`>=%s;"
+        )
+
+        async with self._primary(position_table, order_table, "trader_exposure", "app_users").acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await conn.begin()
+                try:
+                    await cur.execute(fill_sql, (amount, buyer_order_id, seller_order_id, amount))
+                    if cur.rowcount != 2:
+                        raise StaleFillError(
+                            f"{order_table} {buyer_order_id}/{seller_order_id} cannot be filled by {amount}"
+                        )
+                    await cur.execute(insert_sql, tuple(data.values()))
+                    position = self._build_record(position_table, data, cur.lastrowid)
+
+                    await cur.execute(
+                        "SELECT `trader_id`, `username`, `frozen_pack` FROM `app_users` "
+                        "WHERE `trader_id` IN (%s, %s) FOR UPDATE;",
+                        trader_ids,
+                    )
+                    traders = {row["trader_id"]: row for row in await cur.fetchall()}
+                    await cur.executemany(self._EXPOSURE_UPSERT_SQL, self._exposure_rows(deltas))
+
+                    exposure = {}
+                    if all(trader_id in self.exposure for trader_id in deltas):
+                        # this process is the only writer of trader_exposure, so the cache is current
+                        for trader_id, delta in deltas.items():
+                            exposure[trader_id] = self._add_exposure(self.exposure.get(trader_id), delta)
+                    else:
+                        await cur.execute(
+                            "SELECT `trader_id`, `long_amount`, `short_amount`, `open_order_volume` "
+                            "FROM `trader_exposure` WHERE `trader_id` IN (%s, %s);",
+                            trader_ids,
+                        )
+                        exposure = {row["trader_id"]: dict(row) for row in await cur.fetchall()}
+
+                    self._fill_frozen_pack(exposure, traders)
+                    await cur.executemany(
+                        "UPDATE `app_users` SET `frozen_pack`=%s WHERE `trader_id`=%s;",
+                        [(entry["frozen_pack"], trader_id) for trader_id, entry in exposure.items()],
+                    )
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+
+        return position, self._fill_committed(exposure, traders)
+
+    # The parts of commit_fill that do not depend on the storage, shared with
+    # common.memory_backend.
+
+    @staticmethod
+    def _fill_deltas(position_table: str, data: dict) -> dict[int, dict]:
+        """
+        trader_exposure deltas of one fill, keyed by trader_id.
+        """
+        amount = data["position_amount"]
+        trader_ids = (data["seller_id"], data["buyer_id"])
+        # only simple positions count towards the hedged amount, as before
+        counted = amount if position_table == "positions" else 0
+        deltas = {trader_id: {"long_amount": 0, "short_amount": 0, "open_order_volume": 0} for trader_id in trader_ids}
+        deltas[data["seller_id"]]["short_amount"] += counted
+        deltas[data["buyer_id"]]["long_amount"] += counted
+        for trader_id in trader_ids:
+            deltas[trader_id]["open_order_volume"] -= amount
+        return deltas
+
+    @staticmethod
+    def _add_exposure(entry: dict, delta: dict) -> dict:
+        for field, value in delta.items():
+            entry[field] = max(0, entry[field] + value)
+        return entry
+
+    @staticmethod
+    def _fill_frozen_pack(exposure: dict[int, dict], traders: dict[int, dict]) -> None:
+        """
+        Set each trader's new frozen_pack in `exposure`: the current one
+        (from `traders`, the app_users rows) less the hedged amount.
+        """
+        for trader_id, entry in exposure.items():
+            if trader_id not in traders:
+                raise ValueError(f"User {trader_id} not found.")
+            reduction_pack = int(min(entry["short_amount"], entry["long_amount"]))
+            entry["frozen_pack"] = max(0, traders[trader_id]["frozen_pack"] - reduction_pack)
+
+    def _fill_committed(self, exposure: dict[int, dict], traders: dict[int, dict]) -> dict:
+        """
+        Update the exposure, pack and name caches after the fill committed;
+        returns {trader_id: username}.
+        """
+        for trader_id, entry in exposure.items():
+            self.exposure.put(trader_id, entry)
+            self.packs.adjust(trader_id, entry["frozen_pack"] - traders[trader_id]["frozen_pack"])
+        names = {trader_id: row["username"] for trader_id, row in traders.items()}
+        for trader_id, name in names.items():
+            self.names.put(trader_id, name)
+        return names
+
+    async def release_frozen_pack(self, releases: dict[int, int]) -> None:
+        """
+        Subtract each trader's amount from frozen_pack (never below zero),
+        all in one transaction.
+        """
+        rows = [(amount, amount, trader_id) for trader_id, amount in releases.items() if amount > 0]
+        if not rows:
+            return
+        sql = (
+            "UPDATE `app_users` SET `frozen_pack`=IF(`frozen_pack`>%s, `frozen_pack`-%s, 0) "
+            "WHERE `trader_id`=%s;"
+        )
+        async with self._primary("app_users").acquire() as conn:
+            async with conn.cursor() as cur:
+                await conn.begin()
+                try:
+                    await cur.executemany(sql, rows)
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+        for _, amount, trader_id in rows:
+            self.exposure.apply(trader_id, frozen_pack=-amount)
+            self.packs.adjust(trader_id, -amount)
+
+    # ---------------------------------------------------------------------------
+    # Pack ledger storage (see common.pack_ledger)
+    # ---------------------------------------------------------------------------
+
+    async def load_packs(self, trader_id: int) -> dict | None:
+        sql = "SELECT `trade_pack`, `frozen_pack` FROM `app_users` WHERE `trader_id`=%s;"
+        async with self._pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(sql, (trader_id,))
+                return await cur.fetchone()
+
+    async def write_pack_updates(self, updates: list[tuple[str, int, int]]) -> list[int]:
+        """
+        Apply queued ledger updates ("reserve" | "release", trader_id, amount)
+        in one transaction. Reservations are conditional on the pack still
+        being available in MySQL; returns the indexes (into `updates`) of the
+        reservations that were rejected.
+        """
+        reserve_sql = (
+            "UPDATE `app_users` SET `frozen_pack`=`frozen_pack`+%s "
+            "WHERE `trader_id`=%s AND `trade_pack`-`frozen_pack`>=%s;"
+        )
+        release_sql = (
+            "UPDATE `app_users` SET `frozen_pack`=IF(`frozen_pack`>%s, `frozen_pack`-%s, 0) "
+            "WHERE `trader_id`=%s;"
+        )
+        rejected = []
+        async with self._primary("app_users").acquire() as conn:
+            async with conn.cursor() as cur:
+                await conn.begin()
+                try:
+                    for index, (kind, trader_id, amount) in enumerate(updates):
+                        if kind == "reserve":
+                            if not await cur.execute(reserve_sql, (amount, trader_id, amount)):
+                                rejected.append(index)
+                        else:
+                            await cur.execute(release_sql, (amount, amount, trader_id))
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+        skipped = set(rejected)
+        for index, (kind, trader_id, amount) in enumerate(updates):
+            if index not in skipped:
+                self.exposure.apply(trader_id, frozen_pack=amount if kind == "reserve" else -amount)
+        return rejected
+
+    # ---------------------------------------------------------------------------
+    # Per-trader exposure aggregates (trader_exposure)
+    # ---------------------------------------------------------------------------
+
+    _EXPOSURE_UPSERT_SQL = (
+        "INSERT INTO `trader_exposure` (`trader_id`, `long_amount`, `short_amount`, `open_order_volume`) "
+        "VALUES (%s, %s, %s, GREATEST(%s, 0)) "
+        "ON DUPLICATE KEY UPDATE `long_amount`=`long_amount`+%s, `short_amount`=`short_amount`+%s, "
+        "`open_order_volume`=GREATEST(`open_order_volume`+%s, 0);"
+    )
+
+    @staticmethod
+    def _exposure_rows(deltas: dict[int, dict]) -> list[tuple]:
+        rows = []
+        for trader_id, delta in deltas.items():
+            values = (delta.get("long_amount", 0), delta.get("short_amount", 0), delta.get("open_order_volume", 0))
+            rows.append((trader_id, *values, *values))
+        return rows
+
+    _EXPOSURE_BACKFILL_SQL = (
+        "INSERT INTO `trader_exposure` (`trader_id`, `long_amount`, `short_amount`, `open_order_volume`) "
+        "SELECT `trader_id`, SUM(`l`), SUM(`s`), SUM(`o`) FROM ("
+        "SELECT `buyer_id` AS `trader_id`, `position_amount` AS `l`, 0 AS `s`, 0 AS `o` FROM `positions` "
+        "UNION ALL SELECT `seller_id`, 0, `position_amount`, 0 FROM `positions` "
+        "UNION ALL SELECT `trader_id`, 0, 0, GREATEST(`order_amount`-`volume_filled`, 0) FROM `orders` "
+        "UNION ALL SELECT COALESCE(`buyer_id`, `seller_id`), 0, 0, "
+        "GREATEST(`order_amount`-`volume_filled`, 0) FROM `advance_orders`"
+        ") AS `t` WHERE `trader_id` IS NOT NULL GROUP BY `trader_id`;"
+    )
+
+    async def ensure_trader_exposure(self, rebuild: bool = False) -> None:
+        """
+        When `trader_exposure` (created by common.migrations) is empty, fill
+        it once from the full positions/orders history. After that the totals
+        are only changed incrementally by fills, new orders, cancels and expiries.
+        With `rebuild`, a non-empty table is recomputed as well
+        (see rebuild_trader_exposure).
+        """
+        if not rebuild:
+            async with self._pool.acquire() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cur:
+                    await cur.execute("SELECT COUNT(1) AS cnt FROM `trader_exposure`;")
+                    if (await cur.fetchone())["cnt"] > 0:
+                        return
+        await self.rebuild_trader_exposure()
+
+    async def rebuild_trader_exposure(self) -> None:
+        """
+        Recompute every trader's totals from positions and open orders and
+        replace the table contents in one transaction. Repairs drift left by
+        deltas that were lost (crashes between a write and its delta).
+        """
+        async with self._primary("trader_exposure").acquire() as conn:
+            async with conn.cursor() as cur:
+                await conn.begin()
+                try:
+                    await cur.execute("DELETE FROM `trader_exposure`;")
+                    await cur.execute(self._EXPOSURE_BACKFILL_SQL)
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+        self.exposure.invalidate()
+
+    async def get_exposure(self, trader_id: int) -> dict:
+        """
+        Running totals of a trader: long_amount, short_amount,
+        open_order_volume and frozen_pack. Served from the cache when possible.
+        """
+        entry = self.exposure.get(trader_id)
+        if entry is not None:
+            return entry
+        row = await self._load_exposure(trader_id)
+        if row is None:
+            return self._empty_exposure()
+        self.exposure.put(trader_id, row)
+        return self.exposure.get(trader_id)
+
+    async def _load_exposure(self, trader_id: int) -> dict | None:
+        sql = (
+            "SELECT u.`frozen_pack`, e.`long_amount`, e.`short_amount`, e.`open_order_volume` "
+            "FROM `app_users` AS u LEFT JOIN `trader_exposure` AS e ON e.`trader_id`=u.`trader_id` "
+            "WHERE u.`trader_id`=%s;"
+        )
+        async with self._pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(sql, (trader_id,))
+                return await cur.fetchone()
+
+    @staticmethod
+    def _empty_exposure() -> dict:
+        return {"long_amount": 0, "short_amount": 0, "open_order_volume": 0, "frozen_pack": 0}
+
+    async def adjust_open_order_volume(self, deltas: dict[int, int]) -> None:
+        """
+        Add each trader's delta to open_order_volume (never below zero):
+        positive when an order is accepted, negative when it is cancelled or expires.
+        """
+        deltas = {trader_id: delta for trader_id, delta in deltas.items() if trader_id is not None and delta}
+        if not deltas:
+            return
+        rows = self._exposure_rows({trader_id: {"open_order_volume": delta} for trader_id, delta in deltas.items()})
+        async with self._primary("trader_exposure").acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(self._EXPOSURE_UPSERT_SQL, rows)
+        for trader_id, delta in deltas.items():
+            self.exposure.apply(trader_id, open_order_volume=delta)
+
+
+    async def increment_user_field(self, trader_id: int, column: str, delta, cast=float) -> None:
+        """
+        Add delta to one app_users column of a trader in a transaction,
+        holding the row lock between read and write. Raises ValueError if the
+        trader does not exist.
+        """
+        async with self._primary("app_users").acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await conn.begin()
+                # Lock the row for update
+                await cur.execute(
+                    f"SELECT `{column}` FROM `app_users` WHERE `trader_id`=%s FOR UPDATE;",
+                    (trader_id,),
+                )
+                row = await cur.fetchone()
+                if not row:
+                    await conn.rollback()
+                    raise ValueError(f"User {trader_id} not found.")
+                new_value = cast(row[column]) + delta
+                await cur.execute(
+                    f"UPDATE `app_users` SET `{column}`=%s WHERE `trader_id`=%s;",
+                    (new_value, trader_id),
+                )
+                await conn.commit()
+
     # ---------------------------------------------------------------------------
     # Role/Access control methods
     # ---------------------------------------------------------------------------
@@ -135,13 +900,27 @@ class DataBase:
     async def get_access_level(self, user_id: int) -> int:
         """
         Returns the access_level of a user (or 0 if none found).
+        Results, including 0 for unknown users, are cached in `self.roles`.
         """
+        level = self.roles.get(user_id)
+        if level is not _MISSING:
+            return level
+
+        level = await self._load_access_level(user_id)
+        self.roles.put(user_id, level)
+        return level
+
+    async def _load_access_level(self, user_id: int) -> int:
         sql = "SELECT `access_level` FROM `app_users` WHERE `trader_id`=%s;"
-        async with self._pool.acquire() as conn:
-            async with conn.cursor(aiomysql.DictCursor) as cur:
-                await cur.execute(sql, (user_id,))
-                row = await cur.fetchone()
-                return int(row["access_level"]) if row else 0
+        row = await self._read("app_users", sql, (user_id,), one=True)
+        return int(row["access_level"]) if row else 0
+
+    async def get_role(self, user_id: int) -> str | None:
+        """
+        "user", "admin", "owner" or None for unknown users, from a single
+        (cached) access_level lookup.
+        """
+        return ROLES.get(await self.get_access_level(user_id))
 
     async def has_role(self, user_id: int, required_level: int) -> bool:
         level = await self.get_access_level(user_id)
@@ -162,13 +941,48 @@ class DataBase:
         Returns True if code is NOT already used (i.e., valid to assign).
         """
         sql = "SELECT COUNT(1) AS cnt FROM `app_users` WHERE `referral_code`=%s;"
-        async with self._pool.acquire() as conn:
+        async with self._reader("app_users").acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 await cur.execute(sql, (ref_code,))
                 row = await cur.fetchone()
                 # If count == 0, it's valid (no existing record has this code)
                 return row["cnt"] == 0  # True if not found
 
+    # ---------------------------------------------------------------------------
+    # Trader display names (cached)
+    # ---------------------------------------------------------------------------
+
+    async def get_names(self, trader_ids) -> dict[int, str | None]:
+        """
+        {trader_id: username} for all given ids. Cached names are served from
+        `self.names`; the rest are resolved with a single IN (...) query.
+        Unknown traders map to None.
+        """
+        names = {}
+        missing = []
+        for trader_id in dict.fromkeys(trader_ids):
+            name = self.names.get(trader_id)
+            if name is _MISSING:
+                missing.append(trader_id)
+            else:
+                names[trader_id] = name
+        if not missing:
+            return names
+
+        found = await self._load_names(missing)
+        for trader_id in missing:
+            names[trader_id] = found.get(trader_id)
+            self.names.put(trader_id, names[trader_id])
+        return names
+
+    async def _load_names(self, trader_ids: list[int]) -> dict[int, str]:
+        placeholders = ", ".join("%s" for _ in trader_ids)
+        sql = f"SELECT `trader_id`, `username` FROM `app_users` WHERE `trader_id` IN ({placeholders});"
+        async with self._reader("app_users").acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(sql, tuple(trader_ids))
+                return {row["trader_id"]: row["username"] for row in await cur.fetchall()}
+
     # ---------------------------------------------------------------------------
     # Utility: fetch single order by message_id
     # ---------------------------------------------------------------------------
@@ -179,11 +993,8 @@ class DataBase:
         Returns a dict if found, or None.
         """
         sql = f"SELECT * FROM `{table}` WHERE `message_id`=%s LIMIT 1;"
-        async with self._pool.acquire() as conn:
-            async with conn.cursor(aiomysql.DictCursor) as cur:
-                await cur.execute(sql, (message_id,))
-                row = await cur.fetchone()
-                return dict(row) if row else None
+        row = await self._read(table, sql, (message_id,), one=True)
+        return dict(row) if row else None
 
 
 # -------------------------------------------------------------------------------
@@ -206,13 +1017,11 @@ class Position:
         self.buyer_id = buyer_id
         self.position_amount = position_amount
         self.open_price = open_price
-        self.date = datetime.now().replace(microsecond=0).isoformat()
+        self.date = clock.now().replace(microsecond=0).isoformat()
         self.expiration_date = expiration_date
 
     async def add_record(self) -> dict:
-        last_id = await self.db.add_record("positions", self)
-        rows = await self.db.fetch_data("positions", {"id": last_id})
-        return rows[0] if rows else {}
+        return await self.db.add_record("positions", self, return_record=True)
 
     async def fetch_data(self, conditions: dict = None) -> list[dict]:
         return await self.db.fetch_data("positions", conditions)
@@ -238,14 +1047,12 @@ class AdvancePosition:
         self.position_amount = position_amount
         self.open_price = open_price
         self.close_price = close_price
-        self.date = datetime.now().replace(microsecond=0).isoformat()
+        self.date = clock.now().replace(microsecond=0).isoformat()
         self.expiration_date = expiration_date.isoformat()
 
 
     async def add_record(self) -> dict:
-        last_id = await self.db.add_record("advance_positions", self)
-        rows = await self.db.fetch_data("advance_positions", {"id": last_id})
-        return rows[0] if rows else {}
+        return await self.db.add_record("advance_positions", self, return_record=True)
 
     async def fetch_data(self, conditions: dict = None) -> list[dict]:
         return await self.db.fetch_data("advance_positions", conditions)
@@ -277,7 +1084,7 @@ class Order:
         self.volume_filled = volume_filled
 
         # Set date and compute expirations
-        self.date = date or datetime.now().replace(microsecond=0)
+        self.date = date or clock.now().replace(microsecond=0)
         self.expiration_order_time = (
             self.date + timedelta(minutes=1)
         ).replace(microsecond=0)
@@ -299,12 +1106,9 @@ class Order:
 
     async def add_record(self) -> dict | dict[Any, Any]:
         """
-        Inserts into the `orders` table. Returns None, since
-        existing logic didn’t use the returned ID.
+        Inserts into the `orders` table and returns the inserted row.
         """
-        last_id = await self.db.add_record("orders", self)
-        rows = await self.db.fetch_data("orders", {"id": last_id})
-        return rows[0] if rows else {}
+        return await self.db.add_record("orders", self, return_record=True)
 
     async def fetch_data(self, conditions: dict = None) -> list[dict]:
         return await self.db.fetch_data("orders", conditions)
@@ -340,7 +1144,7 @@ class AdvanceOrder:
         self.order_amount = order_amount
         self.volume_filled = volume_filled
 
-        self.date = date or datetime.now().replace(microsecond=0)
+        self.date = date or clock.now().replace(microsecond=0)
         self.expiration_order_time = (
             self.date + timedelta(minutes=1)
         ).replace(microsecond=0)
@@ -361,9 +1165,7 @@ class AdvanceOrder:
         self.expiration_date = self.expiration_date.isoformat()
 
     async def add_record(self) -> dict | dict[Any, Any]:
-        last_id = await self.db.add_record("advance_orders", self)
-        rows = await self.db.fetch_data("advance_orders", {"id": last_id})
-        return rows[0] if rows else {}
+        return await self.db.add_record("advance_orders", self, return_record=True)
 
     async def fetch_data(self, conditions: dict = None) -> list[dict]:
         return await self.db.fetch_data("advance_orders", conditions)
@@ -398,9 +1200,7 @@ class OrderHistory:
         self.leverage = leverage
 
     async def add_record(self) -> dict | dict[Any, Any]:
-        last_id = await self.db.add_record("order_history", self)
-        rows = await self.db.fetch_data("order_history", {"id": last_id})
-        return rows[0] if rows else {}
+        return await self.db.add_record("order_history", self, return_record=True)
 
     async def fetch_data(self, conditions: dict = None) -> list[dict]:
         return await self.db.fetch_data("order_history", conditions)
@@ -444,12 +1244,16 @@ class User:
 
     async def add_record(self) -> None:
         await self.db.add_record("app_users", self)
+        self.db.names.invalidate(self.trader_id)
+        self.db.roles.invalidate(self.trader_id)
 
     async def fetch_data(self, conditions: dict = None) -> list[dict]:
         return await self.db.fetch_data("app_users", conditions)
 
     async def delete_record(self, conditions: dict) -> None:
         await self.db.delete_record("app_users", conditions)
+        self.db.names.invalidate(conditions.get("trader_id"))
+        self.db.roles.invalidate(conditions.get("trader_id"))
 
     async def update_record(self, conditions: dict) -> None:
         info = {
@@ -463,57 +1267,30 @@ class User:
             "frozen_pack": self.frozen_pack,
         }
         await self.db.update_record("app_users", conditions, info)
+        if self.frozen_pack is not None and "trader_id" in conditions:
+            self.db.exposure.set_frozen(conditions["trader_id"], self.frozen_pack)
+        if self.frozen_pack is not None or self.trade_pack is not None:
+            self.db.packs.invalidate(conditions.get("trader_id"))
+        if self.username is not None:
+            self.db.names.invalidate(conditions.get("trader_id"))
+        if self.access_level is not None:
+            self.db.roles.invalidate(conditions.get("trader_id"))
 
     async def update_margin(self, trader_id: int, delta: float) -> None:
         """
-        Atomically update margin by adding delta. Fetches current margin,
-        calculates new value, and updates the row. Uses a transaction to
-        avoid race conditions.
+        Atomically update margin by adding delta (see DataBase.increment_user_field).
         """
-        async with self.db._pool.acquire() as conn:
-            async with conn.cursor(aiomysql.DictCursor) as cur:
-                await conn.begin()
-                # Lock the row for update
-                await cur.execute(
-                    "SELECT `margin` FROM `app_users` WHERE `trader_id`=%s FOR UPDATE;",
-                    (trader_id,),
-                )
-                row = await cur.fetchone()
-                if not row:
-                    await conn.rollback()
-                    raise ValueError(f"User {trader_id} not found.")
-                new_margin = float(row["margin"]) + delta
-                await cur.execute(
-                    "UPDATE `app_users` SET `margin`=%s WHERE `trader_id`=%s;",
-                    (new_margin, trader_id),
-                )
-                await conn.commit()
+        await self.db.increment_user_field(trader_id, "margin", delta, float)
 
     async def update_trade_pack(self, trader_id: int, pack_delta: int) -> None:
         """
         Atomically update trade_pack by adding pack_delta. Uses row-level lock.
         """
-        async with self.db._pool.acquire() as conn:
-            async with conn.cursor(aiomysql.DictCursor) as cur:
-                await conn.begin()
-                await cur.execute(
-                    "SELECT `trade_pack` FROM `app_users` WHERE `trader_id`=%s FOR UPDATE;",
-                    (trader_id,),
-                )
-                row = await cur.fetchone()
-                if not row:
-                    await conn.rollback()
-                    raise ValueError(f"User {trader_id} not found.")
-                new_pack = int(row["trade_pack"]) + pack_delta
-                await cur.execute(
-                    "UPDATE `app_users` SET `trade_pack`=%s WHERE `trader_id`=%s;",
-                    (new_pack, trader_id),
-                )
-                await conn.commit()
+        await self.db.increment_user_field(trader_id, "trade_pack", pack_delta, int)
+        self.db.packs.invalidate(trader_id)
 
     async def get_name(self, trader_id: int) -> str | None:
-        rows = await self.db.fetch_data("app_users", {"trader_id": trader_id})
-        return rows[0]["username"] if rows else None
+        return (await self.db.get_names([trader_id]))[trader_id]
 
 
 class ReplyChain:
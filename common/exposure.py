@@ -0,0 +1,42 @@
+EXPOSURE_FIELDS = ("long_amount", "short_amount", "open_order_volume", "frozen_pack")
+
+
+class ExposureCache:
+    """
+    In-process copy of the per-trader running totals kept in `trader_exposure`
+    (plus the trader's last known frozen_pack from app_users).
+    Entries are only written after the transaction that changed the row has
+    committed, so a cached entry never shows uncommitted state. Deltas for
+    traders that are not cached are ignored; the next read loads them.
+    """
+
+    def __init__(self):
+        self._entries: dict[int, dict] = {}
+
+    def __contains__(self, trader_id: int) -> bool:
+        return trader_id in self._entries
+
+    def get(self, trader_id: int) -> dict | None:
+        entry = self._entries.get(trader_id)
+        return dict(entry) if entry is not None else None
+
+    def put(self, trader_id: int, row: dict) -> None:
+        self._entries[trader_id] = {field: int(row.get(field) or 0) for field in EXPOSURE_FIELDS}
+
+    def apply(self, trader_id: int, **deltas: int) -> None:
+        entry = self._entries.get(trader_id)
+        if entry is None:
+            return
+        for field, delta in deltas.items():
+            entry[field] = max(0, entry[field] + delta)
+
+    def set_frozen(self, trader_id: int, frozen_pack: int) -> None:
+        entry = self._entries.get(trader_id)
+        if entry is not None:
+            entry["frozen_pack"] = int(frozen_pack)
+
+    def invalidate(self, trader_id: int | None = None) -> None:
+        if trader_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(trader_id, None)
@@ -0,0 +1,378 @@
+"""
+Pure in-memory DataBase, for load tests of the bot layer and the benchmarks.
+
+Each table is a dict {primary key: row}; rows are built with
+DataBase._build_record, so they look like the rows aiomysql returns
+(DATETIME columns as datetime, booleans as ints) and the bot code runs
+unchanged on top of it. Equality lookups on the columns in
+common.migrations.HOT_PATH_INDEXES go through secondary indexes instead of
+scanning the table. An optional per-call latency simulates a storage round
+trip. Nothing is persisted.
+"""
+import asyncio
+from datetime import datetime
+
+from common.database import DATETIME_COLUMNS, DataBase, StaleFillError
+from common.migrations import HOT_PATH_INDEXES
+
+# tables whose primary key is not `id`
+PRIMARY_KEYS = {"trader_exposure": "trader_id"}
+
+# table -> columns with a secondary index (leading column of each hot path index)
+INDEXED_COLUMNS: dict[str, set[str]] = {}
+for _index in HOT_PATH_INDEXES:
+    INDEXED_COLUMNS.setdefault(_index.table, set()).add(_index.columns[0])
+
+
+class InMemoryDataBase(DataBase):
+    """
+    DataBase implementation over process memory. `latency` (seconds) is
+    awaited once per storage call when set; with 0 no call yields to the
+    event loop, which keeps benchmark runs deterministic.
+    Only storage primitives are overridden: the fill computation and the
+    exposure, role and name caches in front of them are DataBase's own.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(pool=None)
+        self.dialect = "memory"
+        self.latency = latency
+        self.tables: dict[str, dict] = {}
+        self._next_id: dict[str, int] = {}
+        # (table, column) -> value -> {primary key: None}, in insertion order
+        self._indexes: dict[tuple[str, str], dict] = {}
+
+    async def close_pool(self):
+        await self.packs.close()
+
+    async def _io(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    # ------------------------------------------------------------
+    # storage primitives
+    # ------------------------------------------------------------
+    def _table(self, table: str) -> dict:
+        rows = self.tables.get(table)
+        if rows is None:
+            rows = self.tables[table] = {}
+            for column in INDEXED_COLUMNS.get(table, ()):
+                self._indexes[(table, column)] = {}
+        return rows
+
+    def _index_add(self, table: str, key, row: dict, columns=None) -> None:
+        for column in columns or INDEXED_COLUMNS.get(table, ()):
+            index = self._indexes.get((table, column))
+            if index is not None:
+                index.setdefault(row.get(column), {})[key] = None
+
+    def _index_remove(self, table: str, key, row: dict, columns=None) -> None:
+        for column in columns or INDEXED_COLUMNS.get(table, ()):
+            index = self._indexes.get((table, column))
+            if index is None:
+                continue
+            keys = index.get(row.get(column))
+            if keys is not None:
+                keys.pop(key, None)
+                if not keys:
+                    del index[row.get(column)]
+
+    def _insert(self, table: str, data: dict) -> dict:
+        rows = self._table(table)
+        primary_key = PRIMARY_KEYS.get(table)
+        if primary_key is None:
+            row_id = self._next_id.get(table, 1)
+            self._next_id[table] = row_id + 1
+            row = self._build_record(table, data, row_id)
+            key = row_id
+        else:
+            row = self._build_record(table, data, None)
+            del row["id"]
+            key = row[primary_key]
+        rows[key] = row
+        self._index_add(table, key, row)
+        return row
+
+    def _update_row(self, table: str, key, row: dict, new_values: dict) -> None:
+        indexed = [col for col in new_values if col in INDEXED_COLUMNS.get(table, ())]
+        if indexed:
+            self._index_remove(table, key, row, indexed)
+        row.update(new_values)
+        if indexed:
+            self._index_add(table, key, row, indexed)
+
+    def _delete_row(self, table: str, key) -> None:
+        row = self.tables[table].pop(key)
+        self._index_remove(table, key, row)
+
+    @staticmethod
+    def _normalize(conditions: dict | None) -> dict:
+        # MySQL compares DATETIME columns with ISO strings too
+        normalized = {}
+        for column, value in (conditions or {}).items():
+            if column in DATETIME_COLUMNS and isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            normalized[column] = value
+        return normalized
+
+    def _select(self, table: str, conditions: dict | None) -> list[tuple]:
+        """
+        (key, row) pairs matching all conditions, in insertion order.
+        """
+        rows = self._table(table)
+        conditions = self._normalize(conditions)
+        candidates = None
+        for column, value in conditions.items():
+            index = self._indexes.get((table, column))
+            if index is not None:
+                keys = index.get(value, {})
+                if candidates is None or len(keys) < len(candidates):
+                    candidates = keys
+        if candidates is None:
+            pairs = rows.items()
+        else:
+            pairs = [(key, rows[key]) for key in candidates]
+        return [
+            (key, row) for key, row in pairs
+            if all(row.get(column) == value for column, value in conditions.items())
+        ]
+
+    def _find(self, table: str, conditions: dict) -> dict | None:
+        matches = self._select(table, conditions)
+        return matches[0][1] if matches else None
+
+    # ------------------------------------------------------------
+    # DataBase interface
+    # ------------------------------------------------------------
+    async def add_record(self, table: str, record_obj, return_record: bool = False) -> int | dict:
+        data = self._record_fields(record_obj)
+        if not data:
+            raise ValueError("No data fields provided for insertion.")
+        await self._io()
+        row = self._insert(table, data)
+        return dict(row) if return_record else row.get("id")
+
+    async def fetch_data(
+        self, table: str, conditions: dict = None, columns: list[str] = None, order_by=None, limit: int = None
+    ) -> list[dict]:
+        await self._io()
+        rows = [row for _, row in self._select(table, conditions)]
+        if isinstance(order_by, str):
+            order_by = [order_by]
+        for col in reversed(order_by or []):
+            rows.sort(key=lambda row: row[col.lstrip("-")], reverse=col.startswith("-"))
+        if limit is not None:
+            rows = rows[:limit]
+        if columns:
+            return [{col: row[col] for col in columns} for row in rows]
+        return [dict(row) for row in rows]
+
+    async def iter_data(self, table: str, conditions: dict = None, columns: list[str] = None, order_by=None, batch_size: int = 500):
+        for row in await self.fetch_data(table, conditions, columns, order_by):
+            yield row
+
+    async def update_record(self, table: str, conditions: dict, new_values: dict) -> None:
+        filtered = {k: v for k, v in new_values.items() if v is not None}
+        if not filtered:
+            return
+        await self._io()
+        for key, row in self._select(table, conditions):
+            self._update_row(table, key, row, filtered)
+
+    async def delete_record(self, table: str, conditions: dict) -> None:
+        await self._io()
+        for key, _ in self._select(table, conditions):
+            self._delete_row(table, key)
+
+    async def add_records(self, table: str, record_objs: list) -> int:
+        datas = [self._record_fields(record_obj) for record_obj in record_objs]
+        if not all(datas):
+            raise ValueError("No data fields provided for insertion.")
+        await self._io()
+        for data in datas:
+            self._insert(table, data)
+        return len(datas)
+
+    async def update_records_by_ids(self, table: str, updates: dict[int, dict]) -> int:
+        await self._io()
+        rows = self._table(table)
+        affected = 0
+        for row_id, new_values in updates.items():
+            filtered = {k: v for k, v in new_values.items() if v is not None}
+            if filtered and row_id in rows:
+                self._update_row(table, row_id, rows[row_id], filtered)
+                affected += 1
+        return affected
+
+    async def delete_where_in(self, table: str, column: str, values, conditions: dict = None) -> int:
+        await self._io()
+        deleted = 0
+        for value in dict.fromkeys(values):
+            for key, _ in self._select(table, {**(conditions or {}), column: value}):
+                self._delete_row(table, key)
+                deleted += 1
+        return deleted
+
+    async def upsert_records(self, table: str, rows: list[dict], update_columns: list[str]) -> int:
+        # only the primary key is treated as the unique key
+        if not rows:
+            return 0
+        if not update_columns:
+            raise ValueError("No columns provided for the update part of the upsert.")
+        await self._io()
+        existing = self._table(table)
+        primary_key = PRIMARY_KEYS.get(table, "id")
+        for data in rows:
+            key = data.get(primary_key)
+            if key in existing:
+                self._update_row(table, key, existing[key], {col: data[col] for col in update_columns})
+            else:
+                self._insert(table, data)
+        return len(rows)
+
+    # ------------------------------------------------------------
+    # matching engine, packs and exposure
+    # ------------------------------------------------------------
+    def _exposure_row(self, trader_id: int) -> dict:
+        row = self._table("trader_exposure").get(trader_id)
+        if row is None:
+            row = self._insert(
+                "trader_exposure",
+                {"trader_id": trader_id, "long_amount": 0, "short_amount": 0, "open_order_volume": 0},
+            )
+        return row
+
+    async def commit_fill(self, position_table, position_obj, order_table, buyer_order_id, seller_order_id):
+        # same computation as DataBase.commit_fill; everything is checked before the first write,
+        # so a failure leaves the tables untouched like the rolled-back transaction
+        data = self._record_fields(position_obj)
+        amount = data["position_amount"]
+        deltas = self._fill_deltas(position_table, data)
+        await self._io()
+
+        traders = {}
+        exposure = {}
+        for trader_id, delta in deltas.items():
+            user = self._find("app_users", {"trader_id": trader_id})
+            if user is not None:
+                traders[trader_id] = dict(user)
+            current = self._table("trader_exposure").get(trader_id) or self._empty_exposure()
+            exposure[trader_id] = self._add_exposure(
+                {field: current[field] for field in ("long_amount", "short_amount", "open_order_volume")}, delta
+            )
+        self._fill_frozen_pack(exposure, traders)
+        orders = self._table(order_table)
+        fill_ids = {buyer_order_id, seller_order_id}
+        if len(fill_ids) != 2 or any(
+            order_id not in orders or orders[order_id]["order_amount"] - orders[order_id]["volume_filled"] < amount
+            for order_id in fill_ids
+        ):
+            raise StaleFillError(f"{order_table} {buyer_order_id}/{seller_order_id} cannot be filled by {amount}")
+
+        position = dict(self._insert(position_table, data))
+        for order_id in fill_ids:
+            orders[order_id]["volume_filled"] += amount
+        for trader_id, entry in exposure.items():
+            row = self._exposure_row(trader_id)
+            for field in ("long_amount", "short_amount", "open_order_volume"):
+                row[field] = entry[field]
+            self._find("app_users", {"trader_id": trader_id})["frozen_pack"] = entry["frozen_pack"]
+        return position, self._fill_committed(exposure, traders)
+
+    async def release_frozen_pack(self, releases: dict[int, int]) -> None:
+        await self._io()
+        for trader_id, amount in releases.items():
+            user = self._find("app_users", {"trader_id": trader_id}) if amount > 0 else None
+            if user is not None:
+                user["frozen_pack"] = max(0, user["frozen_pack"] - amount)
+                self.exposure.apply(trader_id, frozen_pack=-amount)
+                self.packs.adjust(trader_id, -amount)
+
+    async def load_packs(self, trader_id: int) -> dict | None:
+        rows = await self.fetch_data("app_users", {"trader_id": trader_id}, columns=["trade_pack", "frozen_pack"])
+        return rows[0] if rows else None
+
+    async def write_pack_updates(self, updates: list[tuple[str, int, int]]) -> list[int]:
+        await self._io()
+        rejected = []
+        for index, (kind, trader_id, amount) in enumerate(updates):
+            user = self._find("app_users", {"trader_id": trader_id})
+            if user is None:
+                if kind == "reserve":
+                    rejected.append(index)
+                continue
+            if kind == "reserve":
+                if user["trade_pack"] - user["frozen_pack"] < amount:
+                    rejected.append(index)
+                    continue
+                user["frozen_pack"] += amount
+            else:
+                user["frozen_pack"] = max(0, user["frozen_pack"] - amount)
+            self.exposure.apply(trader_id, frozen_pack=amount if kind == "reserve" else -amount)
+        return rejected
+
+    async def ensure_trader_exposure(self, rebuild: bool = False) -> None:
+        if rebuild or not self._table("trader_exposure"):
+            await self.rebuild_trader_exposure()
+
+    async def rebuild_trader_exposure(self) -> None:
+        await self._io()
+        self._table("trader_exposure").clear()
+        for position in self._table("positions").values():
+            self._exposure_row(position["buyer_id"])["long_amount"] += position["position_amount"]
+            self._exposure_row(position["seller_id"])["short_amount"] += position["position_amount"]
+        for order_table in ("orders", "advance_orders"):
+            for order in self._table(order_table).values():
+                trader_id = order["trader_id"] if order_table == "orders" else order["buyer_id"] or order["seller_id"]
+                if trader_id is not None:
+                    exposure = self._exposure_row(trader_id)
+                    exposure["open_order_volume"] += max(0, order["order_amount"] - order["volume_filled"])
+        self.exposure.invalidate()
+
+    async def _load_exposure(self, trader_id: int) -> dict | None:
+        await self._io()
+        user = self._find("app_users", {"trader_id": trader_id})
+        if user is None:
+            return None
+        return {**self._exposure_row(trader_id), "frozen_pack": user["frozen_pack"]}
+
+    async def adjust_open_order_volume(self, deltas: dict[int, int]) -> None:
+        await self._io()
+        for trader_id, delta in deltas.items():
+            if trader_id is not None and delta:
+                exposure = self._exposure_row(trader_id)
+                exposure["open_order_volume"] = max(0, exposure["open_order_volume"] + delta)
+                self.exposure.apply(trader_id, open_order_volume=delta)
+
+    async def increment_user_field(self, trader_id: int, column: str, delta, cast=float) -> None:
+        await self._io()
+        user = self._find("app_users", {"trader_id": trader_id})
+        if user is None:
+            raise ValueError(f"User {trader_id} not found.")
+        user[column] = cast(user[column]) + delta
+
+    # ------------------------------------------------------------
+    # roles, names, lookups
+    # ------------------------------------------------------------
+    async def _load_access_level(self, user_id: int) -> int:
+        await self._io()
+        user = self._find("app_users", {"trader_id": user_id})
+        return int(user["access_level"]) if user else 0
+
+    async def is_valid_referral_code(self, ref_code: str) -> bool:
+        await self._io()
+        return self._find("app_users", {"referral_code": ref_code}) is None
+
+    async def _load_names(self, trader_ids: list[int]) -> dict[int, str]:
+        await self._io()
+        names = {}
+        for trader_id in trader_ids:
+            user = self._find("app_users", {"trader_id": trader_id})
+            if user is not None:
+                names[trader_id] = user["username"]
+        return names
+
+    async def get_order_by_message_id(self, table: str, message_id: int) -> dict | None:
+        await self._io()
+        row = self._find(table, {"message_id": message_id})
+        return dict(row) if row else None
@@ -0,0 +1,313 @@
+import asyncio
+import bisect
+import heapq
+import json
+import re
+import time
+
+
+def _geometric(start: float, factor: float, count: int) -> list[float]:
+    bounds = [start]
+    for _ in range(count - 1):
+        bounds.append(bounds[-1] * factor)
+    return bounds
+
+
+# 0.05 ms .. ~100 s
+LATENCY_BOUNDS = _geometric(0.00005, 1.25, 66)
+# 1 .. ~1M rows
+ROW_BOUNDS = _geometric(1, 2, 21)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram; percentiles are the upper bound of the bucket
+    that holds them (capped by the largest observed value).
+    """
+
+    def __init__(self, bounds: list[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = self.bounds[index] if index < len(self.bounds) else self.max
+                return min(bound, self.max)
+        return self.max
+
+
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE(?: IF NOT EXISTS)?)\s+`?(\w+)`?", re.IGNORECASE)
+
+
+def classify(sql: str) -> tuple[str, str]:
+    """
+    (table, operation) of a statement, e.g. ("orders", "SELECT").
+    """
+    operation = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "-"
+    match = _TABLE_RE.search(sql)
+    return (match.group(1) if match else "-"), operation
+
+
+class QueryMetrics:
+    """
+    In-process statistics for DataBase: pool acquire wait, statement
+    execution time and row count per (table, operation), the slowest
+    statements seen, and free-form timers (e.g. group message handling).
+    """
+
+    def __init__(self, slowest: int = 20):
+        self.stats: dict[tuple[str, str], dict[str, Histogram]] = {}
+        self.timers: dict[str, Histogram] = {}
+        self._slowest_size = slowest
+        self._slowest: list[tuple[float, int, str, str]] = []
+        self._seq = 0
+        self.pool_waiting = 0
+        # reads answered by joining an identical in-flight query (DataBase._read)
+        self.coalesced = 0
+        self.started = time.time()
+
+    def record(self, table: str, operation: str, wait: float | None, elapsed: float, rows: int, sql: str):
+        stats = self.stats.get((table, operation))
+        if stats is None:
+            stats = self.stats[(table, operation)] = {
+                "wait": Histogram(LATENCY_BOUNDS),
+                "exec": Histogram(LATENCY_BOUNDS),
+                "rows": Histogram(ROW_BOUNDS),
+            }
+        if wait is not None:
+            stats["wait"].observe(wait)
+        stats["exec"].observe(elapsed)
+        if rows >= 0:
+            stats["rows"].observe(rows)
+
+        self._seq += 1
+        item = (elapsed, self._seq, " ".join(sql.split())[:300], time.strftime("%H:%M:%S"))
+        if len(self._slowest) < self._slowest_size:
+            heapq.heappush(self._slowest, item)
+        elif elapsed > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def observe(self, name: str, seconds: float) -> None:
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = Histogram(LATENCY_BOUNDS)
+        timer.observe(seconds)
+
+    def reset(self) -> None:
+        self.__init__(self._slowest_size)
+
+    # ------------------------------------------------------------
+    @staticmethod
+    def _latency(histogram: Histogram) -> dict:
+        return {
+            "count": histogram.count,
+            "p50_ms": round(histogram.percentile(50) * 1000, 3),
+            "p95_ms": round(histogram.percentile(95) * 1000, 3),
+            "p99_ms": round(histogram.percentile(99) * 1000, 3),
+            "max_ms": round(histogram.max * 1000, 3),
+        }
+
+    def snapshot(self) -> dict:
+        queries = []
+        for (table, operation), stats in sorted(self.stats.items()):
+            rows = stats["rows"]
+            queries.append({
+                "table": table,
+                "operation": operation,
+                "exec": self._latency(stats["exec"]),
+                "wait": self._latency(stats["wait"]),
+                "rows_avg": round(rows.total / rows.count, 1) if rows.count else 0,
+                "rows_max": int(rows.max),
+            })
+        return {
+            "uptime_s": round(time.time() - self.started),
+            "pool_waiting": self.pool_waiting,
+            "coalesced_reads": self.coalesced,
+            "queries": queries,
+            "timers": {name: self._latency(h) for name, h in sorted(self.timers.items())},
+            "slowest": [
+                {"ms": round(elapsed * 1000, 3), "at": at, "sql": sql}
+                for elapsed, _, sql, at in sorted(self._slowest, reverse=True)
+            ],
+        }
+
+    def render_text(self, slowest: int = 5) -> str:
+        snapshot = self.snapshot()
+        lines = [
+            f"uptime {snapshot['uptime_s']}s, waiting for pool: {snapshot['pool_waiting']}, "
+            f"coalesced reads: {snapshot['coalesced_reads']}",
+            "",
+        ]
+        lines.append("table/op  count  exec p50/p95/p99 ms  wait p99 ms  rows avg")
+        for q in sorted(snapshot["queries"], key=lambda q: -q["exec"]["p99_ms"]):
+            e, w = q["exec"], q["wait"]
+            lines.append(
+                f"{q['table']}/{q['operation']}  {e['count']}  "
+                f"{e['p50_ms']}/{e['p95_ms']}/{e['p99_ms']}  {w['p99_ms']}  {q['rows_avg']}"
+            )
+        if snapshot["timers"]:
+            lines.append("")
+            for name, t in snapshot["timers"].items():
+                lines.append(f"{name}  {t['count']}  {t['p50_ms']}/{t['p95_ms']}/{t['p99_ms']}")
+        if snapshot["slowest"]:
+            lines.append("")
+            lines.append("slowest:")
+            for s in snapshot["slowest"][:slowest]:
+                lines.append(f"{s['ms']} ms @{s['at']}: {s['sql']}")
+        return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# aiomysql pool wrapper
+# ---------------------------------------------------------------------------
+
+class _InstrumentedCursor:
+    def __init__(self, cursor, connection: "_InstrumentedConnection"):
+        self._cursor = cursor
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def _timed(self, method, sql: str, args):
+        started = time.perf_counter()
+        try:
+            return await method(sql, args)
+        finally:
+            elapsed = time.perf_counter() - started
+            table, operation = classify(sql)
+            rowcount = self._cursor.rowcount
+            self._connection.metrics.record(
+                table, operation, self._connection.take_wait(), elapsed,
+                rowcount if isinstance(rowcount, int) else -1, sql,
+            )
+
+    async def execute(self, sql: str, args=None):
+        return await self._timed(self._cursor.execute, sql, args)
+
+    async def executemany(self, sql: str, args):
+        return await self._timed(self._cursor.executemany, sql, args)
+
+
+class _CursorContext:
+    def __init__(self, connection: "_InstrumentedConnection", args):
+        self._connection = connection
+        self._args = args
+        self._context = None
+
+    async def __aenter__(self):
+        self._context = self._connection.raw.cursor(*self._args)
+        return _InstrumentedCursor(await self._context.__aenter__(), self._connection)
+
+    async def __aexit__(self, *exc):
+        return await self._context.__aexit__(*exc)
+
+
+class _InstrumentedConnection:
+    def __init__(self, connection, metrics: QueryMetrics, wait: float):
+        self.raw = connection
+        self.metrics = metrics
+        self._wait = wait
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def take_wait(self) -> float | None:
+        # the pool wait is attributed to the first statement run on the connection
+        wait, self._wait = self._wait, None
+        return wait
+
+    def cursor(self, *args):
+        return _CursorContext(self, args)
+
+
+class _AcquireContext:
+    def __init__(self, pool: "InstrumentedPool"):
+        self._pool = pool
+        self._context = None
+        self._connection = None
+
+    async def __aenter__(self):
+        metrics = self._pool.metrics
+        started = time.perf_counter()
+        metrics.pool_waiting += 1
+        try:
+            self._context = self._pool.raw.acquire()
+            connection = await self._context.__aenter__()
+        finally:
+            metrics.pool_waiting -= 1
+        self._connection = _InstrumentedConnection(connection, metrics, time.perf_counter() - started)
+        return self._connection
+
+    async def __aexit__(self, *exc):
+        wait = self._connection.take_wait()
+        if wait is not None:
+            self._pool.metrics.record("-", "ACQUIRE", wait, 0.0, -1, "")
+        return await self._context.__aexit__(*exc)
+
+
+class InstrumentedPool:
+    """
+    Wraps an aiomysql pool so every acquire/execute through it is recorded in
+    a QueryMetrics; everything else is passed through unchanged.
+    """
+
+    def __init__(self, pool, metrics: QueryMetrics):
+        self.raw = pool
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def acquire(self):
+        return _AcquireContext(self)
+
+
+# ---------------------------------------------------------------------------
+# optional local HTTP endpoint
+# ---------------------------------------------------------------------------
+
+async def start_metrics_server(metrics: QueryMetrics, port: int, host: str = "127.0.0.1"):
+    """
+    Minimal HTTP server: GET /metrics.json returns the snapshot as JSON, any
+    other path the text report. Bind to localhost only.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            path = parts[1] if len(parts) > 1 else "/"
+            if path.endswith(".json"):
+                body = json.dumps(metrics.snapshot(), ensure_ascii=False).encode("utf-8")
+                content_type = "application/json"
+            else:
+                body = metrics.render_text(slowest=20).encode("utf-8")
+                content_type = "text/plain; charset=utf-8"
+            writer.write(
+                f"HTTP/1.0 200 OK\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
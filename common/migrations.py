@@ -0,0 +1,315 @@
+"""
+Versioned schema migrations, run at startup from main.py.
+
+Each migration is a list of steps: a SQL statement, or an Index that is
+created only if the table does not have an index with that name yet.
+MySQL commits DDL implicitly, so every step is idempotent and a migration
+that was interrupted half-way is simply run again. Applied versions are
+recorded in `schema_migrations`. A unique index is not created over
+duplicate rows: the migration stops with a MigrationError naming them, so
+they can be merged by hand before it is run again.
+
+The DDL is written for MySQL; on the SQLite backend the pool translates it
+(see common.sqlite_backend.translate) and index lookups / EXPLAIN use the
+SQLite catalog instead of information_schema.
+"""
+import logging
+from typing import NamedTuple
+
+import aiomysql
+
+from common.database import DataBase
+
+logger = logging.getLogger(__name__)
+
+
+class MigrationError(RuntimeError):
+    """
+    A migration step cannot be applied to the data currently in the database.
+    """
+
+
+class Index(NamedTuple):
+    table: str
+    name: str
+    columns: tuple[str, ...]
+    unique: bool = False
+
+
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS `app_users` (
+        `id` INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        `trader_id` BIGINT NOT NULL,
+        `username` VARCHAR(255) NULL,
+        `register_date` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        `margin` DOUBLE NULL,
+        `access_level` INT NOT NULL DEFAULT 1,
+        `referral_code` VARCHAR(64) NOT NULL,
+        `parent_id` BIGINT NULL,
+        `children` INT NULL,
+        `frozen_pack` INT NOT NULL DEFAULT 0,
+        `trade_pack` INT NOT NULL DEFAULT 0,
+        `card_number` VARCHAR(64) NULL,
+        `wallet_address` VARCHAR(255) NULL
+    ) CHARACTER SET utf8mb4;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS `orders` (
+        `id` INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        `trader_id` BIGINT NOT NULL,
+        `message_id` BIGINT NOT NULL,
+        `trade_type` BOOLEAN NOT NULL,
+        `date` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        `order_price` INT NOT NULL,
+        `take_profit` INT NULL,
+        `stop_loss` INT NULL,
+        `expiration_order_time` DATETIME NOT NULL,
+        `expiration_date` DATETIME NOT NULL,
+        `order_amount` INT NOT NULL,
+        `volume_filled` INT NOT NULL DEFAULT 0
+    ) CHARACTER SET utf8mb4;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS `advance_orders` (
+        `id` INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        `seller_id` BIGINT NULL,
+        `buyer_id` BIGINT NULL,
+        `message_id` BIGINT NOT NULL,
+        `date` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        `open_price` INT NOT NULL,
+        `close_price` INT NOT NULL,
+        `expiration_order_time` DATETIME NOT NULL,
+        `expiration_date` DATETIME NOT NULL,
+        `order_amount` INT NOT NULL,
+        `volume_filled` INT NOT NULL DEFAULT 0
+    ) CHARACTER SET utf8mb4;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS `positions` (
+        `id` INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        `seller_id` BIGINT NOT NULL,
+        `buyer_id` BIGINT NOT NULL,
+        `position_amount` INT NOT NULL,
+        `open_price` INT NOT NULL,
+        `stop_loss` INT NULL,
+        `take_profit` INT NULL,
+        `stop_price` INT NULL,
+        `date` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        `expiration_date` DATETIME NOT NULL
+    ) CHARACTER SET utf8mb4;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS `advance_positions` (
+        `id` INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        `seller_id` BIGINT NOT NULL,
+        `buyer_id` BIGINT NOT NULL,
+        `position_amount` INT NOT NULL,
+        `open_price` INT NOT NULL,
+        `close_price` INT NOT NULL,
+        `date` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        `expiration_date` DATETIME NOT NULL
+    ) CHARACTER SET utf8mb4;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS `order_history` (
+        `id` INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        `trader_id` BIGINT NOT NULL,
+        `date` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        `trade_type` BOOLEAN NOT NULL,
+        `order_amount` INT NOT NULL,
+        `entry_price` INT NOT NULL,
+        `stop_price` INT NOT NULL,
+        `leverage` INT NOT NULL
+    ) CHARACTER SET utf8mb4;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS `reply_chain` (
+        `id` INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        `trader_id` BIGINT NOT NULL,
+        `message_id` BIGINT NOT NULL,
+        `order_table` VARCHAR(32) NOT NULL,
+        `order_message_id` BIGINT NOT NULL,
+        `order_amount` INT NULL
+    ) CHARACTER SET utf8mb4;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS `payment` (
+        `id` INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        `trader_id` BIGINT NOT NULL,
+        `owner_name` VARCHAR(255) NULL,
+        `address` VARCHAR(255) NULL,
+        `file_id` VARCHAR(255) NULL,
+        `deposit_text` TEXT NULL,
+        `deposit_amount` DOUBLE NULL,
+        `type` VARCHAR(16) NOT NULL,
+        `status` VARCHAR(16) NOT NULL,
+        `transaction_id` VARCHAR(255) NULL,
+        `currency` VARCHAR(16) NULL,
+        `confirmed_by` BIGINT NULL,
+        `confirmation_date` DATETIME NULL,
+        `date` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ) CHARACTER SET utf8mb4;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS `trader_exposure` (
+        `trader_id` BIGINT NOT NULL PRIMARY KEY,
+        `long_amount` BIGINT NOT NULL DEFAULT 0,
+        `short_amount` BIGINT NOT NULL DEFAULT 0,
+        `open_order_volume` BIGINT NOT NULL DEFAULT 0
+    );
+    """,
+]
+
+HOT_PATH_INDEXES = [
+    # role/name/pack lookups and referral checks
+    Index("app_users", "ux_app_users_trader_id", ("trader_id",), unique=True),
+    Index("app_users", "ix_app_users_referral_code", ("referral_code",)),
+    # get_order_by_message_id, cancels, per-trader and per-contract loads
+    Index("orders", "ix_orders_message_id", ("message_id",)),
+    Index("orders", "ix_orders_trader_id", ("trader_id",)),
+    Index("orders", "ix_orders_expiration", ("expiration_date", "id")),
+    Index("advance_orders", "ix_advance_orders_message_id", ("message_id",)),
+    Index("advance_orders", "ix_advance_orders_buyer_id", ("buyer_id",)),
+    Index("advance_orders", "ix_advance_orders_seller_id", ("seller_id",)),
+    Index("advance_orders", "ix_advance_orders_expiration", ("expiration_date", "id")),
+    Index("positions", "ix_positions_buyer_id", ("buyer_id", "expiration_date")),
+    Index("positions", "ix_positions_seller_id", ("seller_id", "expiration_date")),
+    Index("advance_positions", "ix_advance_positions_buyer_id", ("buyer_id", "expiration_date")),
+    Index("advance_positions", "ix_advance_positions_seller_id", ("seller_id", "expiration_date")),
+    Index("order_history", "ix_order_history_trader_date", ("trader_id", "date")),
+    Index("reply_chain", "ix_reply_chain_message_id", ("message_id",)),
+    Index("reply_chain", "ix_reply_chain_order_message_id", ("order_message_id",)),
+    Index("reply_chain", "ix_reply_chain_trader_id", ("trader_id",)),
+    # deposit approval: first pending payment
+    Index("payment", "ix_payment_status_id", ("status", "id")),
+    Index("payment", "ix_payment_trader_id", ("trader_id",)),
+]
+
+# (version, name, steps)
+MIGRATIONS = [
+    (1, "create tables", TABLES),
+    (2, "hot path indexes", HOT_PATH_INDEXES),
+]
+
+# hot queries checked with EXPLAIN; parameters only need the right types
+HOT_QUERIES = [
+    ("SELECT `access_level` FROM `app_users` WHERE `trader_id`=%s;", (0,)),
+    ("SELECT COUNT(1) AS cnt FROM `app_users` WHERE `referral_code`=%s;", ("",)),
+    ("SELECT `trader_id`, `username` FROM `app_users` WHERE `trader_id` IN (%s, %s);", (0, 1)),
+    ("SELECT * FROM `orders` WHERE `message_id`=%s LIMIT 1;", (0,)),
+    ("SELECT * FROM `advance_orders` WHERE `message_id`=%s LIMIT 1;", (0,)),
+    ("SELECT * FROM `orders` WHERE `trader_id`=%s;", (0,)),
+    ("SELECT * FROM `advance_orders` WHERE `buyer_id`=%s;", (0,)),
+    ("SELECT * FROM `advance_orders` WHERE `seller_id`=%s;", (0,)),
+    ("SELECT * FROM `orders` WHERE `expiration_date`=%s;", ("2000-01-01 12:30:00",)),
+    ("SELECT * FROM `advance_orders` WHERE `expiration_date`=%s;", ("2000-01-01 12:30:00",)),
+    ("SELECT * FROM `reply_chain` WHERE `message_id`=%s;", (0,)),
+    ("DELETE FROM `reply_chain` WHERE `order_message_id` IN (%s);", (0,)),
+    ("SELECT * FROM `payment` WHERE `status`=%s ORDER BY `id` LIMIT %s;", ("pending", 1)),
+]
+
+
+async def _ensure_index(cur, index: Index, dialect: str = "mysql") -> bool:
+    if dialect == "sqlite":
+        await cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='index' AND tbl_name=%s AND name=%s LIMIT 1;",
+            (index.table, index.name),
+        )
+    else:
+        await cur.execute(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema=DATABASE() AND table_name=%s AND index_name=%s LIMIT 1;",
+            (index.table, index.name),
+        )
+    if await cur.fetchone():
+        return False
+    columns = ", ".join(f"`{col}`" for col in index.columns)
+    if index.unique:
+        await _check_unique(cur, index, columns)
+    unique = "UNIQUE " if index.unique else ""
+    await cur.execute(f"CREATE {unique}INDEX `{index.name}` ON `{index.table}` ({columns});")
+    return True
+
+
+async def _check_unique(cur, index: Index, columns: str, examples: int = 5):
+    await cur.execute(
+        f"SELECT {columns}, COUNT(1) AS cnt FROM `{index.table}` "
+        f"GROUP BY {columns} HAVING COUNT(1) > 1 LIMIT {examples};"
+    )
+    duplicates = await cur.fetchall()
+    if duplicates:
+        found = ", ".join(
+            "(" + ", ".join(f"{col}={row[col]!r}" for col in index.columns) + f") x{row['cnt']}"
+            for row in duplicates
+        )
+        raise MigrationError(
+            f"cannot create unique index `{index.name}`: `{index.table}` has duplicate rows "
+            f"(first {len(duplicates)}: {found}); merge or delete them and run the migration again"
+        )
+
+
+async def migrate(db: DataBase) -> list[int]:
+    """
+    Apply all pending migrations in order; returns the applied versions.
+    The in-memory backend has no schema and is left alone.
+    """
+    applied = []
+    if db.dialect == "memory":
+        return applied
+    async with db._pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute(
+                "CREATE TABLE IF NOT EXISTS `schema_migrations` ("
+                "`version` INT NOT NULL PRIMARY KEY, "
+                "`name` VARCHAR(255) NOT NULL, "
+                "`applied_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP);"
+            )
+            await cur.execute("SELECT `version` FROM `schema_migrations`;")
+            done = {row["version"] for row in await cur.fetchall()}
+
+            for version, name, steps in MIGRATIONS:
+                if version in done:
+                    continue
+                logger.info("applying migration %s: %s", version, name)
+                for step in steps:
+                    if isinstance(step, Index):
+                        await _ensure_index(cur, step, db.dialect)
+                    else:
+                        await cur.execute(step)
+                await cur.execute(
+                    "INSERT INTO `schema_migrations` (`version`, `name`) VALUES (%s, %s);", (version, name)
+                )
+                applied.append(version)
+    return applied
+
+
+async def check_hot_queries(db: DataBase) -> list[str]:
+    """
+    EXPLAIN every hot query and report the ones the database would answer
+    with a full table scan (MySQL access type ALL, SQLite "SCAN" without an
+    index). Returns human readable warnings.
+    """
+    warnings = []
+    if db.dialect == "memory":
+        return warnings
+    async with db._pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            if db.dialect == "sqlite":
+                # EXPLAIN plans against the connection's cached schema; reading a table
+                # reloads it, so indexes another connection just created are seen
+                await cur.execute("SELECT 1 FROM `app_users` LIMIT 1;")
+                await cur.fetchall()
+            for sql, params in HOT_QUERIES:
+                if db.dialect == "sqlite":
+                    await cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+                    for row in await cur.fetchall():
+                        detail = row.get("detail") or ""
+                        if detail.startswith("SCAN") and "INDEX" not in detail:
+                            warnings.append(f"full table scan ({detail}): {sql}")
+                    continue
+                await cur.execute("EXPLAIN " + sql, params)
+                for row in await cur.fetchall():
+                    if (row.get("type") or "").upper() == "ALL":
+                        warnings.append(f"full table scan on `{row.get('table')}`: {sql}")
+    return warnings
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PackLedger:
+    """
+    In-memory view of each trader's trade_pack / frozen_pack for the order path.
+
+    Checks run under a per-trader asyncio.Lock against the in-memory entry, so
+    two concurrent orders of the same trader cannot both pass. The resulting
+    frozen_pack changes are queued and written to MySQL by a background task
+    as relative, conditional UPDATEs (see DataBase.write_pack_updates), so the
+    database never goes below zero or above trade_pack because of a stale entry.
+    A reservation only succeeds once its conditional UPDATE has committed;
+    concurrent reservations share one transaction. Releases are not awaited.
+
+    Entries are loaded lazily. Writers that change app_users outside the
+    ledger call invalidate(); the next load waits for queued writes first.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._entries: dict[int, dict] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+        # (update, future of a reservation or None)
+        self._pending: list[tuple[tuple[str, int, int], asyncio.Future | None]] = []
+        self._wakeup: asyncio.Event | None = None
+        self._idle: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def _lock(self, trader_id: int) -> asyncio.Lock:
+        lock = self._locks.get(trader_id)
+        if lock is None:
+            lock = self._locks[trader_id] = asyncio.Lock()
+        return lock
+
+    async def _entry(self, trader_id: int) -> dict | None:
+        entry = self._entries.get(trader_id)
+        if entry is None:
+            await self.flush()
+            row = await self.db.load_packs(trader_id)
+            if row is None:
+                return None
+            entry = self._entries[trader_id] = {
+                "trade_pack": int(row["trade_pack"] or 0),
+                "frozen_pack": int(row["frozen_pack"] or 0),
+            }
+        return entry
+
+    async def available(self, trader_id: int) -> int:
+        async with self._lock(trader_id):
+            entry = await self._entry(trader_id)
+            return entry["trade_pack"] - entry["frozen_pack"] if entry else 0
+
+    async def reserve(self, trader_id: int, amount: int) -> bool:
+        """
+        Freeze `amount` of the trader's pack if it is available, and wait until
+        MySQL has accepted the reservation. False if either rejects it.
+        """
+        if amount <= 0:
+            return True
+        async with self._lock(trader_id):
+            entry = await self._entry(trader_id)
+            if entry is None or entry["trade_pack"] - entry["frozen_pack"] < amount:
+                return False
+            entry["frozen_pack"] += amount
+            written = asyncio.get_running_loop().create_future()
+            self._enqueue("reserve", trader_id, amount, written)
+        # outside the lock: the trader's next check already counts this reservation
+        return await written
+
+    def release(self, trader_id: int, amount: int) -> None:
+        """
+        Unfreeze `amount` (never below zero), e.g. when an order is cancelled.
+        """
+        if amount <= 0:
+            return
+        self.adjust(trader_id, -amount)
+        self._enqueue("release", trader_id, amount)
+
+    def adjust(self, trader_id: int, frozen_delta: int) -> None:
+        """
+        Apply a frozen_pack change that has already been written to MySQL.
+        """
+        entry = self._entries.get(trader_id)
+        if entry is not None:
+            entry["frozen_pack"] = max(0, entry["frozen_pack"] + frozen_delta)
+
+    def invalidate(self, trader_id: int | None = None) -> None:
+        if trader_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(trader_id, None)
+
+    # ------------------------------------------------------------
+    def _enqueue(self, kind: str, trader_id: int, amount: int, written: asyncio.Future | None = None):
+        self._pending.append(((kind, trader_id, amount), written))
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._task = asyncio.create_task(self._writer())
+        self._idle.clear()
+        self._wakeup.set()
+
+    async def _writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                batch, self._pending = self._pending, []
+                try:
+                    rejected = set(await self.db.write_pack_updates([update for update, _ in batch]))
+                except Exception:
+                    # the transaction was rolled back: fail the waiting reservations, retry the releases
+                    logger.exception("pack ledger write failed")
+                    for (kind, trader_id, _), written in batch:
+                        if written is not None:
+                            self.invalidate(trader_id)
+                            if not written.done():
+                                written.set_result(False)
+                    self._pending = [item for item in batch if item[1] is None] + self._pending
+                    if self._pending:
+                        await asyncio.sleep(1)
+                    continue
+                for index, ((kind, trader_id, _), written) in enumerate(batch):
+                    if index in rejected:
+                        # MySQL disagreed with the in-memory entry; reload it on next use
+                        logger.warning("pack reservation rejected by database for trader %s", trader_id)
+                        self.invalidate(trader_id)
+                    if written is not None and not written.done():
+                        written.set_result(index not in rejected)
+            self._idle.set()
+
+    async def flush(self) -> None:
+        """
+        Wait until all queued writes have reached MySQL.
+        """
+        if self._idle is not None and not self._idle.is_set():
+            await self._idle.wait()
+
+    async def close(self, timeout: float = 10.0) -> None:
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            logger.error("pack ledger closed with %d unwritten updates", len(self._pending))
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
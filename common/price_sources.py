@@ -0,0 +1,271 @@
+"""
+Price sources and the price page parser used by bots.control_updates.
+
+A source returns the raw HTML of the tgju price page:
+
+- HttpPriceSource: the live page over a reused httpx client, with timeouts,
+  retries and backoff; optionally saves every page it fetched to a directory;
+- FilePriceSource: one local file, re-read on every fetch;
+- RecordedPriceSource: a directory of saved pages, replayed in name order.
+
+PriceParser pulls the current and open-day price out of a page. The fast
+path (extract_prices_fast) scans for the few markers around the two numbers
+instead of building a DOM; parse_price_page_bs is the BeautifulSoup version
+of the original CSS selectors. The first page and every `validate_every`-th
+page are parsed both ways; on a mismatch the parser logs it and uses
+BeautifulSoup until the two agree again.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+
+import httpx
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+PRICE_URL = "https://www.tgju.org/profile/afghan_usd"
+CURRENT_PRICE_SELECTOR = "#main > div.stocks-profile > div.stocks-header > div.stocks-header-main > div > div.fs-cell.fs-xl-3.fs-lg-3.fs-md-6.fs-sm-12.fs-xs-12.top-header-item-block-2.mobile-top-item-hide > div > h3.line.clearfix.mobile-hide-block > span.value > span:nth-child(1)"
+OPEN_DAY_PRICE_SELECTOR = "#main > div.stocks-profile > div.fs-row.bootstrap-fix.widgets.full-w-set.profile-social-share-box > div.row.tgju-widgets-row > div.tgju-widgets-block.col-md-12.col-lg-4.tgju-widgets-block-bottom-unset.overview-first-block > div > div:nth-child(2) > div > div.tables-default.normal > table > tbody > tr:nth-child(6) > td.text-left"
+
+# worth another attempt
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _price(text: str) -> int:
+    # "60,123.5" -> 60123, as the page has always been read
+    return int(text.replace(',', '').strip()[0:5])
+
+
+# ---------------------------------------------------------------------------
+# parsing
+# ---------------------------------------------------------------------------
+
+def parse_price_page_bs(html_doc: str) -> tuple[int, int | None]:
+    """
+    (current price, open-day price or None) with BeautifulSoup and the
+    full CSS selectors. Raises IndexError/ValueError if the current price
+    is missing.
+    """
+    soup = BeautifulSoup(html_doc, 'html.parser')
+    current_price = _price(soup.select(selector=CURRENT_PRICE_SELECTOR)[0].get_text())
+    try:
+        open_day_price = _price(soup.select(selector=OPEN_DAY_PRICE_SELECTOR)[0].get_text())
+    except (IndexError, ValueError):
+        open_day_price = None
+    return current_price, open_day_price
+
+
+def _scan(html: str, pos: int, markers: tuple[str, ...], end: int = -1) -> int:
+    """
+    Position just after the last of `markers`, found in order from `pos`, or -1.
+    """
+    if end < 0:
+        end = len(html)
+    for marker in markers:
+        pos = html.find(marker, pos, end)
+        if pos < 0:
+            return -1
+        pos += len(marker)
+    return pos
+
+
+def _text_at(html: str, pos: int) -> str | None:
+    """
+    Text of the element whose opening tag contains `pos`, up to the next tag.
+    """
+    start = html.find(">", pos)
+    if start < 0:
+        return None
+    stop = html.find("<", start)
+    return html[start + 1:stop] if stop >= 0 else None
+
+
+def extract_prices_fast(html_doc: str) -> tuple[int, int | None] | None:
+    """
+    Same result as parse_price_page_bs from a plain string scan along the
+    selector path; None if the page does not have the expected shape.
+    """
+    # ... top-header-item-block-2 ... h3.mobile-hide-block > span.value > span:nth-child(1)
+    pos = _scan(html_doc, 0, ("top-header-item-block-2", "mobile-hide-block", 'class="value"', ">"))
+    if pos < 0:
+        return None
+    # first child of span.value must be the span holding the number
+    first_child = html_doc.find("<", pos)
+    if not html_doc.startswith("<span", first_child):
+        return None
+    text = _text_at(html_doc, first_child)
+    try:
+        current_price = _price(text or "")
+    except ValueError:
+        return None
+
+    open_day_price = None
+    # ... overview-first-block ... div.tables-default > table > tbody > tr:nth-child(6) > td.text-left
+    pos = _scan(html_doc, 0, ("overview-first-block", "tables-default", "<tbody"))
+    if pos >= 0:
+        body_end = html_doc.find("</tbody>", pos)
+        for _ in range(6):
+            pos = _scan(html_doc, pos, ("<tr",), body_end)
+            if pos < 0:
+                break
+        if pos >= 0:
+            row_end = html_doc.find("</tr>", pos)
+            cell = _scan(html_doc, pos, ("text-left",), row_end)
+            if cell >= 0:
+                try:
+                    open_day_price = _price(_text_at(html_doc, cell) or "")
+                except ValueError:
+                    pass
+    return current_price, open_day_price
+
+
+class PriceParser:
+    """
+    Fast extraction with BeautifulSoup as the validated fallback (see module docstring).
+    """
+
+    def __init__(self, validate_every: int = 60):
+        self.validate_every = validate_every
+        self.pages = 0
+        self.fallbacks = 0
+        self.fast_ok = True
+
+    def parse(self, html_doc: str) -> tuple[int, int | None]:
+        self.pages += 1
+        validate = not self.fast_ok or self.pages % self.validate_every == 1
+        fast = extract_prices_fast(html_doc)
+        if fast is not None and not validate:
+            return fast
+
+        if fast is None:
+            self.fallbacks += 1
+            return parse_price_page_bs(html_doc)
+        try:
+            slow = parse_price_page_bs(html_doc)
+        except Exception:
+            # a page the validator cannot read says nothing about the fast result
+            logger.exception("validating the fast price extraction failed; using %s", fast)
+            return fast
+        fast_ok = fast == slow
+        if fast_ok != self.fast_ok:
+            if fast_ok:
+                logger.info("fast price extraction matches the page again")
+            else:
+                logger.warning("fast price extraction gave %s, BeautifulSoup %s; using BeautifulSoup", fast, slow)
+        self.fast_ok = fast_ok
+        return slow
+
+
+# ---------------------------------------------------------------------------
+# sources
+# ---------------------------------------------------------------------------
+
+class PriceSource:
+    """
+    Interface: `await fetch()` returns the HTML of one price page.
+    """
+
+    async def fetch(self) -> str:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class HttpPriceSource(PriceSource):
+    def __init__(
+        self,
+        url: str = PRICE_URL,
+        timeout: float = 5.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        record_dir: str | None = None,
+    ):
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.record_dir = record_dir
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 3.0)),
+            headers={"User-Agent": "Mozilla/5.0"},
+            follow_redirects=True,
+        )
+
+    async def fetch(self) -> str:
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self._client.get(self.url)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    if self.record_dir:
+                        await asyncio.to_thread(self._record, response.text)
+                    return response.text
+                error = httpx.HTTPStatusError(
+                    f"status {response.status_code}", request=response.request, response=response
+                )
+            except httpx.TransportError as exc:
+                error = exc
+            if attempt == self.retries:
+                raise error
+            # exponential backoff with a little jitter
+            await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.8, 1.2))
+
+    def _record(self, html_doc: str) -> None:
+        os.makedirs(self.record_dir, exist_ok=True)
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() % 1_000_000_000:09d}.html"
+        with open(os.path.join(self.record_dir, name), "w", encoding="utf-8") as f:
+            f.write(html_doc)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class FilePriceSource(PriceSource):
+    def __init__(self, path: str):
+        self.path = path
+
+    async def fetch(self) -> str:
+        return await asyncio.to_thread(self._read, self.path)
+
+    @staticmethod
+    def _read(path: str) -> str:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+
+class RecordedPriceSource(FilePriceSource):
+    """
+    Saved pages (*.html in `directory`) in name order; starts over at the end
+    when `loop` is set, otherwise keeps returning the last page.
+    """
+
+    def __init__(self, directory: str, loop: bool = False):
+        self.paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".html")
+        )
+        if not self.paths:
+            raise ValueError(f"no recorded pages in {directory}")
+        super().__init__(self.paths[0])
+        self.loop = loop
+        self._next = 0
+
+    async def fetch(self) -> str:
+        if self._next >= len(self.paths):
+            self._next = 0 if self.loop else len(self.paths) - 1
+        self.path = self.paths[self._next]
+        self._next += 1
+        return await super().fetch()
+
+
+def price_source_from_config(source: str = "", record_dir: str = "") -> PriceSource:
+    """
+    "" -> the live page, a directory -> RecordedPriceSource, a file -> FilePriceSource.
+    """
+    if not source:
+        return HttpPriceSource(record_dir=record_dir or None)
+    if os.path.isdir(source):
+        return RecordedPriceSource(source)
+    return FilePriceSource(source)
@@ -0,0 +1,147 @@
+"""
+Read-replica routing for DataBase.
+
+Reads that may go to a replica ask ReplicaSet.choose(table) for a pool; it
+returns a replica only if its replication lag is known, fresh and small
+enough that the replica already has every write this flow made, and every
+write this process made to `table`. Otherwise (or with no replicas) the
+caller uses the primary.
+
+"Flow" is the current asyncio context: a handler that wrote something keeps
+reading from the primary until a replica has caught up with that write,
+while concurrent handlers that did not write are unaffected. The per-table
+write times cover reads in other flows of rows this process just wrote
+(e.g. replying to an order that was placed a moment ago).
+"""
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+
+import aiomysql
+
+logger = logging.getLogger(__name__)
+
+# monotonic time of the last write made in the current flow
+_last_write: contextvars.ContextVar[float | None] = contextvars.ContextVar("db_last_write", default=None)
+
+
+class Replica:
+    def __init__(self, name: str, pool):
+        self.name = name
+        self.pool = pool
+        self.lag: float | None = None  # upper bound in seconds, None while unknown
+        self.checked_at = 0.0
+        self.error: str | None = None
+
+
+class ReplicaSet:
+    """
+    Replica pools plus a background task that polls their lag with
+    SHOW REPLICA STATUS every `check_interval` seconds. A replica is skipped
+    while its lag is above `max_lag`, unknown, or older than three polls.
+    """
+
+    def __init__(self, replicas: list[Replica] = (), max_lag: float = 2.0, check_interval: float = 1.0):
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._table_writes: dict[str, float] = {}
+        self._next = itertools.count()
+        self._task: asyncio.Task | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    def mark_write(self, *tables: str) -> None:
+        now = time.monotonic()
+        _last_write.set(now)
+        for table in tables:
+            self._table_writes[table] = now
+
+    def choose(self, table: str | None = None):
+        """
+        A replica pool that can serve a read of `table` now, or None.
+        """
+        if not self.replicas:
+            return None
+        now = time.monotonic()
+        last_write = max(_last_write.get() or 0.0, self._table_writes.get(table, 0.0))
+        since_write = now - last_write if last_write else float("inf")
+        stale_after = 3 * self.check_interval
+        healthy = [
+            replica for replica in self.replicas
+            if replica.lag is not None
+            and now - replica.checked_at <= stale_after
+            and replica.lag <= self.max_lag
+            and replica.lag < since_write
+        ]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)].pool
+
+    # ------------------------------------------------------------
+    async def _check(self, replica: Replica) -> None:
+        try:
+            async with replica.pool.acquire() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cur:
+                    try:
+                        await cur.execute("SHOW REPLICA STATUS;")
+                    except Exception:
+                        # MySQL before 8.0.22 / MariaDB
+                        await cur.execute("SHOW SLAVE STATUS;")
+                    row = await cur.fetchone()
+        except Exception as exc:
+            replica.lag, replica.error = None, str(exc)
+            return
+        seconds = None
+        if row:
+            seconds = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        if seconds is None:
+            # not a replica, or replication stopped
+            replica.lag, replica.error = None, "replication not running"
+        else:
+            # reported in whole seconds, so 0 means "less than one"
+            replica.lag, replica.error = float(seconds) + 1.0, None
+        replica.checked_at = time.monotonic()
+
+    async def _monitor(self) -> None:
+        while True:
+            errors = [replica.error for replica in self.replicas]
+            await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+            for replica, error in zip(self.replicas, errors):
+                # log state changes only
+                if replica.error and replica.error != error:
+                    logger.warning("replica %s skipped: %s", replica.name, replica.error)
+                elif error and not replica.error:
+                    logger.info("replica %s is back, lag %.0fs", replica.name, replica.lag)
+            await asyncio.sleep(self.check_interval)
+
+    def start(self) -> None:
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self._monitor())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            replica.pool.close()
+            await replica.pool.wait_closed()
+
+    def status(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "name": replica.name,
+                "lag_s": replica.lag,
+                "checked_s_ago": round(now - replica.checked_at, 1) if replica.checked_at else None,
+                "error": replica.error,
+            }
+            for replica in self.replicas
+        ]
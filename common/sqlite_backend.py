@@ -0,0 +1,208 @@
+"""
+Embedded SQLite backend for DataBase.
+
+SQLitePool exposes the small part of the aiomysql pool interface DataBase
+uses (acquire -> connection -> cursor -> execute/fetch*), so every DataBase
+method runs unchanged on either engine. The MySQL dialect the code uses is
+translated per statement (placeholders, FOR UPDATE, IF/GREATEST, ON DUPLICATE
+KEY UPDATE). sqlite3 calls run in worker threads via asyncio.to_thread, never
+on the event loop; the database is opened in WAL mode so readers do not
+block the writer.
+"""
+import asyncio
+import re
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+
+_ISO_DATETIME = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?$")
+
+
+def _convert_datetime(value: bytes) -> datetime:
+    return datetime.fromisoformat(value.decode())
+
+
+# DATETIME columns come back as datetime, like aiomysql returns them
+sqlite3.register_converter("DATETIME", _convert_datetime)
+
+
+@lru_cache(maxsize=512)
+def translate(sql: str) -> str:
+    """
+    MySQL statement as used in this repo -> SQLite statement.
+    """
+    sql = sql.replace("%s", "?")
+    sql = re.sub(r"\s+FOR UPDATE\s*;", ";", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bGREATEST\(", "MAX(", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bLEAST\(", "MIN(", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bIF\(", "IIF(", sql)
+    if "ON DUPLICATE KEY UPDATE" in sql:
+        sql = sql.replace("ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET")
+        sql = re.sub(r"VALUES\((`\w+`)\)", r"excluded.\1", sql)
+    # DDL written for MySQL
+    sql = re.sub(r"\bINT NOT NULL AUTO_INCREMENT PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT", sql)
+    sql = re.sub(r"\)\s*CHARACTER SET \w+\s*;", ");", sql)
+    return sql
+
+
+def _param(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, str) and _ISO_DATETIME.match(value):
+        # the models insert ISO strings with a "T"; store one canonical form
+        return value.replace("T", " ")
+    return value
+
+
+def _params(args) -> tuple:
+    if args is None:
+        return ()
+    if isinstance(args, dict):
+        raise TypeError("named parameters are not supported")
+    return tuple(_param(value) for value in args)
+
+
+class SQLiteCursor:
+    def __init__(self, connection: "SQLiteConnection", as_dict: bool):
+        self._connection = connection
+        self._as_dict = as_dict
+        self._cursor = None
+        self._columns = None
+        self.lastrowid = None
+        self.rowcount = -1
+
+    def _row(self, row):
+        if row is None or not self._as_dict:
+            return row
+        return dict(zip(self._columns, row))
+
+    async def execute(self, sql: str, args=None) -> int:
+        def run():
+            cursor = self._connection.raw.execute(translate(sql), _params(args))
+            return cursor
+
+        self._cursor = await asyncio.to_thread(run)
+        self._columns = [d[0] for d in self._cursor.description] if self._cursor.description else None
+        self.lastrowid = self._cursor.lastrowid
+        self.rowcount = self._cursor.rowcount
+        return max(self.rowcount, 0)
+
+    async def executemany(self, sql: str, args) -> int:
+        rows = [_params(row) for row in args]
+        if not rows:
+            return 0
+        self._cursor = await asyncio.to_thread(self._connection.raw.executemany, translate(sql), rows)
+        self._columns = None
+        self.lastrowid = self._cursor.lastrowid
+        self.rowcount = self._cursor.rowcount
+        return max(self.rowcount, 0)
+
+    async def fetchone(self):
+        return self._row(await asyncio.to_thread(self._cursor.fetchone))
+
+    async def fetchmany(self, size: int = 1):
+        return [self._row(row) for row in await asyncio.to_thread(self._cursor.fetchmany, size)]
+
+    async def fetchall(self):
+        return [self._row(row) for row in await asyncio.to_thread(self._cursor.fetchall)]
+
+    async def close(self):
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+
+
+class _CursorContext:
+    def __init__(self, cursor: SQLiteCursor):
+        self._cursor = cursor
+
+    async def __aenter__(self):
+        return self._cursor
+
+    async def __aexit__(self, *exc):
+        await self._cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, raw: sqlite3.Connection):
+        self.raw = raw
+
+    def cursor(self, cursor_class=None):
+        # aiomysql.DictCursor / SSDictCursor -> rows as dicts
+        as_dict = "Dict" in getattr(cursor_class, "__name__", "")
+        return _CursorContext(SQLiteCursor(self, as_dict))
+
+    async def begin(self):
+        # IMMEDIATE takes the write lock up front, which is what FOR UPDATE relies on
+        await asyncio.to_thread(self.raw.execute, "BEGIN IMMEDIATE")
+
+    async def commit(self):
+        if self.raw.in_transaction:
+            await asyncio.to_thread(self.raw.execute, "COMMIT")
+
+    async def rollback(self):
+        if self.raw.in_transaction:
+            await asyncio.to_thread(self.raw.execute, "ROLLBACK")
+
+
+class _AcquireContext:
+    def __init__(self, pool: "SQLitePool"):
+        self._pool = pool
+        self._connection = None
+
+    async def __aenter__(self) -> SQLiteConnection:
+        self._connection = await self._pool._free.get()
+        return self._connection
+
+    async def __aexit__(self, *exc):
+        connection, self._connection = self._connection, None
+        if connection.raw.in_transaction:
+            # a transaction left open by an error must not leak into the next user
+            await connection.rollback()
+        self._pool._free.put_nowait(connection)
+
+
+class SQLitePool:
+    """
+    Fixed-size pool of sqlite3 connections to one database file, in
+    autocommit mode (explicit transactions via begin/commit, as with aiomysql).
+    """
+
+    dialect = "sqlite"
+
+    def __init__(self, connections: list[sqlite3.Connection]):
+        self._connections = [SQLiteConnection(raw) for raw in connections]
+        self._free: asyncio.Queue = asyncio.Queue()
+        for connection in self._connections:
+            self._free.put_nowait(connection)
+
+    @classmethod
+    async def create(cls, path: str, size: int = 4, busy_timeout: float = 5.0) -> "SQLitePool":
+        def connect():
+            raw = sqlite3.connect(
+                path,
+                isolation_level=None,
+                check_same_thread=False,
+                detect_types=sqlite3.PARSE_DECLTYPES,
+                timeout=busy_timeout,
+            )
+            raw.execute("PRAGMA journal_mode=WAL")
+            raw.execute("PRAGMA synchronous=NORMAL")
+            raw.execute("PRAGMA foreign_keys=ON")
+            return raw
+
+        # an in-memory database is private to its connection, so it can only have one
+        if path == ":memory:":
+            size = 1
+        connections = [await asyncio.to_thread(connect) for _ in range(size)]
+        return cls(connections)
+
+    def acquire(self):
+        return _AcquireContext(self)
+
+    def close(self):
+        for connection in self._connections:
+            connection.raw.close()
+
+    async def wait_closed(self):
+        pass
@@ -2,24 +2,54 @@ import bots.group_bot as group_bot
 import bots.panel_bot as panel_bot
 import bots.control_updates as control_updates
 import asyncio
+import os
 from common.database import DataBase
+from common.memory_backend import InMemoryDataBase
+from common.metrics import start_metrics_server
+from common import migrations
 from common.config import *
 
 
 async def main():
-    # 1. ساخت Connection Pool
-    db = await DataBase.create_pool(
-        host=DB_HOST,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        db=DB_NAME,
-        port=DB_PORT,
-        minsize=1,
-        maxsize=10
-    )
+    # 1. ساخت Connection Pool (MySQL، فایل SQLite محلی یا حافظه بسته به DB_BACKEND)
+    if DB_BACKEND == "memory":
+        # فقط برای تست بار؛ با بسته شدن برنامه همه‌ی داده‌ها از بین می‌روند
+        db = InMemoryDataBase(latency=MEMORY_DB_LATENCY_MS / 1000)
+        print("هشدار: دیتابیس در حافظه است و چیزی ذخیره نمی‌شود.")
+    elif DB_BACKEND == "sqlite":
+        os.makedirs(os.path.dirname(SQLITE_PATH) or ".", exist_ok=True)
+        db = await DataBase.create_sqlite(SQLITE_PATH)
+    else:
+        db = await DataBase.create_pool(
+            host=DB_HOST,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            db=DB_NAME,
+            port=DB_PORT,
+            minsize=DB_POOL_MIN,
+            maxsize=DB_POOL_MAX,
+            idle_timeout=DB_POOL_IDLE_TIMEOUT,
+            query_timeout=DB_QUERY_TIMEOUT or None,
+            replica_hosts=DB_REPLICA_HOSTS,
+            max_replica_lag=DB_REPLICA_MAX_LAG,
+        )
+
+    # آمار دیتابیس روی http://127.0.0.1:METRICS_HTTP_PORT (اختیاری)
+    metrics_server = None
+    if METRICS_HTTP_PORT:
+        metrics_server = await start_metrics_server(db.metrics, METRICS_HTTP_PORT)
+
+    # اجرای migrationها (جدول‌ها و ایندکس‌های مسیرهای پرتکرار) و گزارش پرس‌وجوهایی که کل جدول را می‌خوانند
+    await migrations.migrate(db)
+    for warning in await migrations.check_hot_queries(db):
+        print(f"هشدار ایندکس: {warning}")
+
+    # پر کردن اولیه‌ی جدول تجمیعی trader_exposure در صورت نیاز (یا بازسازی کامل با EXPOSURE_REBUILD_ON_START)
+    await db.ensure_trader_exposure(rebuild=EXPOSURE_REBUILD_ON_START)
 
     # 2. راه‌اندازی گروه بات
     group_application = await group_bot.main(db)
+    await group_application.bot_data["program"].start()
     await group_application.initialize()
     await group_application.start()
     await group_application.updater.start_polling()
@@ -38,7 +68,12 @@ async def main():
             control_updates.control_updates()
         )
     finally:
-        # 5. در پایان، حتماً Pool را ببندید
+        # 5. در پایان، تسک‌های مطابقت را متوقف و حتماً Pool را ببندید
+        await group_application.bot_data["program"].close()
+        if "recorder" in group_application.bot_data:
+            group_application.bot_data["recorder"].close()
+        if metrics_server is not None:
+            metrics_server.close()
         await db.close_pool()
 
 
@@ -1,13 +1,16 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 
+import common.config as config
 from common.database import DataBase
+from .journal import BookJournal
 from .logic import Logic
+from .order_flow import OrderFlowRecorder, read_order_flow
 from .set_order import SetOrder
 
 
 __all__ = [
-    "Logic", "SetOrder", "Program"
+    "Logic", "SetOrder", "Program", "OrderFlowRecorder", "read_order_flow"
 ]
 
 
@@ -17,21 +20,45 @@ class Program:
         اکنون Program ورودی db (از نوع DataBase) می‌گیرد
         و SetOrder و Logic را با همین db مقداردهی می‌کند.
         """
-        self.set_order = SetOrder(db)
-        self.logic = Logic(db)
+        journal = None
+        if config.BOOK_JOURNAL_DIR:
+            journal = BookJournal(config.BOOK_JOURNAL_DIR, config.BOOK_SNAPSHOT_INTERVAL)
+        self.logic = Logic(db, journal)
+        self.set_order = SetOrder(db, self.logic.unbook_orders)
+
+    async def start(self):
+        """
+        بازیابی دفترهای سفارش از اسنپ‌شات و ژورنال پیش از دریافت پیام‌ها.
+        """
+        await self.logic.start()
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         این متد async است و به ترتیب:
          1. set_order.set_order (که async است) را صدا می‌زند.
-         2. logic.make_position (که async است) را صدا می‌زند.
+         2. فقط سفارشِ تازه ثبت‌شده را با logic.match_order در دفتر سفارش مطابقت می‌دهد
+            و حجم باز سفارش‌های لغوشده را کم می‌کند (خروج آن‌ها از دفتر پیش‌تر در set_order انجام شده است).
          3. خروجی‌ها را با هم ادغام کرده و برمی‌گرداند.
         """
 
         commands1 = await self.set_order.set_order(update)
         commands2 = []
         if commands1[0]["status"]:
-            commands2 = await self.logic.make_position()
+            additional_data = commands1[0]["additional_data"]
+            if "order" in additional_data:
+                order_table = additional_data.pop("order_table")
+                commands2 = await self.logic.match_order(order_table, additional_data.pop("order"))
+            for order_table, orders in additional_data.pop("cancelled_orders", {}).items():
+                await self.logic.cancel_orders(order_table, orders)
+
+        # اعلان‌های انقضای قرارداد که از پیام قبلی در صف مانده‌اند
+        commands2 += self.logic.pop_notices()
 
         # فرض می‌کنیم هر دو لیستی از دیکشنری‌ها هستند
         return commands1 + commands2
+
+    async def close(self):
+        """
+        توقف تسک‌های شاردهای مطابقت هنگام خاموش شدن برنامه.
+        """
+        await self.logic.close()
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+
+from .order_book import as_datetime, remaining_volume
+
+ORDER_TABLES = ("orders", "advance_orders")
+DATE_FIELDS = ("date", "expiration_order_time", "expiration_date")
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class BookJournal:
+    """
+    ژورنال append-only رویدادهای دفتر سفارش (load, accept, fill, cancel, expire)
+    به همراه اسنپ‌شات فشرده‌ی دوره‌ای.
+    ژورنال وضعیت سفارش‌های باقیمانده را خودش از روی رویدادها نگه می‌دارد، پس اسنپ‌شات
+    همیشه دقیقاً با شماره‌ی آخرین رویداد ثبت‌شده هماهنگ است.
+    ژورنال در فایل‌های journal.<seq>.log (شماره‌ی اولین رویداد هر فایل) نوشته می‌شود؛ هر اسنپ‌شات
+    یک فایل تازه شروع می‌کند و در یک thread نوشته می‌شود، و فایل‌های قدیمی‌تر پس از جایگزینی اسنپ‌شات حذف می‌شوند.
+    هنگام راه‌اندازی آخرین اسنپ‌شات خوانده و فقط دنباله‌ی ژورنال بعد از آن اجرا می‌شود.
+    """
+
+    def __init__(self, directory: str, snapshot_interval: int = 5000):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+
+        self.state = {table: {} for table in ORDER_TABLES}
+        self.seq = 0
+        self._since_snapshot = 0
+        self._file = None
+        # نوشتن اسنپ‌شاتی که هنوز در thread در جریان است
+        self._pending = None
+
+    # ------------------------------------------------------------
+    def restore(self) -> bool:
+        """
+        بارگذاری اسنپ‌شات و اجرای رویدادهای بعد از آن.
+        اگر هیچ اسنپ‌شاتی وجود نداشته باشد False برمی‌گرداند.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.path.exists(self.snapshot_path):
+            return False
+
+        with open(self.snapshot_path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        self.seq = snapshot["seq"]
+        self.state = {table: {} for table in ORDER_TABLES}
+        for table in ORDER_TABLES:
+            for order in snapshot[table]:
+                self._put(table, order)
+
+        for _, path in self._segments():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # خط ناقص آخر (قطع برق یا kill وسط نوشتن)
+                        break
+                    if event["seq"] <= self.seq:
+                        continue
+                    self._apply(event)
+                    self.seq = event["seq"]
+                    self._since_snapshot += 1
+        return True
+
+    def reset(self, orders_by_table: dict[str, list[dict]]):
+        """
+        جایگزینی کل وضعیت (مثلاً پس از بارگذاری کامل از دیتابیس) و نوشتن اسنپ‌شات تازه.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.state = {table: {} for table in ORDER_TABLES}
+        for table in ORDER_TABLES:
+            for order in orders_by_table.get(table, []):
+                self._put(table, order)
+        self.snapshot()
+
+    def orders(self, table: str) -> list[dict]:
+        return [dict(order) for order in self.state[table].values()]
+
+    # ------------------------------------------------------------
+    def record(self, event: str, table: str, **data):
+        """
+        افزودن یک رویداد به انتهای ژورنال و اعمال آن روی وضعیت.
+        پس از هر snapshot_interval رویداد، اسنپ‌شات نوشته و ژورنال کوتاه می‌شود.
+        """
+        self.seq += 1
+        entry = {"seq": self.seq, "event": event, "table": table, **data}
+        self._apply(entry)
+
+        if self._file is None:
+            # فایلی با همین نام فقط می‌تواند خط ناقص یک اجرای قبلی را داشته باشد
+            self._file = open(self._segment_path(self.seq), "w", encoding="utf-8")
+        self._file.write(json.dumps(entry, default=_encode, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def snapshot(self):
+        """
+        روی event loop فقط یک کپی سطحی از وضعیت گرفته می‌شود؛ سریال‌سازی و نوشتن فایل در thread انجام می‌شود.
+        اگر اسنپ‌شات قبلی هنوز در حال نوشتن باشد، این یکی به رویداد بعدی موکول می‌شود.
+        """
+        if self._pending is not None and not self._pending.done():
+            return
+        snapshot = {"seq": self.seq}
+        for table in ORDER_TABLES:
+            snapshot[table] = [dict(order) for order in self.state[table].values()]
+
+        # رویدادهای بعدی در فایل ژورنال تازه‌ای نوشته می‌شوند
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._since_snapshot = 0
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_snapshot(snapshot)
+            return
+        self._pending = loop.run_in_executor(None, self._write_snapshot, snapshot)
+        self._pending.add_done_callback(self._snapshot_done)
+
+    def _write_snapshot(self, snapshot: dict):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, default=_encode, separators=(",", ":"))
+        os.replace(tmp_path, self.snapshot_path)
+
+        # رویدادهای تا این شماره در اسنپ‌شات هستند
+        for first_seq, path in self._segments():
+            if first_seq <= snapshot["seq"]:
+                os.remove(path)
+
+    def _snapshot_done(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            # فایل‌های ژورنال حذف نشده‌اند، پس بازیابی از اسنپ‌شات قبلی ممکن است
+            logger.error("writing the book snapshot failed", exc_info=future.exception())
+
+    def _segment_path(self, first_seq: int) -> str:
+        return os.path.join(self.directory, f"journal.{first_seq:012d}.log")
+
+    def _segments(self) -> list[tuple[int, str]]:
+        """
+        فایل‌های ژورنال به ترتیب، به صورت (شماره‌ی اولین رویداد، مسیر).
+        """
+        segments = []
+        for name in os.listdir(self.directory):
+            if name == "journal.log":
+                # قالب قدیمی: یک فایل ژورنال
+                segments.append((0, os.path.join(self.directory, name)))
+            elif name.startswith("journal.") and name.endswith(".log") and name[8:-4].isdigit():
+                segments.append((int(name[8:-4]), os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    async def close(self):
+        if self._pending is not None:
+            try:
+                await self._pending
+            except Exception:
+                # در _snapshot_done ثبت شده است
+                pass
+            self._pending = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # ------------------------------------------------------------
+    def _put(self, table: str, order: dict):
+        order = dict(order)
+        for key in DATE_FIELDS:
+            order[key] = as_datetime(order[key])
+        if remaining_volume(order) > 0:
+            self.state[table][order["id"]] = order
+        else:
+            self.state[table].pop(order["id"], None)
+
+    def _apply(self, event: dict):
+        orders = self.state[event["table"]]
+        kind = event["event"]
+
+        if kind == "load":
+            # بارگذاری مجدد یک قرارداد از دیتابیس: سفارش‌های قبلی آن قرارداد جایگزین می‌شوند
+            expiration_date = as_datetime(event["expiration_date"])
+            for order_id in [i for i, o in orders.items() if o["expiration_date"] == expiration_date]:
+                del orders[order_id]
+            for order in event["orders"]:
+                self._put(event["table"], order)
+        elif kind == "accept":
+            self._put(event["table"], event["order"])
+        elif kind == "fill":
+            for order_id in (event["buyer_id"], event["seller_id"]):
+                order = orders.get(order_id)
+                if order is None:
+                    continue
+                order["volume_filled"] += event["amount"]
+                if remaining_volume(order) <= 0:
+                    del orders[order_id]
+        elif kind == "expire" and "expiration_date" in event:
+            # پایان قرارداد: همه‌ی سفارش‌های آن حذف می‌شوند
+            expiration_date = as_datetime(event["expiration_date"])
+            for order_id in [i for i, o in orders.items() if o["expiration_date"] == expiration_date]:
+                del orders[order_id]
+        elif kind in ("cancel", "expire"):
+            orders.pop(event["order_id"], None)
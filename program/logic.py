@@ -1,36 +1,432 @@
+import asyncio
+import logging
 from datetime import datetime, timedelta, time
 
+import common.config as config
+from common import clock
 from common.database import (
     DataBase,
-    User,
-    Order,
-    AdvanceOrder,
+    StaleFillError,
     Position,
     AdvancePosition,
 )
+from .journal import BookJournal
+from .order_book import SimpleOrderBook, AdvanceOrderBook, as_datetime, remaining_volume
+from .timing_wheel import TimingWheel
 from .utilz import create_message
 
+logger = logging.getLogger(__name__)
+
+
+class ContractShard:
+    """
+    بخشی از موتور مطابقت برای یک قرارداد (expiration_date).
+    هر قرارداد دفترهای سفارش، صف ورودی و تسک asyncio خودش را دارد؛
+    سفارش‌های دو قرارداد هیچ‌وقت با هم مطابقت نمی‌شوند، پس شاردها مستقل و هم‌زمان کار می‌کنند.
+    """
+
+    def __init__(self, logic: "Logic", expiration_date: datetime):
+        self.logic = logic
+        self.expiration_date = expiration_date
+        self.queue = asyncio.Queue()
+        self._task = None
+        self._reconcile_task = None
+        self._reset()
+
+    def _reset(self):
+        self.order_book = SimpleOrderBook()
+        self.advance_book = AdvanceOrderBook()
+        self._loaded = False
+        # سفارش‌هایی (order_table, id) که از شروع هماهنگ‌سازی پس‌زمینه در این شارد تغییر کرده‌اند
+        self._touched = None
+
+    def book(self, order_table: str):
+        return self.order_book if order_table == "orders" else self.advance_book
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def seed(self, order_table: str, orders: list[dict]):
+        """
+        پر کردن دفتر از سفارش‌های بازیابی‌شده از اسنپ‌شات، بدون مراجعه به دیتابیس.
+        """
+        book = self.book(order_table)
+        for order in sorted(orders, key=lambda row: row["id"]):
+            book.add(order)
+            self._track(order_table, order)
+        self._loaded = True
+
+    def reconcile(self):
+        """
+        هماهنگ‌سازی دفتر بازیابی‌شده با دیتابیس در پس‌زمینه، بدون دور ریختن دفتر.
+        خواندن سفارش‌ها بیرون از صف انجام می‌شود تا مطابقت‌ها منتظرش نمانند؛ فقط اعمال تفاوت‌ها از صف عبور می‌کند.
+        """
+        self._touched = set()
+        self._reconcile_task = asyncio.create_task(self._fetch_for_reconcile())
+
+    async def _fetch_for_reconcile(self):
+        try:
+            rows = {
+                order_table: await self.logic.db.fetch_data(order_table, {"expiration_date": self.expiration_date})
+                for order_table in ("orders", "advance_orders")
+            }
+        except Exception:
+            logger.exception("reconciling contract %s with the database failed", self.expiration_date)
+            self._touched = None
+            return
+        self.queue.put_nowait(("reconcile", None, rows, None))
+
+    async def close(self):
+        if self._reconcile_task is not None:
+            self._reconcile_task.cancel()
+            self._reconcile_task = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, order_table: str, order: dict):
+        """
+        سفارش جدید را در صف این قرارداد می‌گذارد و منتظر پیام‌های پوزیشن آن می‌ماند.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(("match", order_table, order, future))
+        return await future
+
+    async def cancel(self, order_table: str, order: dict):
+        """
+        لغو هم از همان صف عبور می‌کند تا ترتیبش با سفارش‌های در انتظار حفظ شود.
+        پس از بازگشت، هیچ مطابقتی دیگر به این سفارش نمی‌رسد.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(("cancel", order_table, order, future))
+        return await future
+
+    def expire(self):
+        # رسیدن expiration_date قرارداد؛ پس از کارهای در صف انجام می‌شود
+        self.queue.put_nowait(("expire", None, None, None))
+
+    def park(self, order_table: str, order_id: int):
+        self.book(order_table).park(order_id)
+
+    async def _run(self):
+        while True:
+            action, order_table, order, future = await self.queue.get()
+            try:
+                if action == "match":
+                    result = await self._match(order_table, order)
+                elif action == "reconcile":
+                    result = self._reconcile(order)
+                elif action == "expire":
+                    result = await self._expire_contract()
+                else:
+                    result = self.book(order_table).remove(order["id"])
+                    self.logic.wheel.cancel(("order", self.expiration_date, order_table, order["id"]))
+                    self._touch(order_table, order["id"])
+                    self._record("cancel", order_table, order_id=order["id"])
+            except Exception as e:
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            else:
+                if future is not None and not future.done():
+                    future.set_result(result)
+
+            if action == "expire" and self.logic.shards.get(self.expiration_date) is not self:
+                # کارهایی که پس از انقضا رسیده‌اند به شارد تازه‌ی همین قرارداد سپرده می‌شوند
+                while not self.queue.empty():
+                    self.logic._shard(self.expiration_date).queue.put_nowait(self.queue.get_nowait())
+                self._task = None
+                return
+
+    def _track(self, order_table: str, order: dict):
+        """
+        زمان‌بندی انتقال سفارش به صف parked در expiration_order_time، یا لغو آن اگر سفارش دیگر در دفتر نیست.
+        """
+        key = ("order", self.expiration_date, order_table, order["id"])
+        if order["id"] in self.book(order_table):
+            self.logic.wheel.schedule(key, order["expiration_order_time"])
+        else:
+            self.logic.wheel.cancel(key)
+
+    def _touch(self, order_table: str, *order_ids: int):
+        if self._touched is not None:
+            self._touched.update((order_table, order_id) for order_id in order_ids)
+
+    def _reconcile(self, rows_by_table: dict[str, list[dict]]) -> int:
+        """
+        اعمال تفاوت دیتابیس با دفتر. سفارش‌هایی که از زمان خواندن دیتابیس در همین شارد
+        تغییر کرده‌اند کنار گذاشته می‌شوند، چون ردیف خوانده‌شده‌ی آن‌ها ممکن است قدیمی باشد.
+        خروجی تعداد سفارش‌های اصلاح‌شده است.
+        """
+        touched, self._touched = self._touched, None
+        if touched is None or not self._loaded:
+            # شارد در این فاصله منقضی یا از نو بارگذاری شده است
+            return 0
+
+        corrected = 0
+        for order_table, rows in rows_by_table.items():
+            book = self.book(order_table)
+            rows = {row["id"]: row for row in rows}
+            for order_id in [i for i in book if (order_table, i) not in touched and i not in rows]:
+                # در دیتابیس نیست (لغو یا پر شده)
+                book.remove(order_id)
+                self.logic.wheel.cancel(("order", self.expiration_date, order_table, order_id))
+                self._record("cancel", order_table, order_id=order_id)
+                corrected += 1
+            for order_id, row in sorted(rows.items()):
+                if (order_table, order_id) in touched:
+                    continue
+                order = book.get(order_id)
+                if order is None:
+                    if remaining_volume(row) <= 0:
+                        continue
+                    book.add(row)
+                    order = row
+                elif order["volume_filled"] != row["volume_filled"]:
+                    # جایگاه سفارش در صف حفظ می‌شود
+                    order["volume_filled"] = row["volume_filled"]
+                    if remaining_volume(order) <= 0:
+                        book.remove(order_id)
+                else:
+                    continue
+                self._track(order_table, order)
+                self._record("accept", order_table, order=order)
+                corrected += 1
+
+        if corrected:
+            logger.warning(
+                "contract %s: %d restored orders differed from the database and were corrected",
+                self.expiration_date, corrected,
+            )
+        return corrected
+
+    async def _expire_contract(self):
+        """
+        پایان قرارداد: همه‌ی سفارش‌های آن یک‌جا از دیتابیس حذف، frozen_pack باقیمانده‌شان
+        آزاد و پیام order-expired در صف قرار می‌گیرد.
+        """
+        db = self.logic.db
+        releases = {}
+        try:
+            for order_table in ("orders", "advance_orders"):
+                book = self.book(order_table)
+                rows = await db.fetch_data(order_table, {"expiration_date": self.expiration_date})
+                for order in rows:
+                    trader_id = book.trader_id(order)
+                    releases[trader_id] = releases.get(trader_id, 0) + max(0, order["order_amount"] - order["volume_filled"])
+                    self.logic.wheel.cancel(("order", self.expiration_date, order_table, order["id"]))
+                if rows:
+                    # زنجیره‌های پاسخ به این سفارش‌ها هم یک‌جا پاک می‌شوند
+                    await db.delete_where_in("reply_chain", "order_message_id", [order["message_id"] for order in rows])
+                    await db.delete_record(order_table, {"expiration_date": self.expiration_date})
+                self._record("expire", order_table, expiration_date=self.expiration_date)
+
+            await db.release_frozen_pack(releases)
+            await db.adjust_open_order_volume({trader_id: -amount for trader_id, amount in releases.items()})
+        except Exception:
+            # دفعه‌ی بعد دوباره تلاش می‌شود
+            self.logic.wheel.schedule(("contract", self.expiration_date), clock.now() + timedelta(minutes=1))
+            raise
+
+        self.logic.shards.pop(self.expiration_date, None)
+        self._reset()
+        if releases:
+            self.logic.notices += create_message(
+                True, "orders expired", "order-expired", {}, command="send-message"
+            )
+
+    async def _load(self):
+        """
+        فقط سفارش‌های همین قرارداد از دیتابیس بارگذاری می‌شوند.
+        """
+        for order_table in ("orders", "advance_orders"):
+            book = self.book(order_table)
+            rows = await self.logic.db.fetch_data(order_table, {"expiration_date": self.expiration_date})
+            self._record("load", order_table, expiration_date=self.expiration_date, orders=rows)
+            for order in sorted(rows, key=lambda row: row["id"]):
+                book.add(order)
+                self._track(order_table, order)
+        self._loaded = True
+
+    def _record(self, event: str, order_table: str, **data):
+        if self.logic.journal is not None:
+            self.logic.journal.record(event, order_table, **data)
+
+    async def _match(self, order_table: str, order: dict):
+        if not self._loaded:
+            await self._load()
+
+        # ممکن است بارگذاری اولیه همین سفارش را هم از دیتابیس خوانده باشد
+        self.book(order_table).remove(order["id"])
+        self._touch(order_table, order["id"])
+        self._record("accept", order_table, order=order)
+
+        positions_msgs = []
+        try:
+            try:
+                await self._fill(order_table, order, positions_msgs)
+            except StaleFillError:
+                # سفارش مقابل در دیتابیس دیگر نیست یا حجم کافی ندارد (مثلاً هم‌زمان لغو شده)؛
+                # دفتر از دیتابیس بارگذاری و باقیمانده‌ی همین سفارش یک بار دیگر مطابقت داده می‌شود
+                self._reset()
+                await self._load()
+                order = self.book(order_table).remove(order["id"])
+                if order is not None:
+                    await self._fill(order_table, order, positions_msgs)
+        except Exception:
+            # دفترها معامله را در حافظه اعمال کرده‌اند؛ دور ریخته می‌شوند تا دوباره از دیتابیس بارگذاری شوند
+            self._reset()
+            raise
+        return positions_msgs
+
+    async def _fill(self, order_table: str, order: dict, positions_msgs: list):
+        if order_table == "orders":
+            create_position = self.logic._create_simple_position
+        else:
+            create_position = self.logic._create_advance_position
+
+        fills = self.book(order_table).match(order)
+        self._track(order_table, order)
+        for buyer_data, seller_data, amount in fills:
+            positions_msgs += await create_position(buyer_data, seller_data, amount)
+            self._touch(order_table, buyer_data["id"], seller_data["id"])
+            self._record(
+                "fill", order_table, buyer_id=buyer_data["id"], seller_id=seller_data["id"], amount=amount
+            )
+            self._track(order_table, buyer_data)
+            self._track(order_table, seller_data)
+
 
 class Logic:
-    def __init__(self, db: DataBase):
+    def __init__(self, db: DataBase, journal: BookJournal | None = None):
         self.db = db
         # در صورتی ‌که نیاز به ذخیره‌سازی‌ موقت داشته باشید:
         self.match_orders_dict = {}
 
-    async def make_position(self):
+        # یک شارد مطابقت برای هر قرارداد (expiration_date)
+        self.shards: dict[datetime, ContractShard] = {}
+        self.journal = journal
+        # پس از بازیابی، ژورنال همه‌ی قراردادها را در بر دارد و شارد تازه از دیتابیس بارگذاری نمی‌شود
+        self._books_restored = False
+        self._reconcile_new_shards = False
+
+        # انقضای سفارش‌ها (expiration_order_time) و قراردادها (expiration_date)
+        self.wheel = TimingWheel(config.EXPIRY_TICK_SECONDS)
+        self._expiry_task = None
+        # پیام‌هایی که با پیام بعدی گروه ارسال می‌شوند
+        self.notices = []
+
+    async def start(self):
+        """
+        بازیابی دفترهای سفارش هنگام راه‌اندازی.
+        اگر اسنپ‌شات وجود داشته باشد، دفترها از اسنپ‌شات و دنباله‌ی ژورنال ساخته می‌شوند و
+        هماهنگ‌سازی با دیتابیس در پس‌زمینه انجام می‌شود؛ وگرنه یک بار کل جدول‌ها خوانده می‌شود.
+        در هر دو حالت اولین سفارش پس از راه‌اندازی منتظر خواندن دیتابیس نمی‌ماند.
+        """
+        if self.journal is None:
+            return
+
+        restored = self.journal.restore()
+        if not restored:
+            self.journal.reset({
+                order_table: await self.db.fetch_data(order_table)
+                for order_table in ("orders", "advance_orders")
+            })
+
+        for order_table in ("orders", "advance_orders"):
+            contracts = {}
+            for order in self.journal.orders(order_table):
+                contracts.setdefault(order["expiration_date"], []).append(order)
+            for expiration_date, orders in contracts.items():
+                self._shard(expiration_date).seed(order_table, orders)
+
+        self._books_restored = True
+        self._reconcile_new_shards = restored
+        if restored:
+            for shard in self.shards.values():
+                shard.reconcile()
+
+    def _shard(self, expiration_date) -> ContractShard:
+        expiration_date = as_datetime(expiration_date)
+        shard = self.shards.get(expiration_date)
+        if shard is None:
+            shard = self.shards[expiration_date] = ContractShard(self, expiration_date)
+            shard.start()
+            if self._books_restored:
+                shard._loaded = True
+                if self._reconcile_new_shards:
+                    shard.reconcile()
+            self.wheel.schedule(("contract", expiration_date), expiration_date)
+            if self._expiry_task is None:
+                self._expiry_task = asyncio.create_task(self._expiry_loop())
+        return shard
+
+    async def _expiry_loop(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            self.expire(clock.now())
+
+    def expire(self, now: datetime):
+        """
+        اجرای تایمرهای سررسیده: سفارش‌هایی که مهلت ثبتشان گذشته parked و
+        قراردادهایی که به expiration_date رسیده‌اند منقضی می‌شوند.
+        """
+        for key in self.wheel.advance(now):
+            shard = self.shards.get(key[1])
+            if shard is None:
+                continue
+            if key[0] == "order":
+                shard.park(key[2], key[3])
+            else:
+                shard.expire()
+
+    def pop_notices(self) -> list:
+        notices, self.notices = self.notices, []
+        return notices
+
+    async def match_order(self, order_table: str, order: dict):
+        """
+        فقط سفارشی را که همین الان ثبت شده به شارد قرارداد خودش می‌فرستد تا با
+        سفارش‌های باقیمانده‌ی همان قرارداد مطابقت داده شود.
+        هزینه‌ی هر پیام به اندازه‌ی دفتر وابسته نیست و خروجی همیشه لیستی از پیام‌هاست.
+        """
+        shard = self._shard(order["expiration_date"])
+        await self.db.adjust_open_order_volume({shard.book(order_table).trader_id(order): remaining_volume(order)})
+        return await shard.submit(order_table, order)
+
+    async def unbook_orders(self, order_table: str, orders: list[dict]):
         """
-        این متد تمام سفارش‌های ساده و پیشرفته را می‌یابد،
-        آن‌ها را با هم مطابقت می‌دهد و پوزیشن‌های جدید ایجاد می‌کند.
+        خارج کردن سفارش‌هایی که قرار است لغو شوند از دفتر شارد مربوطه، پیش از حذف ردیف‌ها و آزادسازی بسته‌ها.
+        پس از بازگشت، سفارش جدیدی با این سفارش‌ها مطابقت داده نمی‌شود.
         """
-        simple_pos_msgs = await self._match_simple_orders()
-        advance_pos_msgs = await self._match_advance_orders()
+        for order in orders:
+            shard = self.shards.get(as_datetime(order["expiration_date"]))
+            if shard is not None:
+                await shard.cancel(order_table, order)
 
-        print(simple_pos_msgs + advance_pos_msgs)
-        print(simple_pos_msgs)
-        print(advance_pos_msgs)
-        result = simple_pos_msgs + advance_pos_msgs
-        # نتیجه به‌صورت لیستی از پیام‌های create_message برگردانده می‌شود
-        return result[0] if len(result) == 1 else result
+    async def cancel_orders(self, order_table: str, orders: list[dict]):
+        """
+        کم کردن حجم باز سفارش‌های لغوشده از trader_exposure.
+        حجم باز همیشه کم می‌شود، حتی اگر شارد قرارداد هنوز ساخته نشده باشد (مثلاً بدون ژورنال).
+        """
+        book = SimpleOrderBook if order_table == "orders" else AdvanceOrderBook
+        deltas = {}
+        for order in orders:
+            trader_id = book.trader_id(order)
+            deltas[trader_id] = deltas.get(trader_id, 0) - max(0, remaining_volume(order))
+        await self.db.adjust_open_order_volume(deltas)
+
+    async def close(self):
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            self._expiry_task = None
+        for shard in self.shards.values():
+            await shard.close()
+        if self.journal is not None:
+            await self.journal.close()
 
     # === توابع پرکردن جای خالی، بقیه منطق‌های معاملاتی ===
     async def update_trade_pack(self, trader_id: int):
@@ -75,7 +471,7 @@ class Logic:
         وگرنه از دیروز 12:30 تا امروز 12:30.
         """
         if now is None:
-            now = datetime.now()
+            now = clock.now()
 
         today = now.date()
         base_time = datetime.combine(today, time.min).replace(hour=12, minute=30)
@@ -90,256 +486,78 @@ class Logic:
         return start_time, end_time
 
     # ------------------------------------------------------------
-    async def _match_simple_orders(self):
-        """
-        مطابق‌سازی سفارش‌های ساده (جدول orders).
-        """
-        all_orders = await self.db.fetch_data("orders")
-        if not all_orders:
-            return create_message(False, "no orders exists", "", {})
-
-        simple_positions_msgs = []
-
-        # هر زوج را بررسی می‌کنیم
-        for i, base_order in enumerate(all_orders):
-            for compared_order in all_orders[i + 1 :]:
-                # بررسی شرایط: کاربر متفاوت، نوع مخالف (خرید/فروش)، قیمت یکسان، انقضا یکسان
-                different_users = base_order["trader_id"] != compared_order["trader_id"]
-                opposite_types = base_order["trade_type"] != compared_order["trade_type"]
-                same_price = base_order["order_price"] == compared_order["order_price"]
-                same_expiration = base_order["expiration_date"] == compared_order["expiration_date"]
-
-                base_remaining = base_order["order_amount"] - base_order["volume_filled"]
-                comp_remaining = compared_order["order_amount"] - compared_order["volume_filled"]
-
-                print(base_order["expiration_order_time"])
-                print(type(base_order["expiration_order_time"]))
-                # کنترل زمان: زمان انقضای ثبت سفارش اولیه باید بعد از تاریخ ثبت سفارش دوم باشد
-                time_valid = (
-                    base_order["expiration_order_time"]
-                    > compared_order["date"]
-                )
-
-
-                if all(
-                    [
-                        different_users,
-                        opposite_types,
-                        same_price,
-                        same_expiration,
-                        base_remaining > 0,
-                        comp_remaining > 0,
-                        time_valid,
-                    ]
-                ):
-                    # تعیین خریدار و فروشنده
-                    if base_order["trade_type"] == 1:
-                        buyer_data, seller_data = base_order, compared_order
-                    else:
-                        buyer_data, seller_data = compared_order, base_order
-
-                    # ایجاد پوزیشن جدید
-                    position = Position(
-                        self.db,
-                        seller_id=seller_data["trader_id"],
-                        buyer_id=buyer_data["trader_id"],
-                        open_price=buyer_data["order_price"],
-                        position_amount=min(
-                            buyer_data["order_amount"] - buyer_data["volume_filled"],
-                            seller_data["order_amount"] - seller_data["volume_filled"],
-                        ),
-                        expiration_date=buyer_data["expiration_date"],
-                    )
-                    created_position = await position.add_record()
-
-                    # به‌روزرسانی سفارش‌ها (volume_filled)
-                    await self._update_orders_simple_position(buyer_data, seller_data, created_position["position_amount"])
-
-                    # به‌روزرسانی frozen_pack برای خریدار و فروشنده
-                    await self._update_trader_frozen_pack_after_make_position(seller_data["trader_id"])
-                    await self._update_trader_frozen_pack_after_make_position(buyer_data["trader_id"])
-
-                    # دریافت نام‌ها و ارسال پیام نهایی
-                    seller_name = await User(self.db).get_name(created_position["seller_id"])
-                    buyer_name = await User(self.db).get_name(created_position["buyer_id"])
-                    additional_data = {
-                        "{seller_name}": seller_name,
-                        "{buyer_name}": buyer_name,
-                        "{position_amount}": created_position["position_amount"],
-                        "{open_price}": created_position["open_price"],
-                        "{date}": created_position["date"],
-                        "{expiration_date}": created_position["expiration_date"],
-                    }
-                    pos_message = create_message(
-                        True,
-                        "position had been created",
-                        "simple-position-created",
-                        additional_data,
-                        command="send-message",
-                    )
-                    simple_positions_msgs += pos_message
-
-        return simple_positions_msgs
-
-    # ------------------------------------------------------------
-    async def _match_advance_orders(self):
-        """
-        مطابق‌سازی سفارش‌های پیشرفته (جدول advance_orders).
-        """
-        all_adv_orders = await self.db.fetch_data("advance_orders")
-        if not all_adv_orders:
-            return create_message(False, "no orders exists", "", {}, command="nothing")
-
-        advance_positions_msgs = []
-
-        for i, base_order in enumerate(all_adv_orders):
-            for compared_order in all_adv_orders[i + 1 :]:
-                # بررسی شرایط: زوجِ خریدار/فروشنده (یکی seller_id و دیگری buyer_id)، قیمت باز و قیمت بسته‌ شدن یکسان، انقضا یکسان
-                match_traders = (
-                    (base_order["seller_id"] is not None and compared_order["buyer_id"] is not None)
-                    or (base_order["buyer_id"] is not None and compared_order["seller_id"] is not None)
-                )
-                different_traders = (
-                    base_order["seller_id"] != compared_order["buyer_id"]
-                    or base_order["buyer_id"] != compared_order["seller_id"]
-                )
-                same_open_price = base_order["open_price"] == compared_order["open_price"]
-                same_close_price = base_order["close_price"] == compared_order["close_price"]
-                same_expiration = base_order["expiration_date"] == compared_order["expiration_date"]
-
-                base_remaining = base_order["order_amount"] - base_order["volume_filled"]
-                comp_remaining = compared_order["order_amount"] - compared_order["volume_filled"]
-
-                time_valid = (
-                    base_order["expiration_order_time"]
-                    > compared_order["date"]
-                )
-
-                if all(
-                    [
-                        match_traders,
-                        different_traders,
-                        same_open_price,
-                        same_close_price,
-                        same_expiration,
-                        base_remaining > 0,
-                        comp_remaining > 0,
-                        time_valid,
-                    ]
-                ):
-                    # تعیین خریدار و فروشنده
-                    if base_order["buyer_id"] is not None:
-                        buyer_data, seller_data = base_order, compared_order
-                    else:
-                        buyer_data, seller_data = compared_order, base_order
-
-                    # ایجاد پوزیشن جدید
-                    advance_position = AdvancePosition(
-                        self.db,
-                        seller_id=seller_data["seller_id"],
-                        buyer_id=buyer_data["buyer_id"],
-                        open_price=buyer_data["open_price"],
-                        close_price=seller_data["close_price"],
-                        position_amount=min(
-                            buyer_data["order_amount"] - buyer_data["volume_filled"],
-                            seller_data["order_amount"] - seller_data["volume_filled"],
-                        ),
-                        expiration_date=buyer_data["expiration_date"],
-                    )
-                    created_position = await advance_position.add_record()
-
-                    # به‌روزرسانی سفارش‌ها (volume_filled)
-                    await self._update_orders_advance_position(buyer_data, seller_data, created_position["position_amount"])
-
-                    # به‌روزرسانی frozen_pack برای خریدار و فروشنده
-                    await self._update_trader_frozen_pack_after_make_position(seller_data["seller_id"])
-                    await self._update_trader_frozen_pack_after_make_position(buyer_data["buyer_id"])
-
-                    # دریافت نام‌ها و ارسال پیام نهایی
-                    seller_name = await User(self.db).get_name(created_position["seller_id"])
-                    buyer_name = await User(self.db).get_name(created_position["buyer_id"])
-                    additional_data = {
-                        "{seller_name}": seller_name,
-                        "{buyer_name}": buyer_name,
-                        "{position_amount}": created_position["position_amount"],
-                        "{open_price}": created_position["open_price"],
-                        "{close_price}": created_position["close_price"],
-                        "{date}": created_position["date"],
-                        "{expiration_date}": created_position["expiration_date"],
-                    }
-                    pos_message = create_message(
-                        True,
-                        "position had been created",
-                        "advance-position-created",
-                        additional_data,
-                        command="send-message",
-                    )
-                    advance_positions_msgs+=pos_message
-
-        return advance_positions_msgs
-
-    # ------------------------------------------------------------
-    async def _update_orders_simple_position(self, buyer, seller, position_amount: int):
+    async def _create_simple_position(self, buyer_data, seller_data, position_amount: int):
         """
-        وقتی پوزیشن برای سفارش‌های ساده ساخته می‌شود،
-        مقدار volume_filled را در هر دو سفارش (خریدار و فروشنده) به‌روز کنید.
+        ساخت پوزیشن برای یک جفت سفارش ساده‌ی مطابق‌شده و برگرداندن پیام آن.
         """
-        new_buyer_filled = buyer["volume_filled"] + position_amount
-        new_seller_filled = seller["volume_filled"] + position_amount
-
-        # به‌روزرسانی ردیف خریدار
-        buyer_order = Order(
+        position = Position(
             self.db,
-            volume_filled=new_buyer_filled,
+            seller_id=seller_data["trader_id"],
+            buyer_id=buyer_data["trader_id"],
+            open_price=buyer_data["order_price"],
+            position_amount=position_amount,
+            expiration_date=buyer_data["expiration_date"],
         )
-        await buyer_order.update_record({"id": buyer["id"]})
-
-        # به‌روزرسانی ردیف فروشنده
-        seller_order = Order(
-            self.db,
-            volume_filled=new_seller_filled,
+        # ثبت پوزیشن، volume_filled هر دو سفارش و frozen_pack هر دو معامله‌گر در یک تراکنش
+        created_position, names = await self._commit_fill("positions", position, "orders", buyer_data, seller_data)
+
+        additional_data = {
+            "{seller_name}": names.get(created_position["seller_id"]),
+            "{buyer_name}": names.get(created_position["buyer_id"]),
+            "{position_amount}": created_position["position_amount"],
+            "{open_price}": created_position["open_price"],
+            "{date}": created_position["date"],
+            "{expiration_date}": created_position["expiration_date"],
+        }
+        return create_message(
+            True,
+            "position had been created",
+            "simple-position-created",
+            additional_data,
+            command="send-message",
         )
-        await seller_order.update_record({"id": seller["id"]})
 
     # ------------------------------------------------------------
-    async def _update_orders_advance_position(self, buyer, seller, position_amount: int):
+    async def _create_advance_position(self, buyer_data, seller_data, position_amount: int):
         """
-        وقتی پوزیشن برای سفارش‌های پیشرفته ساخته می‌شود،
-        مقدار volume_filled را در هر دو سفارش (خریدار و فروشنده) به‌روز کنید.
+        ساخت پوزیشن برای یک جفت سفارش پیشرفته‌ی مطابق‌شده و برگرداندن پیام آن.
         """
-        new_buyer_filled = buyer["volume_filled"] + position_amount
-        new_seller_filled = seller["volume_filled"] + position_amount
-
-        buyer_order = AdvanceOrder(
+        advance_position = AdvancePosition(
             self.db,
-            volume_filled=new_buyer_filled,
+            seller_id=seller_data["seller_id"],
+            buyer_id=buyer_data["buyer_id"],
+            open_price=buyer_data["open_price"],
+            close_price=seller_data["close_price"],
+            position_amount=position_amount,
+            expiration_date=buyer_data["expiration_date"],
+        )
+        # ثبت پوزیشن، volume_filled هر دو سفارش و frozen_pack هر دو معامله‌گر در یک تراکنش
+        created_position, names = await self._commit_fill(
+            "advance_positions", advance_position, "advance_orders", buyer_data, seller_data
         )
-        await buyer_order.update_record({"id": buyer["id"]})
 
-        seller_order = AdvanceOrder(
-            self.db,
-            volume_filled=new_seller_filled,
+        additional_data = {
+            "{seller_name}": names.get(created_position["seller_id"]),
+            "{buyer_name}": names.get(created_position["buyer_id"]),
+            "{position_amount}": created_position["position_amount"],
+            "{open_price}": created_position["open_price"],
+            "{close_price}": created_position["close_price"],
+            "{date}": created_position["date"],
+            "{expiration_date}": created_position["expiration_date"],
+        }
+        return create_message(
+            True,
+            "position had been created",
+            "advance-position-created",
+            additional_data,
+            command="send-message",
         )
-        await seller_order.update_record({"id": seller["id"]})
 
     # ------------------------------------------------------------
-    async def _update_trader_frozen_pack_after_make_position(self, trader_id: int):
+    async def _commit_fill(self, position_table, position, order_table, buyer_data, seller_data):
         """
-        بعد از ایجاد یک پوزیشن (چه ساده چه پیشرفته)،
-        frozen_pack را بر اساس مجموع position_amountهای باز برای آن کاربر کاهش دهید.
+        ثبت اتمیک یک معامله در دیتابیس.
         """
-        # اول، همه پوزیشن‌های فروشی و خریدی که کاربر در آن نقش دارد را بگیرید
-        sell_positions = await Position(self.db).fetch_data({"seller_id": trader_id})
-        buy_positions = await Position(self.db).fetch_data({"buyer_id": trader_id})
-
-        total_sell = sum(pos["position_amount"] for pos in sell_positions) if sell_positions else 0
-        total_buy = sum(pos["position_amount"] for pos in buy_positions) if buy_positions else 0
-
-        reduction_pack = min(total_sell, total_buy)
-
-        trader = User(self.db)
-        trader_info = (await trader.fetch_data({"trader_id": trader_id}))[0]
-        new_frozen = max(0, trader_info["frozen_pack"] - reduction_pack)
-
-        trader.frozen_pack = new_frozen
-        await trader.update_record({"trader_id": trader_id})
+        return await self.db.commit_fill(
+            position_table, position, order_table, buyer_data["id"], seller_data["id"]
+        )
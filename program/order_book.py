@@ -0,0 +1,260 @@
+from collections import deque
+from itertools import chain
+from datetime import datetime
+
+import common.config as config
+
+
+def as_datetime(value):
+    """
+    مقادیر تاریخ ممکن است از دیتابیس به صورت datetime و از مدل‌ها به صورت رشته ISO بیایند.
+    """
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def remaining_volume(order: dict) -> int:
+    return order["order_amount"] - order["volume_filled"]
+
+
+class _Group:
+    """
+    سفارش‌های قابل‌مطابقت با هم. کلید True صف خرید و کلید False صف فروش است.
+    سفارش‌هایی که مهلت ثبتشان (expiration_order_time) گذشته به صف parked منتقل می‌شوند
+    تا سفارش‌های تازه دیگر از رویشان عبور نکنند؛ فقط پاسخ‌هایی که تاریخ سفارش قدیمی را
+    دارند (مسیر reply_chain) هنوز می‌توانند با آن‌ها مطابقت شوند.
+    """
+
+    __slots__ = ("live", "parked")
+
+    def __init__(self):
+        self.live = {True: deque(), False: deque()}
+        self.parked = {True: deque(), False: deque()}
+
+
+class _FifoOrderBook:
+    """
+    منطق مشترک دفترهای سفارش: هر گروه از سفارش‌های قابل‌مطابقت دو صف FIFO دارد.
+    زیرکلاس‌ها تعیین می‌کنند گروه هر سفارش کجا نگه‌داری شود.
+    """
+
+    def __init__(self):
+        self._orders = {}
+        # بیشترین expiration_order_time میان سفارش‌های parked
+        self._park_horizon = None
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, order_id):
+        return order_id in self._orders
+
+    def __iter__(self):
+        return iter(self._orders)
+
+    def get(self, order_id: int) -> dict | None:
+        return self._orders.get(order_id)
+
+    def _group(self, order: dict, create: bool) -> _Group | None:
+        raise NotImplementedError
+
+    @staticmethod
+    def _is_buy(order: dict) -> bool:
+        raise NotImplementedError
+
+    @staticmethod
+    def trader_id(order: dict) -> int:
+        raise NotImplementedError
+
+    @staticmethod
+    def _normalize(order: dict):
+        for key in ("date", "expiration_order_time", "expiration_date"):
+            order[key] = as_datetime(order[key])
+
+    def add(self, order: dict):
+        """
+        سفارش را بدون مطابقت‌دادن در دفتر قرار می‌دهد.
+        """
+        self._normalize(order)
+        if remaining_volume(order) <= 0 or order["id"] in self._orders:
+            return
+        self._group(order, create=True).live[self._is_buy(order)].append(order)
+        self._orders[order["id"]] = order
+
+    def remove(self, order_id: int) -> dict | None:
+        order = self._orders.pop(order_id, None)
+        if order is None:
+            return None
+        group = self._group(order, create=False)
+        if group is not None:
+            side = self._is_buy(order)
+            for queue in (group.live[side], group.parked[side]):
+                try:
+                    queue.remove(order)
+                    break
+                except ValueError:
+                    pass
+        return order
+
+    def park(self, order_id: int):
+        """
+        انتقال سفارشی که مهلت ثبتش گذشته از صف فعال به صف parked.
+        سفارش‌ها تقریباً به ترتیب زمان منقضی می‌شوند، پس معمولاً سر صف هستند و این کار O(1) است.
+        """
+        order = self._orders.get(order_id)
+        if order is None:
+            return
+        group = self._group(order, create=False)
+        side = self._is_buy(order)
+        live = group.live[side]
+        if live and live[0] is order:
+            live.popleft()
+        else:
+            try:
+                live.remove(order)
+            except ValueError:
+                return
+        group.parked[side].append(order)
+        if self._park_horizon is None or order["expiration_order_time"] > self._park_horizon:
+            self._park_horizon = order["expiration_order_time"]
+
+    def match(self, order: dict) -> list[tuple[dict, dict, int]]:
+        """
+        سفارش جدید را با صف مخالفِ گروه خودش مطابقت می‌دهد.
+        volume_filled هر دو سفارش در حافظه به‌روز می‌شود و باقیمانده‌ی سفارش جدید در دفتر می‌ماند.
+        خروجی لیستی از (خریدار، فروشنده، حجم) است.
+        """
+        self._normalize(order)
+        fills = []
+        remaining = remaining_volume(order)
+        if remaining <= 0:
+            return fills
+
+        is_buy = self._is_buy(order)
+        trader_id = self.trader_id(order)
+        group = self._group(order, create=True)
+        live, parked = group.live[not is_buy], group.parked[not is_buy]
+
+        candidates = live
+        if parked and order["date"] < self._park_horizon:
+            # سفارش‌های parked قدیمی‌ترند، پس در ترتیب FIFO جلوتر می‌آیند
+            candidates = chain(parked, live)
+
+        exhausted = 0
+        for resting in candidates:
+            if remaining <= 0:
+                break
+            # همان شروط حلقه‌ی قبلی: کاربر متفاوت و زمان ثبت معتبر
+            if self.trader_id(resting) == trader_id:
+                continue
+            if resting["expiration_order_time"] <= order["date"]:
+                continue
+
+            amount = min(remaining, remaining_volume(resting))
+            resting["volume_filled"] += amount
+            order["volume_filled"] += amount
+            remaining -= amount
+
+            buyer, seller = (order, resting) if is_buy else (resting, order)
+            fills.append((buyer, seller, amount))
+            if remaining_volume(resting) <= 0:
+                self._orders.pop(resting["id"], None)
+                exhausted += 1
+
+        while exhausted and live and remaining_volume(live[0]) <= 0:
+            live.popleft()
+            exhausted -= 1
+        if exhausted:
+            group.live[not is_buy] = deque(o for o in live if remaining_volume(o) > 0)
+            group.parked[not is_buy] = deque(o for o in parked if remaining_volume(o) > 0)
+
+        if remaining > 0:
+            group.live[is_buy].append(order)
+            self._orders[order["id"]] = order
+        return fills
+
+
+class SimpleOrderBook(_FifoOrderBook):
+    """
+    دفتر سفارش سفارش‌های ساده (جدول orders).
+    سطوح قیمت در یک آرایه نگه‌داری می‌شوند که اندیس آن فاصله‌ی قیمت از کف بازه است
+    (PRICE_LOWER_BOUND تا PRICE_UPPER_BOUND). هر سطح برای هر expiration_date
+    دو صف FIFO خرید و فروش دارد.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._base = None
+        self._levels = []
+
+    @staticmethod
+    def _is_buy(order: dict) -> bool:
+        return bool(order["trade_type"])
+
+    @staticmethod
+    def trader_id(order: dict) -> int:
+        return order["trader_id"]
+
+    def _level(self, price: int, create: bool):
+        if self._base is None:
+            if not create:
+                return None
+            lower = config.PRICE_LOWER_BOUND or price
+            upper = config.PRICE_UPPER_BOUND or price
+            self._base = min(lower, price)
+            self._levels = [None] * (max(upper, price) - self._base + 1)
+
+        offset = price - self._base
+        if offset < 0:
+            if not create:
+                return None
+            # بازه‌ی قیمت روز جابه‌جا شده؛ آرایه را از پایین گسترش می‌دهیم
+            self._levels[:0] = [None] * -offset
+            self._base = price
+            offset = 0
+        elif offset >= len(self._levels):
+            if not create:
+                return None
+            self._levels.extend([None] * (offset - len(self._levels) + 1))
+
+        level = self._levels[offset]
+        if level is None and create:
+            level = self._levels[offset] = {}
+        return level
+
+    def _group(self, order: dict, create: bool) -> _Group | None:
+        level = self._level(order["order_price"], create)
+        if level is None:
+            return None
+        group = level.get(order["expiration_date"])
+        if group is None and create:
+            group = level[order["expiration_date"]] = _Group()
+        return group
+
+
+class AdvanceOrderBook(_FifoOrderBook):
+    """
+    دفتر سفارش سفارش‌های پیشرفته (جدول advance_orders).
+    سفارش‌ها با کلید (open_price, close_price, expiration_date) در یک dict نگه‌داری می‌شوند،
+    پس طرف‌های مقابل هر سفارش با یک جست‌وجو پیدا می‌شوند.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._index = {}
+
+    @staticmethod
+    def _is_buy(order: dict) -> bool:
+        return order["buyer_id"] is not None
+
+    @staticmethod
+    def trader_id(order: dict) -> int:
+        return order["buyer_id"] if order["buyer_id"] is not None else order["seller_id"]
+
+    def _group(self, order: dict, create: bool) -> _Group | None:
+        key = (order["open_price"], order["close_price"], order["expiration_date"])
+        group = self._index.get(key)
+        if group is None and create:
+            group = self._index[key] = _Group()
+        return group
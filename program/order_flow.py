@@ -0,0 +1,55 @@
+import json
+from datetime import datetime
+
+from common import clock
+
+
+class OrderFlowRecorder:
+    """
+    ثبت پیام‌های سفارش گروه برای بازپخش آفلاین.
+    هر پیام یک خط JSON فشرده است:
+    {"t": زمان, "id": message_id, "u": فرستنده, "x": متن, "r": {"id", "u", "x"} یا null}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, update):
+        message = update.effective_message
+        replied = message.reply_to_message
+        entry = {
+            "t": clock.now().isoformat(),
+            "id": message.message_id,
+            "u": update.effective_user.id,
+            "x": message.text,
+            "r": None,
+        }
+        if replied is not None:
+            entry["r"] = {
+                "id": replied.message_id,
+                "u": replied.from_user.id if replied.from_user else None,
+                "x": replied.text,
+            }
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def read_order_flow(path: str) -> list[dict]:
+    """
+    خواندن فایل ثبت‌شده؛ خط ناقص انتهای فایل (قطع ناگهانی) نادیده گرفته می‌شود.
+    """
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            entry["t"] = datetime.fromisoformat(entry["t"])
+            entries.append(entry)
+    return entries
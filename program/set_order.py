@@ -1,17 +1,23 @@
 import math
 import re
-from datetime import datetime, time
+from datetime import time
 
 from telegram import Update
 import common.config as config
+from common import clock
 from common.database import DataBase, User, Order, AdvanceOrder, ReplyChain
 from common.utilz import convert_numbers
 from .utilz import create_message
 
 
 class SetOrder:
-    def __init__(self, db: DataBase):
+    def __init__(self, db: DataBase, unbook=None):
+        """
+        unbook: تابع async (order_table, orders) که سفارش‌ها را پیش از حذف از دیتابیس از دفتر سفارش خارج می‌کند،
+        تا هیچ مطابقتی به سفارشِ لغوشده نرسد.
+        """
         self.db = db
+        self.unbook = unbook
 
     async def set_order(self, update: Update):
         text = convert_numbers(update.message.text.strip())
@@ -57,6 +63,13 @@ class SetOrder:
         ):
             return create_message(False, "order_not_found", "", {}, command="delete-message")
 
+        # ابتدا سفارش از دفتر خارج می‌شود و ردیف دوباره خوانده می‌شود تا volume_filled پرشدن‌های در راه را هم داشته باشد
+        if self.unbook is not None:
+            await self.unbook(order_table, [order])
+            order = await self.db.get_order_by_message_id(order_table, message_id)
+            if not order:
+                return create_message(False, "order_not_found", "", {}, command="delete-message")
+
         # حذف سفارش
         await self.db.delete_record(order_table, {"message_id": message_id})
 
@@ -64,54 +77,63 @@ class SetOrder:
         await self.db.delete_record("reply_chain", {"order_message_id": message_id})
 
         # آزادسازی بسته‌ی فریز شده
-        user = User(self.db)
-        user_data = (await user.fetch_data({"trader_id": trader_id}))[0]
-
         order_amount = order.get("order_amount", 0)
         volume_filled = order.get("volume_filled", 0)
         frozen_release = order_amount - volume_filled
+        self.db.packs.release(trader_id, frozen_release)
 
-        user.frozen_pack = max(0, user_data["frozen_pack"] - frozen_release)
-        await user.update_record({"trader_id": trader_id})
-
-        name = await user.get_name(trader_id)
-        return create_message(True, "order deleted", key="delete-order", additional_data={"{name}": name}, command="reply-message")
+        name = await User(self.db).get_name(trader_id)
+        additional_data = {"{name}": name, "cancelled_orders": {order_table: [order]}}
+        return create_message(True, "order deleted", key="delete-order", additional_data=additional_data, command="reply-message")
 
     # ------------------------------------------------------------
     async def _cancel_all_orders(self, update: Update):
         trader_id = update.message.from_user.id
         total_frozen_release = 0
 
-        # سفارش‌های معمولی
-        normal_orders = await self.db.fetch_data("orders", {"trader_id": trader_id})
+        normal_orders, advanced_orders = await self._trader_orders(trader_id)
+        if self.unbook is not None:
+            # ابتدا سفارش‌ها از دفتر خارج می‌شوند و دوباره خوانده می‌شوند تا پرشدن‌های در راه هم حساب شوند
+            await self.unbook("orders", normal_orders)
+            await self.unbook("advance_orders", advanced_orders)
+            # سفارشی که در این فاصله ثبت شده از دفتر خارج نشده و لغو نمی‌شود
+            unbooked = {("orders", o["id"]) for o in normal_orders} | {("advance_orders", o["id"]) for o in advanced_orders}
+            normal_orders, advanced_orders = await self._trader_orders(trader_id)
+            normal_orders = [o for o in normal_orders if ("orders", o["id"]) in unbooked]
+            advanced_orders = [o for o in advanced_orders if ("advance_orders", o["id"]) in unbooked]
+
         for order in normal_orders:
             frozen_release = max(0, order["order_amount"] - order["volume_filled"])
             total_frozen_release += frozen_release
-            await self.db.delete_record("orders", {"message_id": order["message_id"]})
 
-        # سفارش‌های پیشرفته (advance_orders)
-        adv_buy = await self.db.fetch_data("advance_orders", {"buyer_id": trader_id})
-        adv_sell = await self.db.fetch_data("advance_orders", {"seller_id": trader_id})
-        advanced_orders = adv_buy + adv_sell
         for order in advanced_orders:
-            if order.get("seller_id") == trader_id or order.get("buyer_id") == trader_id:
-                frozen_release = max(0, order["order_amount"] - order["volume_filled"])
-                total_frozen_release += frozen_release
-                await self.db.delete_record("advance_orders", {"message_id": order["message_id"]})
+            frozen_release = max(0, order["order_amount"] - order["volume_filled"])
+            total_frozen_release += frozen_release
+
+        # حذف همه‌ی سفارش‌ها با یک پرس‌وجو برای هر جدول
+        await self.db.delete_where_in("orders", "id", [order["id"] for order in normal_orders])
+        await self.db.delete_where_in("advance_orders", "id", [order["id"] for order in advanced_orders])
 
         # حذف ReplyChain کاربر
         reply_chain = ReplyChain(self.db)
         await reply_chain.delete_record({"trader_id": trader_id})
 
         # آزادسازی بسته‌ها
-        if total_frozen_release > 0:
-            user = User(self.db)
-            user_data = (await user.fetch_data({"trader_id": trader_id}))[0]
-            user.frozen_pack = max(0, user_data["frozen_pack"] - total_frozen_release)
-            await user.update_record({"trader_id": trader_id})
+        self.db.packs.release(trader_id, total_frozen_release)
 
         name = await User(self.db).get_name(trader_id)
-        return create_message(True, "all orders cancelled", "delete-orders", {"{name}": name}, command="reply-message")
+        additional_data = {
+            "{name}": name,
+            "cancelled_orders": {"orders": normal_orders, "advance_orders": advanced_orders},
+        }
+        return create_message(True, "all orders cancelled", "delete-orders", additional_data, command="reply-message")
+
+    async def _trader_orders(self, trader_id: int):
+        # سفارش‌های معمولی و سفارش‌های پیشرفته (advance_orders) کاربر
+        normal_orders = await self.db.fetch_data("orders", {"trader_id": trader_id})
+        adv_buy = await self.db.fetch_data("advance_orders", {"buyer_id": trader_id})
+        adv_sell = await self.db.fetch_data("advance_orders", {"seller_id": trader_id})
+        return normal_orders, adv_buy + adv_sell
 
     # ------------------------------------------------------------
     async def _b_order(self, b_order, update: Update, replied_message):
@@ -144,6 +166,10 @@ class SetOrder:
         elif re.search(r"^(\d+)\s*(خف|فف|خ|ف)\s*(\d+)?$", convert_numbers(replied_message.text)):
             order_table = "orders"
 
+        # پیام ریپلای‌شده سفارش نیست؛ جدولی برای جستجو وجود ندارد
+        if order_table is None:
+            return create_message(False, "order_cancelled", "order-cancelled", {}, command="reply-message")
+
         # پیدا کردن سفارش اصلی
         original_order = await self.db.get_order_by_message_id(order_table, order_id)
         if original_order:
@@ -163,7 +189,7 @@ class SetOrder:
                 if update.message.from_user.id != original_trader_id:
                     return create_message(False, "another trader reply b with melodious activity", "", {}, command="delete-message")
 
-            current_time = datetime.now()
+            current_time = clock.now()
             expiration_time = original_order["expiration_order_time"]
             if current_time > expiration_time and check_expiration:
                 reply_chain = ReplyChain(self.db,
@@ -209,7 +235,7 @@ class SetOrder:
                     expiration_date=original_order["expiration_date"],
                     date=original_order["date"]
                 )
-                await adv.add_record()
+                created_order = await adv.add_record()
             else:  # orders
                 ord_obj = Order(
                     self.db,
@@ -222,13 +248,13 @@ class SetOrder:
                     volume_filled=0,
                     date=original_order["date"],
                 )
-                await ord_obj.add_record()
+                created_order = await ord_obj.add_record()
 
             # اگر سوابق reply_chain وجود داشت، پاکش کن
             if 'reply_chain' in locals():  # در واقع اگر تعریف شده بود
                 await reply_chain.delete_record({"message_id": replied_message.message_id})
 
-            return create_message(True, "success")
+            return create_message(True, "success", additional_data={"order_table": order_table, "order": created_order})
 
         return create_message(False, "order_cancelled", "order-cancelled", {}, command="reply-message")
 
@@ -284,8 +310,8 @@ class SetOrder:
             order_amount=order_amount,
             volume_filled=0
         )
-        await adv_order.add_record()
-        return create_message(True, "success")
+        created_order = await adv_order.add_record()
+        return create_message(True, "success", additional_data={"order_table": "advance_orders", "order": created_order})
 
     # ------------------------------------------------------------
     async def _simple_order(self, simple_order_match, update: Update):
@@ -309,7 +335,7 @@ class SetOrder:
 
         # اعتبارسنجی زمان برای خف/فف
         if type_char in ("خف", "فف"):
-            now = datetime.now().time()
+            now = clock.now().time()
             start = time(11, 30)
             end = time(12, 30)
             tomorrow_contract = start <= now < end
@@ -341,17 +367,13 @@ class SetOrder:
             order_amount=order_amount,
             volume_filled=0
         )
-        await order.add_record()
-        return create_message(True, "success")
+        created_order = await order.add_record()
+        return create_message(True, "success", additional_data={"order_table": "orders", "order": created_order})
 
     # ------------------------------------------------------------
     async def _check_and_increment_order_amount(self, trader_id, amount):
-        trader = User(self.db)
-        trader_data = (await trader.fetch_data({"trader_id": trader_id}))[0]
-        available_pack = trader_data["trade_pack"] - trader_data["frozen_pack"]
-        if available_pack >= amount:
-            trader.frozen_pack = trader_data["frozen_pack"] + amount
-            await trader.update_record({"trader_id": trader_id})
+        # بررسی و رزرو در دفتر بسته‌ها (در حافظه و با قفل هر معامله‌گر)؛ سفارش فقط پس از تایید به‌روزرسانی شرطی دیتابیس پذیرفته می‌شود
+        if await self.db.packs.reserve(trader_id, amount):
             return True, "success"
         return False, "pack_issue"
 
@@ -362,12 +384,7 @@ class SetOrder:
         if buyer_id:
             loss *= 2
 
-        trader = User(self.db)
-        trader_info = (await trader.fetch_data({"trader_id": trader_id}))[0]
-        available_pack = trader_info["trade_pack"] - trader_info["frozen_pack"]
         frozen_pack = math.ceil(loss / config.PACK_EXCHANGE_RATE)
-        if available_pack >= frozen_pack:
-            trader.frozen_pack = trader_info["frozen_pack"] + frozen_pack
-            await trader.update_record({"trader_id": trader_id})
+        if await self.db.packs.reserve(trader_id, frozen_pack):
             return True, "success"
         return False, "pack_issue"
@@ -0,0 +1,65 @@
+import math
+from datetime import datetime
+
+from common import clock
+from .order_book import as_datetime
+
+
+class TimingWheel:
+    """
+    چرخ زمان‌بندی درهم‌سازی‌شده (hashed timing wheel).
+    هر تایمر در خانه‌ی (tick مهلت % slots) قرار می‌گیرد؛ زمان‌بندی و لغو O(1) است و
+    advance فقط خانه‌هایی را که از آخرین فراخوانی گذشته‌اند بررسی می‌کند.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512, now: datetime | None = None):
+        self.tick = tick
+        self.slots = slots
+        self._buckets = [{} for _ in range(slots)]
+        self._where = {}
+        self._current = math.floor((now or clock.now()).timestamp() / tick) - 1
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def schedule(self, key, when):
+        """
+        ثبت (یا جابه‌جایی) تایمر key برای زمان when.
+        تایمرهایی که زمانشان گذشته در advance بعدی اجرا می‌شوند.
+        """
+        self.cancel(key)
+        deadline = math.ceil(as_datetime(when).timestamp() / self.tick)
+        deadline = max(deadline, self._current + 1)
+        index = deadline % self.slots
+        self._buckets[index][key] = deadline
+        self._where[key] = index
+
+    def cancel(self, key):
+        index = self._where.pop(key, None)
+        if index is not None:
+            self._buckets[index].pop(key, None)
+
+    def advance(self, now: datetime) -> list:
+        """
+        جلو بردن چرخ تا زمان now و برگرداندن کلید تایمرهای منقضی‌شده.
+        """
+        target = math.floor(now.timestamp() / self.tick)
+        expired = []
+        if target <= self._current:
+            return expired
+
+        # اگر بیش از یک دور عقب باشیم، هر خانه فقط یک بار بررسی می‌شود
+        steps = min(target - self._current, self.slots)
+        for tick in range(self._current + 1, self._current + steps + 1):
+            bucket = self._buckets[tick % self.slots]
+            due = [key for key, deadline in bucket.items() if deadline <= target]
+            for key in due:
+                del bucket[key]
+                del self._where[key]
+            expired += due
+
+        self._current = target
+        return expired